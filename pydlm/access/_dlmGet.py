@@ -7,7 +7,7 @@ The code for all get methods
 
 """
 
-from numpy import dot
+from numpy import dot, einsum
 from pydlm.core._dlm import _dlm
 
 
@@ -35,20 +35,20 @@ class _dlmGet(_dlm):
             end: the end date to be returned.
 
         Returns:
-            A list of latent states.
+            An array of latent states, one (d x 1) state per date.
         """
         end += 1
         indx = self.builder.componentIndex[name]
-        patten = lambda x: x if x is None else x[indx[0] : (indx[1] + 1), 0:1]
 
         if filterType == "forwardFilter":
-            return list(map(patten, self.result.filteredState[start:end]))
+            states = self.result.filteredState
         elif filterType == "backwardSmoother":
-            return list(map(patten, self.result.smoothedState[start:end]))
+            states = self.result.smoothedState
         elif filterType == "predict":
-            return list(map(patten, self.result.predictedState[start:end]))
+            states = self.result.predictedState
         else:
             raise NameError("Incorrect filter type")
+        return states[start:end, indx[0] : (indx[1] + 1), 0:1]
 
     # function to get the corresponding latent covariance
     def _getLatentCov(self, name, filterType, start, end):
@@ -63,24 +63,26 @@ class _dlmGet(_dlm):
             end: the end date to be returned.
 
         Returns:
-            A list of latent covariance.
+            An array of latent covariance, one (d x d) matrix per date.
         """
         end += 1
         indx = self.builder.componentIndex[name]
-        patten = (
-            lambda x: x
-            if x is None
-            else x[indx[0] : (indx[1] + 1), indx[0] : (indx[1] + 1)]
-        )
 
         if filterType == "forwardFilter":
-            return list(map(patten, self.result.filteredCov[start:end]))
+            covs = self.result.filteredCov
         elif filterType == "backwardSmoother":
-            return list(map(patten, self.result.smoothedCov[start:end]))
+            covs = self.result.smoothedCov
         elif filterType == "predict":
-            return list(map(patten, self.result.predictedCov[start:end]))
+            covs = self.result.predictedCov
         else:
             raise NameError("Incorrect filter type")
+        if covs is None or covs.ndim != 3:
+            raise ValueError(
+                "The full latent covariance is not kept under covRetention='"
+                + self.result.covRetention
+                + "'."
+            )
+        return covs[start:end, indx[0] : (indx[1] + 1), indx[0] : (indx[1] + 1)]
 
     # function to get the component mean
     def _getComponentMean(self, name, filterType, start, end):
@@ -100,13 +102,20 @@ class _dlmGet(_dlm):
         end += 1
         comp = self._fetchComponent(name)
         componentState = self._getLatentState(
-            name=name, filterType=filterType, start=start, end=end
+            name=name, filterType=filterType, start=start, end=end - 1
         )
+        # the evaluation of the other components does not change over time
+        if (
+            name not in self.builder.dynamicComponents
+            and name not in self.builder.automaticComponents
+        ):
+            return dot(componentState[:, :, 0], comp.evaluation[0]).tolist()
+
         result = []
         for k, i in enumerate(range(start, end)):
             if name in self.builder.dynamicComponents:
                 comp.updateEvaluation(i)
-            elif name in self.builder.automaticComponents:
+            else:
                 comp.updateEvaluation(i, self.padded_data)
             result.append(dot(comp.evaluation, componentState[k]).tolist()[0][0])
         return result
@@ -129,13 +138,21 @@ class _dlmGet(_dlm):
         end += 1
         comp = self._fetchComponent(name)
         componentCov = self._getLatentCov(
-            name=name, filterType=filterType, start=start, end=end
+            name=name, filterType=filterType, start=start, end=end - 1
         )
+        # the evaluation of the other components does not change over time
+        if (
+            name not in self.builder.dynamicComponents
+            and name not in self.builder.automaticComponents
+        ):
+            evaluation = comp.evaluation[0]
+            return einsum("i,nij,j->n", evaluation, componentCov, evaluation).tolist()
+
         result = []
         for k, i in enumerate(range(start, end)):
             if name in self.builder.dynamicComponents:
                 comp.updateEvaluation(i)
-            elif name in self.builder.automaticComponents:
+            else:
                 comp.updateEvaluation(i, self.padded_data)
             result.append(
                 dot(dot(comp.evaluation, componentCov[k]), comp.evaluation.T).tolist()[
@@ -1,4 +1,5 @@
 from copy import deepcopy
+import numpy as np
 from pydlm.base.tools import getInterval
 from pydlm.access._dlmGet import _dlmGet
 
@@ -65,6 +66,10 @@ class dlmAccessModule(_dlmGet):
         then a warning will prompt stating
         the actual filtered dates.
 
+        The variance of the time series is always available. The variance
+        of a component needs the full latent covariance, i.e., the option
+        covRetention = 'full' (or 'smoother' except for the smoothed result).
+
         Args:
             filterType: the type of variance to be returned. Could be
                         'forwardFilter', 'backwardSmoother', and 'predict'.
@@ -111,7 +116,8 @@ class dlmAccessModule(_dlmGet):
                         Default to 'forwardFilter'.
 
         Returns:
-            A list of residuals based on the choice
+            A list of residuals based on the choice. The residual of a
+            missing date is nan.
 
         """
         # get the working date
@@ -120,19 +126,16 @@ class dlmAccessModule(_dlmGet):
         # get the mean for the fitlered data
         # get out of the matrix form
         if filterType == "forwardFilter":
-            return self._1DmatrixToArray(
-                [self.data[i] - self.result.filteredObs[i] for i in range(start, end)]
-            )
+            obs = self.result.filteredObs
         elif filterType == "backwardSmoother":
-            return self._1DmatrixToArray(
-                [self.data[i] - self.result.smoothedObs[i] for i in range(start, end)]
-            )
+            obs = self.result.smoothedObs
         elif filterType == "predict":
-            return self._1DmatrixToArray(
-                [self.data[i] - self.result.predictedObs[i] for i in range(start, end)]
-            )
+            obs = self.result.predictedObs
         else:
             raise NameError("Incorrect filter type.")
+        # missing data gives nan residuals
+        data = np.array(self.data[start:end], dtype=float)
+        return (data - obs[start:end, 0, 0]).tolist()
 
     def getInterval(self, p=0.95, filterType="forwardFilter", name="main"):
         """get the confidence interval for data or component.
@@ -141,6 +144,10 @@ class dlmAccessModule(_dlmGet):
         (0, self.n - 1), then a warning will prompt stating the actual
         filtered dates.
 
+        The variance of the time series is always available. The variance
+        of a component needs the full latent covariance, i.e., the option
+        covRetention = 'full' (or 'smoother' except for the smoothed result).
+
         Args:
             p: The confidence level.
             filterType: the type of CI to be returned. Could be
@@ -212,27 +219,21 @@ class dlmAccessModule(_dlmGet):
         start, end = self._checkAndGetWorkingDates(filterType=filterType)
         end += 1
         # to return the full latent states
-        to_array = lambda x: None if x is None else x.flatten().tolist()
         if name == "all":
             if filterType == "forwardFilter":
-                return list(map(to_array, self.result.filteredState[start:end]))
+                return self.result.filteredState[start:end, :, 0].tolist()
             elif filterType == "backwardSmoother":
-                return list(map(to_array, self.result.smoothedState[start:end]))
+                return self.result.smoothedState[start:end, :, 0].tolist()
             elif filterType == "predict":
-                return list(map(to_array, self.result.predictedState[start:end]))
+                return self.result.predictedState[start:end, :, 0].tolist()
             else:
                 raise NameError("Incorrect filter type.")
 
         # to return the latent state for a given component
         self._checkComponent(name)
-        return list(
-            map(
-                to_array,
-                self._getLatentState(
-                    name=name, filterType=filterType, start=start, end=(end - 1)
-                ),
-            )
-        )
+        return self._getLatentState(
+            name=name, filterType=filterType, start=start, end=(end - 1)
+        )[:, :, 0].tolist()
 
     def getLatentCov(self, filterType="forwardFilter", name="all"):
         """get the error covariance for different components and
@@ -251,8 +252,11 @@ class dlmAccessModule(_dlmGet):
                   covariance for that component. Default to 'all'.
 
         Returns:
-            A list of numpy matrices, standing for the filtered latent
-            covariance.
+            A list of the latent covariance with one (d x d) matrix for
+            each date. When the model only keeps the diagonal of the
+            covariance (the 'covRetention' option), name = 'all' returns the
+            diagonals (one vector per date) and the covariance of a component
+            raises ValueError, as it does when no covariance is kept.
 
         """
         # get the working dates
@@ -261,16 +265,21 @@ class dlmAccessModule(_dlmGet):
         # to return the full latent covariance
         if name == "all":
             if filterType == "forwardFilter":
-                return self.result.filteredCov[start:end]
+                covs = self.result.filteredCov
             elif filterType == "backwardSmoother":
-                return self.result.smoothedCov[start:end]
+                covs = self.result.smoothedCov
             elif filterType == "predict":
-                return self.result.predictedCov[start:end]
+                covs = self.result.predictedCov
             else:
                 raise NameError("Incorrect filter type.")
+            if covs is None:
+                raise ValueError("No latent covariance is kept.")
+            return list(covs[start:end])
 
         # to return the latent covariance for a given component
         self._checkComponent(name)
-        return self._getLatentCov(
-            name=name, filterType=filterType, start=start, end=(end - 1)
+        return list(
+            self._getLatentCov(
+                name=name, filterType=filterType, start=start, end=(end - 1)
+            )
         )
@@ -0,0 +1,273 @@
+"""
+===============================================
+
+Batched Kalman filter for many series
+
+===============================================
+
+This module runs the forward filter of @kalmanFilter on a stack of time series
+that all share the same model structure (i.e., the same @builder). The
+predict and update equations are evaluated over a leading batch axis, so the
+python overhead of each step is shared by all the series in the batch. The
+filtered quantities are the same as running `dlm.fitForwardFilter()` on each
+series separately.
+
+"""
+
+import numpy as np
+import pydlm.base.tools as tl
+from pydlm.base.kalmanFilter import kalmanFilter
+
+
+class batchKalmanFilter:
+    """The batchKalmanFilter class filters a stack of series that share one model
+    structure.
+
+    Attributes:
+        builder: the @builder template which provides the components, the
+                 transition, the priors and the discount factors.
+        updateInnovation: the innovation type, 'whole' or 'component', same as
+                          in @kalmanFilter. Default to 'component', which is
+                          the default of @dlm.
+        noise: the prior guess of the observation noise. Could be a number or a
+               vector with one value per series.
+
+    Methods:
+        forwardFilter: run the forward filter on a stack of series.
+
+    Example:
+        >>> from pydlm.modeler.builder import builder
+        >>> template = builder() + trend(degree=1) + seasonality(period=7)
+        >>> batchFilter = batchKalmanFilter(template)
+        >>> result = batchFilter.forwardFilter(data)  # data is S x n
+        >>> result.filteredObs  # S x n
+    """
+
+    def __init__(self, builder, updateInnovation="component", noise=1.0):
+        self.builder = builder
+        self.updateInnovation = updateInnovation
+        self.noise = noise
+
+    # an inner class to store all results
+    class _result(object):
+        """Class to store the batched results. All quantities carry the series
+        on the first axis and the time on the second axis.
+
+        """
+
+        records = [
+            "filteredObs",
+            "predictedObs",
+            "filteredObsVar",
+            "predictedObsVar",
+            "noiseVar",
+            "df",
+            "filteredState",
+            "predictedState",
+            "filteredCov",
+            "predictedCov",
+        ]
+
+        def __init__(self, S, n, d, saveCov):
+            for variable in [
+                "filteredObs",
+                "predictedObs",
+                "filteredObsVar",
+                "predictedObsVar",
+                "noiseVar",
+                "df",
+            ]:
+                setattr(self, variable, np.zeros((S, n)))
+
+            self.filteredState = np.zeros((S, n, d))
+            self.predictedState = np.zeros((S, n, d))
+            if saveCov:
+                self.filteredCov = np.zeros((S, n, d, d))
+                self.predictedCov = np.zeros((S, n, d, d))
+            else:
+                self.filteredCov = None
+                self.predictedCov = None
+
+            # the location of each component in the latent states
+            self.componentIndex = None
+
+    def forwardFilter(self, data, features=None, discount=None, saveCov=True):
+        """Run the forward filter on a stack of series
+
+        Args:
+            data: a S x n array (or list of lists) of the time series. Missing
+                  values can be supplied as None or nan.
+            features: optional dictionary of {dynamic_component_name: feature},
+                      where feature is a S x n x d array providing different
+                      features for each series. Dynamic components not in the
+                      dictionary share the features stored in the template.
+            discount: optional discount factors to replace the discount of the
+                      template. Could be a vector of length d or a S x d
+                      array with one discount vector per series.
+            saveCov: indicate whether the filtered and predicted covariance
+                     should be saved. These are S x n x d x d arrays and can
+                     be large.
+
+        Returns:
+            A @_result object storing the filtered results for all series.
+        """
+        data = np.array(data, dtype=float)
+        if data.ndim != 2:
+            raise ValueError("data must be a S x n array.")
+        S, n = data.shape
+
+        builder = self.builder
+        if not builder.initialized:
+            builder.initialize(noise=1.0)
+        features = self._checkFeatureSize(n, features)
+
+        transition = builder.model.transition
+        d = transition.shape[0]
+
+        # the innovation is computed by an element-wise scaling of the
+        # propagated covariance, which is shared by all series unless each
+        # series brings its own discount.
+        if discount is None:
+            discount = builder.discount
+        discount = np.array(discount, dtype=float)
+        if np.any(discount < 0) or np.any(discount > 1):
+            raise tl.matrixErrors("discount factor must be between 0 and 1")
+        scale = self._innovationScale(discount, builder.componentIndex)
+
+        # the prior status of all series
+        state = np.repeat(builder.statePrior.T, S, axis=0)
+        sysVar = np.repeat(builder.sysVarPrior[np.newaxis, :, :], S, axis=0)
+        noiseVar = np.ones(S) * self.noise
+        df = np.ones(S) * builder.initialDegreeFreedom
+        # 'fresh' marks the series whose previous observation is not missing.
+        # Only those receive the innovation, same as @kalmanFilter.
+        fresh = np.ones(S, dtype=bool)
+
+        padded = data.copy()
+        result = self._result(S, n, d, saveCov)
+        result.componentIndex = dict(builder.componentIndex)
+
+        for step in range(n):
+            evaluation = self._evaluation(step, S, padded, features)
+
+            # predict
+            predState = np.dot(state, transition.T)
+            predSysVar = np.matmul(np.matmul(transition, sysVar), transition.T)
+            predSysVar += predSysVar * scale * fresh[:, np.newaxis, np.newaxis]
+            predObs = np.sum(evaluation * predState, axis=1)
+            sysVarF = np.matmul(predSysVar, evaluation[:, :, np.newaxis])[:, :, 0]
+            predObsVar = np.sum(evaluation * sysVarF, axis=1) + noiseVar
+
+            # update
+            y = data[:, step]
+            observed = ~np.isnan(y)
+            err = np.where(observed, y - predObs, 0.0)
+            df = df + observed
+            correction = sysVarF / predObsVar[:, np.newaxis]
+            lastNoiseVar = noiseVar
+            noiseVar = np.where(
+                observed,
+                noiseVar * (1.0 - 1.0 / df + err * err / df / predObsVar),
+                noiseVar,
+            )
+
+            state = predState + correction * err[:, np.newaxis]
+            ratio = noiseVar / lastNoiseVar
+            sysVar = ratio[:, np.newaxis, np.newaxis] * (
+                predSysVar
+                - correction[:, :, np.newaxis]
+                * correction[:, np.newaxis, :]
+                * (predObsVar * observed)[:, np.newaxis, np.newaxis]
+            )
+
+            obs = np.sum(evaluation * state, axis=1)
+            obsVar = (
+                np.sum(
+                    evaluation
+                    * np.matmul(sysVar, evaluation[:, :, np.newaxis])[:, :, 0],
+                    axis=1,
+                )
+                + noiseVar
+            )
+            fresh = observed
+
+            # pad missing value with filtered result
+            padded[:, step] = np.where(observed, y, obs)
+
+            result.filteredObs[:, step] = obs
+            result.predictedObs[:, step] = predObs
+            result.filteredObsVar[:, step] = obsVar
+            result.predictedObsVar[:, step] = predObsVar
+            result.noiseVar[:, step] = noiseVar
+            result.df[:, step] = df
+            result.filteredState[:, step, :] = state
+            result.predictedState[:, step, :] = predState
+            if saveCov:
+                result.filteredCov[:, step, :, :] = sysVar
+                result.predictedCov[:, step, :, :] = predSysVar
+
+        return result
+
+    def _evaluation(self, step, S, padded, features):
+        """Construct the S x d evaluation matrix for a given step"""
+        builder = self.builder
+        evaluation = np.repeat(builder.model.evaluation, S, axis=0).astype(float)
+
+        for name in builder.dynamicComponents:
+            indx = builder.componentIndex[name]
+            if features is not None and name in features:
+                evaluation[:, indx[0] : (indx[1] + 1)] = features[name][:, step, :]
+            else:
+                comp = builder.dynamicComponents[name]
+                evaluation[:, indx[0] : (indx[1] + 1)] = comp.features[step]
+
+        for name in builder.automaticComponents:
+            comp = builder.automaticComponents[name]
+            indx = builder.componentIndex[name]
+            if comp.componentType == "longSeason":
+                comp.updateEvaluation(step)
+                evaluation[:, indx[0] : (indx[1] + 1)] = comp.evaluation
+            else:
+                # autoReg, the features are the previous observations of each
+                # series, padded for the first few steps.
+                lag = min(step, comp.d)
+                evaluation[:, indx[0] : (indx[1] + 1 - lag)] = comp.padding
+                if lag > 0:
+                    evaluation[:, (indx[1] + 1 - lag) : (indx[1] + 1)] = padded[
+                        :, (step - lag) : step
+                    ]
+        return evaluation
+
+    def _checkFeatureSize(self, n, features):
+        """Check the features's n matches the data's n and return a copy of
+        the features as float arrays. The features of the caller are left
+        untouched.
+
+        """
+        for name in self.builder.dynamicComponents:
+            if features is not None and name in features:
+                if np.shape(features[name])[1] != n:
+                    raise ValueError(
+                        f"The data size of the batch and { name } does not match"
+                    )
+            elif self.builder.dynamicComponents[name].n != n:
+                raise ValueError(
+                    f"The data size of the batch and { name } does not match"
+                )
+        if features is None:
+            return None
+        converted = {}
+        for name in features:
+            if name not in self.builder.dynamicComponents:
+                raise ValueError(f"{ name } is not a dynamic component.")
+            converted[name] = np.array(features[name], dtype=float)
+        return converted
+
+    def _innovationScale(self, discount, index):
+        """The element-wise scale that turns the propagated covariance into the
+        innovation, see @kalmanFilter._discountScale. discount could be one
+        discount vector or one for each series.
+
+        """
+        Filter = kalmanFilter(updateInnovation=self.updateInnovation, index=index)
+        return Filter._discountScale(discount)
@@ -17,6 +17,12 @@ provided)
 import numpy as np
 import pydlm.base.tools as tl
 
+# scipy is optional, it solves with the Cholesky factor of factorizedSmoother
+try:
+    from scipy.linalg import cho_solve
+except ImportError:
+    cho_solve = None
+
 # Define the class of Kalman filter which offers a forward filter
 # backward smoother and backward sampler for one-step move
 
@@ -36,22 +42,82 @@ class kalmanFilter:
                           filtered state and systematic covariance
         backwardSampler: similar to backwardSmoother, using sampling instead of
                          deterministic equations.
+        backwardSampleBatch: one step backward sampling of many paths at once
         updateDiscount: for updating the discount factors
+        resetSteadyState: drop the frozen steady state, see steadyState
     """
 
-    def __init__(self, discount=[0.99], updateInnovation="whole", index=None):
+    # below this state dimension, the full matrix products are cheaper than
+    # the block by block propagation
+    _minStructuredDim = 40
+
+    # the number of updates over which the steady state has to hold
+    _steadyWindow = 10
+
+    def __init__(
+        self,
+        discount=[0.99],
+        updateInnovation="whole",
+        index=None,
+        transitionType=None,
+        fused=False,
+        steadyState=False,
+        steadyStateTol=1e-6,
+        factorizedSmoother=False,
+    ):
         """Initializing the kalmanFilter class
 
         Args:
             discount: the discounting factor, could be a vector
             updateInnovation: the indicator for whether updating innovation matrix
+            index: the location of each component in the latent states
+            transitionType: the type of the transition of each component, see
+                            @builder. When supplied together with index, the
+                            states are propagated block by block instead of
+                            multiplying the full transition matrix.
+            fused: indicate whether forwardFilter runs the fused kernel, which
+                   writes the predicted and filtered status into work buffers
+                   owned by the filter instead of allocating new arrays. The
+                   arrays of the model are then overwritten by later steps, so
+                   any status to be kept has to be copied.
+            steadyState: indicate whether forwardFilter detects the steady
+                         state of the filter. With the discount innovation,
+                         the covariances relative to the noise variance and
+                         the gain converge when the evaluation and the
+                         transition are fixed. Once the gain and the
+                         predicted covariance change by less than
+                         steadyStateTol over a window of updates, they are
+                         frozen and only the states are propagated. The
+                         filter falls back to the full recursion on missing
+                         data, on a changed evaluation or after
+                         resetSteadyState. Only the work of the filter is
+                         saved, the covariances handed out are still full
+                         d x d matrices for every step.
+            steadyStateTol: the relative tolerance for the steady state.
+            factorizedSmoother: indicate whether backwardSmoother and
+                                backwardSampler compute the smoothing gain by
+                                a Cholesky factorization of the predicted
+                                covariance instead of its generalized inverse.
+                                The generalized inverse is still used when the
+                                factorization fails. The factor is reused to
+                                solve for the gain when scipy is installed.
 
         """
 
         self.__checkDiscount__(discount)
-        self.discount = np.diag(1 / np.sqrt(np.array(discount)))
+        self.discount = np.array(discount, dtype=float)
         self.updateInnovation = updateInnovation
         self.index = index
+        self.transitionType = transitionType
+        self.fused = fused
+        self._buffers = None
+        self.steadyState = steadyState
+        self.steadyStateTol = steadyStateTol
+        self.factorizedSmoother = factorizedSmoother
+        self._horizonCache = {}
+        self.resetSteadyState()
+        self._setInnovationScale()
+        self._setTransitionStructure()
 
     def predict(self, model, dealWithMissingEvaluation=False):
         """Predict the next states of the model by one step
@@ -66,72 +132,244 @@ class kalmanFilter:
 
         """
         # check whether evaluation has missing data, if so, we need to take care of it
+        loc = []
         if dealWithMissingEvaluation:
             loc = self._modifyTransitionAccordingToMissingValue(model)
 
-        # if the step number == 0, we use result from the model state
-        if model.prediction.step == 0:
-            model.prediction.state = np.dot(model.transition, model.state)
-            model.prediction.obs = np.dot(model.evaluation, model.prediction.state)
-            model.prediction.sysVar = np.dot(
-                np.dot(model.transition, model.sysVar), model.transition.T
-            )
-
-            # update the innovation
-            if self.updateInnovation == "whole":
-                self.__updateInnovation__(model)
-            elif self.updateInnovation == "component":
-                self.__updateInnovation2__(model)
-
-            # add the innovation to the system variance
-            model.prediction.sysVar += model.innovation
-
-            model.prediction.obsVar = (
-                np.dot(
-                    np.dot(model.evaluation, model.prediction.sysVar),
-                    model.evaluation.T,
-                )
-                + model.noiseVar
-            )
-            model.prediction.step = 1
-
-        # otherwise, we use previous result to predict next time stamp
-        else:
-            model.prediction.state = np.dot(model.transition, model.prediction.state)
-            model.prediction.obs = np.dot(model.evaluation, model.prediction.state)
-            model.prediction.sysVar = np.dot(
-                np.dot(model.transition, model.prediction.sysVar), model.transition.T
-            )
-            model.prediction.obsVar = (
-                np.dot(
-                    np.dot(model.evaluation, model.prediction.sysVar),
-                    model.evaluation.T,
-                )
-                + model.noiseVar
-            )
-            model.prediction.step += 1
+        # the modified transition no longer has the component structure
+        self._predict(model, structured=len(loc) == 0)
 
         # recover the evaluation and the transition matrix
         if dealWithMissingEvaluation:
             self._recoverTransitionAndEvaluation(model, loc)
 
-    def forwardFilter(self, model, y, dealWithMissingEvaluation=False):
+    def predictHorizon(self, model, N):
+        """Predict the next N steps of a model with fixed evaluation and
+        transition at once. The h step ahead observation is F G^(h-1) a with
+        variance F G^(h-1) R (F G^(h-1))' + V, where a and R are the one step
+        predicted state and covariance (with the innovation). The rows
+        F G^(h-1) are computed by doubling and cached for the evaluation and
+        the transition, see @_horizonRows.
+
+        Args:
+            model: the @baseModel, whose state and sysVar are the filtered
+                   status the prediction starts from.
+            N: the number of steps to predict.
+
+        Returns:
+            A tuple of (predicted observations, variances of the predicted
+            observations), each an array of length N. 'model.prediction'
+            stores the status of the N-th step, as if predict had been called
+            N times.
+        """
+        model.prediction.step = 0
+        self._predict(model)
+        state, sysVar = model.prediction.state, model.prediction.sysVar
+
+        rows = self._horizonRows(model.transition, model.evaluation, N)
+        obs = np.dot(rows, state)[:, 0]
+        obsVar = np.einsum("hi,hi->h", np.dot(rows, sysVar), rows)
+        obsVar += float(model.noiseVar[0, 0])
+
+        if N > 1:
+            power = np.linalg.matrix_power(model.transition, N - 1)
+            model.prediction.state = np.dot(power, state)
+            model.prediction.sysVar = np.dot(np.dot(power, sysVar), power.T)
+            model.prediction.step = N
+            model.prediction.obs = np.array(obs[-1], ndmin=2)
+            model.prediction.obsVar = np.array(obsVar[-1], ndmin=2)
+        return (obs, obsVar)
+
+    def _horizonRows(self, transition, evaluation, N):
+        """The rows F G^h for h = 0, ..., N - 1. Row h + k is row h times G^k,
+        so the rows are filled by doubling k with O(log N) matrix products.
+        The rows are cached by the evaluation and the transition and extended
+        when a longer horizon is requested.
+
+        """
+        key = (evaluation.tobytes(), transition.tobytes(), transition.shape)
+        rows = self._horizonCache.get(key)
+        if rows is not None and len(rows) >= N:
+            return rows[:N]
+
+        rows = np.empty((N, transition.shape[0]))
+        rows[0] = evaluation[0]
+        power = transition
+        k = 1
+        while k < N:
+            m = min(k, N - k)
+            rows[k : (k + m)] = np.dot(rows[:m], power)
+            k += m
+            if k < N:
+                power = np.dot(power, power)
+        self._horizonCache[key] = rows
+        return rows
+
+    def forwardFilter(
+        self, model, y, dealWithMissingEvaluation=False, sensitivity=None
+    ):
         """The forwardFilter used to run one step filtering given new data
 
         Args:
             model: the @baseModel provided the basic information
             y: the newly observed data
+            sensitivity: the derivatives with respect to the discount factors
+                         created by initSensitivity. When supplied, they are
+                         carried through the step by the full recursion and
+                         updated in place, see @_updateSensitivity.
 
         Returns:
             The filtered result is stored in the 'model' replacing the old states
 
         """
         # check whether evaluation has missing data, if so, we need to take care of it
+        loc = []
         if dealWithMissingEvaluation:
             loc = self._modifyTransitionAccordingToMissingValue(model)
 
+        structured = len(loc) == 0
+        lastNoiseVar = float(model.noiseVar[0, 0])
+        if sensitivity is not None:
+            # the innovation is only added when the previous date is observed
+            innovated = model.prediction.step == 0
+            self._fullForwardFilter(model, y, structured=structured)
+            self._updateSensitivity(model, y, sensitivity, innovated, lastNoiseVar)
+        elif self._isSteady(model, y, structured):
+            # the covariances and the gain are frozen, only states move
+            self._steadyForwardFilter(model, y)
+        else:
+            if self.fused:
+                self._fusedForwardFilter(model, y, structured=structured)
+            else:
+                self._fullForwardFilter(model, y, structured=structured)
+            if self.steadyState:
+                self._detectSteadyState(model, y, structured, lastNoiseVar)
+
+        # recover the evaluation and the transition matrix
+        if dealWithMissingEvaluation:
+            self._recoverTransitionAndEvaluation(model, loc)
+
+    def initSensitivity(self, model, groups):
+        """Create the derivatives of the filter with respect to the discount
+        factors, used by forwardFilter for the forward mode sensitivity. Each
+        group of latent states shares one discount factor (e.g., one group
+        per component). The prior does not depend on the discount, so all
+        derivatives start from zero.
+
+        Args:
+            model: the @baseModel at its prior status.
+            groups: a list of [start, end], the (inclusive) range of the
+                    latent states sharing each discount factor.
+
+        Returns:
+            A dictionary of the derivatives with respect to each discount,
+            carrying the group on the first axis: 'state' (K x d), 'sysVar'
+            (K x d x d), 'noiseVar' (K) and 'predObs' (K), the derivative of
+            the one step ahead prediction of the last filtered date. 'scale'
+            (K x d x d) is the derivative of the innovation scale.
+        """
+        d = model.state.shape[0]
+        K = len(groups)
+        scale = np.zeros((K, d, d))
+        if self._innovationScale is not None:
+            s = 1 / np.sqrt(self.discount)
+            mask = self._innovationMask(d)
+            for k, (start, end) in enumerate(groups):
+                ds = np.zeros(d)
+                ds[start : (end + 1)] = -0.5 * self.discount[start : (end + 1)] ** -1.5
+                scale[k] = (np.outer(ds, s) + np.outer(s, ds)) * mask
+        return {
+            "state": np.zeros((K, d)),
+            "sysVar": np.zeros((K, d, d)),
+            "noiseVar": np.zeros(K),
+            "predObs": np.zeros(K),
+            "scale": scale,
+        }
+
+    def _updateSensitivity(self, model, y, sensitivity, innovated, lastNoiseVar):
+        """Carry the derivatives with respect to the discount factors through
+        one step of the full recursion, which has just been applied to model.
+        With P = G C G', the predicted covariance is R = P + P * S (element-
+        wise) when the innovation is added and the discount enters only
+        through S. Differentiating the prediction and the update gives
+            da = G dm, dR = G dC G' + (G dC G') * S + P * dS,
+            df = F da, dq = F dR F' + dV,
+            dk = dR F' / q - k dq / q,
+            dm' = da + dk e - k df,
+        and C' = r (R - q k k'), V' = V (1 - 1 / n + e^2 / n / q) for the
+        covariance and the noise. The evaluation is treated as fixed.
+
+        Args:
+            model: the @baseModel after the forward filter step.
+            y: the observation of the step.
+            sensitivity: the derivatives from initSensitivity.
+            innovated: whether the innovation was added in the prediction.
+            lastNoiseVar: the noise variance before the step.
+        """
+        transition = model.transition
+        evaluation = model.evaluation[0]
+        dState = np.dot(sensitivity["state"], transition.T)
+        dSysVar = np.matmul(np.matmul(transition, sensitivity["sysVar"]), transition.T)
+        predSysVar = model.prediction.sysVar
+        if innovated and self._innovationScale is not None:
+            propagated = predSysVar - model.innovation
+            dSysVar = (
+                dSysVar
+                + dSysVar * self._innovationScale
+                + propagated * sensitivity["scale"]
+            )
+        dPredObs = np.dot(dState, evaluation)
+        sensitivity["predObs"] = dPredObs
+
+        if y is None:
+            sensitivity["state"] = dState
+            sensitivity["sysVar"] = dSysVar
+            return
+
+        dNoiseVar = sensitivity["noiseVar"]
+        predObsVar = float(model.prediction.obsVar[0, 0])
+        err = y - float(model.prediction.obs[0, 0])
+        df = model.df
+        noiseVar = float(model.noiseVar[0, 0])
+        ratio = noiseVar / lastNoiseVar
+        sysVarF = np.dot(predSysVar, evaluation)
+        correction = sysVarF / predObsVar
+
+        dSysVarF = np.dot(dSysVar, evaluation)
+        dPredObsVar = np.dot(dSysVarF, evaluation) + dNoiseVar
+        dErr = -dPredObs
+        dNewNoiseVar = dNoiseVar * (
+            1.0 - 1.0 / df + err * err / df / predObsVar
+        ) + lastNoiseVar * (
+            2 * err * dErr / df / predObsVar
+            - err * err * dPredObsVar / df / predObsVar**2
+        )
+        dRatio = (dNewNoiseVar - ratio * dNoiseVar) / lastNoiseVar
+        dCorrection = (
+            dSysVarF - correction[np.newaxis, :] * dPredObsVar[:, np.newaxis]
+        ) / predObsVar
+
+        outer = np.outer(correction, correction)
+        dOuter = (
+            dCorrection[:, :, np.newaxis] * correction[np.newaxis, np.newaxis, :]
+            + correction[np.newaxis, :, np.newaxis] * dCorrection[:, np.newaxis, :]
+        )
+        sensitivity["state"] = (
+            dState + dCorrection * err + correction[np.newaxis, :] * dErr[:, np.newaxis]
+        )
+        sensitivity["sysVar"] = dRatio[:, np.newaxis, np.newaxis] * (
+            predSysVar - predObsVar * outer
+        ) + ratio * (
+            dSysVar
+            - dPredObsVar[:, np.newaxis, np.newaxis] * outer
+            - predObsVar * dOuter
+        )
+        sensitivity["noiseVar"] = dNewNoiseVar
+
+    def _fullForwardFilter(self, model, y, structured=True):
+        """The forward filter step with the full covariance recursion."""
         # since we have delt with the missing value, we don't need to double treat it.
-        self.predict(model, dealWithMissingEvaluation=False)
+        predObs, predSysVarF, sysVarF = self._predict(model, structured=structured)
 
         # when y is not a missing data
         if y is not None:
@@ -141,36 +379,37 @@ class kalmanFilter:
             # model.prediction.step = 0
             model.prediction.step = 0
 
-            # the prediction error and the correction matrix
-            err = y - model.prediction.obs
-            correction = (
-                np.dot(model.prediction.sysVar, model.evaluation.T)
-                / model.prediction.obsVar
-            )
+            # The observation is univariate, so the prediction error, the
+            # observation variance and the noise are python scalars and the
+            # correction (Kalman gain) is a 1-D vector.
+            lastNoiseVar = float(model.noiseVar[0, 0])  # for updating model.sysVar
+            predObsVar = predSysVarF + lastNoiseVar
+            err = y - predObs
+            correction = sysVarF / predObsVar
 
             # update new states
             model.df += 1
-            lastNoiseVar = model.noiseVar  # for updating model.sysVar
-            model.noiseVar = model.noiseVar * (
-                1.0 - 1.0 / model.df + err * err / model.df / model.prediction.obsVar
+            noiseVar = lastNoiseVar * (
+                1.0 - 1.0 / model.df + err * err / model.df / predObsVar
             )
-
-            model.state = model.prediction.state + correction * err
-
-            model.sysVar = (
-                model.noiseVar[0, 0]
-                / lastNoiseVar[0, 0]
-                * (
-                    model.prediction.sysVar
-                    - np.dot(correction, correction.T) * model.prediction.obsVar[0, 0]
-                )
+            ratio = noiseVar / lastNoiseVar
+
+            model.state = model.prediction.state + (correction * err)[:, np.newaxis]
+            # correction * correction' * predObsVar = sysVarF * sysVarF' /
+            # predObsVar. The outer product keeps the update exactly symmetric,
+            # otherwise the rounding error builds up over the steps.
+            model.sysVar = ratio * (
+                model.prediction.sysVar - np.outer(sysVarF, sysVarF) / predObsVar
             )
 
-            model.obs = np.dot(model.evaluation, model.state)
-            model.obsVar = (
-                np.dot(np.dot(model.evaluation, model.sysVar), model.evaluation.T)
-                + model.noiseVar
+            # the observation mean and variance follows from the same scalars
+            # without going back to the d x d covariance
+            filteredSysVarF = ratio * (
+                predSysVarF - predSysVarF * predSysVarF / predObsVar
             )
+            model.noiseVar = np.array(noiseVar, ndmin=2)
+            model.obs = np.array(predObs + predSysVarF / predObsVar * err, ndmin=2)
+            model.obsVar = np.array(filteredSysVarF + noiseVar, ndmin=2)
 
             # update the innovation using discount
             # model.innovation = model.sysVar * (1 / self.discount - 1)
@@ -191,9 +430,429 @@ class kalmanFilter:
             model.obs = model.prediction.obs
             model.obsVar = model.prediction.obsVar
 
-        # recover the evaluation and the transition matrix
-        if dealWithMissingEvaluation:
-            self._recoverTransitionAndEvaluation(model, loc)
+    def _predict(self, model, structured=True):
+        """The one step prediction shared by predict and forwardFilter.
+
+        Args:
+            model: the @baseModel
+            structured: indicate whether the transition still has the block
+                        structure given by transitionType.
+
+        Returns:
+            A tuple of (predicted observation, the variance of the predicted
+            observation without the noise, predicted sysVar * evaluation). The
+            first two are python scalars and the last one is a 1-D vector that
+            forwardFilter reuses for the Kalman gain.
+        """
+        # if the step number == 0, we use result from the model state
+        if model.prediction.step == 0:
+            model.prediction.state, model.prediction.sysVar = self._propagate(
+                model.transition, model.state, model.sysVar, structured
+            )
+
+            # update the innovation
+            if self._innovationScale is not None:
+                self.__updateInnovation__(model)
+
+            # add the innovation to the system variance
+            model.prediction.sysVar += model.innovation
+            model.prediction.step = 1
+
+        # otherwise, we use previous result to predict next time stamp
+        else:
+            model.prediction.state, model.prediction.sysVar = self._propagate(
+                model.transition,
+                model.prediction.state,
+                model.prediction.sysVar,
+                structured,
+            )
+            model.prediction.step += 1
+
+        evaluation = model.evaluation[0]
+        sysVarF = np.dot(model.prediction.sysVar, evaluation)
+        predSysVarF = float(np.dot(evaluation, sysVarF))
+        model.prediction.obs = np.dot(model.evaluation, model.prediction.state)
+        model.prediction.obsVar = np.array(
+            predSysVarF + float(model.noiseVar[0, 0]), ndmin=2
+        )
+
+        return (float(model.prediction.obs[0, 0]), predSysVarF, sysVarF)
+
+    def _propagate(self, transition, state, sysVar, structured=True, out=None):
+        """Propagate the latent states and their covariance by the transition,
+        i.e., compute G * state and G * sysVar * G'.
+
+        The transition assembled by @builder is block diagonal. When the type of
+        each block is known, the blocks are applied separately: identity blocks
+        are skipped, shift blocks (seasonality) are cyclic permutations so all
+        of them are applied at once by gathering the rows and columns with a
+        precomputed index, trend blocks (upper triangular ones) accumulate the
+        rows and columns from the bottom and the other blocks are multiplied
+        locally.
+
+        Args:
+            transition: the transition matrix
+            state: the latent states to propagate
+            sysVar: the covariance to propagate
+            structured: indicate whether the transition still has the block
+                        structure given by transitionType.
+            out: optional tuple of (state, covariance) arrays to write the
+                 result into. They must not be the input arrays.
+
+        Returns:
+            A tuple of (propagated state, propagated covariance)
+        """
+        if self._transitionBlocks is None or not structured:
+            if out is None:
+                return (
+                    np.dot(transition, state),
+                    np.dot(np.dot(transition, sysVar), transition.T),
+                )
+            np.dot(transition, state, out=out[0])
+            np.dot(transition, sysVar, out=self._buffers["work"])
+            np.dot(self._buffers["work"], transition.T, out=out[1])
+            return out
+
+        if out is None:
+            out = (np.empty(state.shape), np.empty(sysVar.shape))
+        newState, newSysVar = out
+
+        # the gather also makes the copy that the other blocks work on
+        if self._permutation is None:
+            np.copyto(newState, state)
+            np.copyto(newSysVar, sysVar)
+        else:
+            np.take(state, self._permutation, axis=0, out=newState, mode="clip")
+            np.take(
+                sysVar,
+                self._covPermutation,
+                out=newSysVar.reshape(-1),
+                mode="clip",
+            )
+
+        for start, end, blockType in self._transitionBlocks:
+            if blockType == "trend":
+                for i in range(end - 2, start - 1, -1):
+                    newState[i] += newState[i + 1]
+                    newSysVar[i] += newSysVar[i + 1]
+                for i in range(end - 2, start - 1, -1):
+                    newSysVar[:, i] += newSysVar[:, i + 1]
+            else:
+                block = transition[start:end, start:end]
+                newState[start:end] = np.dot(block, newState[start:end])
+                newSysVar[start:end] = np.dot(block, newSysVar[start:end])
+                newSysVar[:, start:end] = np.dot(newSysVar[:, start:end], block.T)
+        return out
+
+    def _fusedForwardFilter(self, model, y, structured=True):
+        """The fused predict and update step of forwardFilter.
+
+        It computes the same quantities as forwardFilter, but all d x d and d x 1
+        results are written into the preallocated buffers of the filter with
+        in-place operations. The model is then pointed to these buffers. There
+        are two sets of prediction buffers used in turn, so that the prediction
+        never overwrites the status it is computed from.
+
+        """
+        buffers = self._getBuffers(model.transition.shape[0])
+        prediction = model.prediction
+
+        # first predict, same as _predict
+        if prediction.step == 0:
+            state, sysVar = model.state, model.sysVar
+        else:
+            state, sysVar = prediction.state, prediction.sysVar
+        k = 0
+        if state is buffers["predState"][0] or sysVar is buffers["predSysVar"][0]:
+            k = 1
+        prediction.state, prediction.sysVar = self._propagate(
+            model.transition,
+            state,
+            sysVar,
+            structured,
+            out=(buffers["predState"][k], buffers["predSysVar"][k]),
+        )
+        if prediction.step == 0:
+            if self._innovationScale is not None:
+                self.__updateInnovation__(model)
+            prediction.sysVar += model.innovation
+            prediction.step = 1
+        else:
+            prediction.step += 1
+
+        evaluation = model.evaluation[0]
+        if evaluation.dtype != float:
+            evaluation = evaluation.astype(float)
+        sysVarF = np.dot(prediction.sysVar, evaluation, out=buffers["sysVarF"])
+        predSysVarF = float(np.dot(evaluation, sysVarF))
+        predObs = float(np.dot(evaluation, prediction.state[:, 0]))
+        lastNoiseVar = float(model.noiseVar[0, 0])
+        predObsVar = predSysVarF + lastNoiseVar
+        buffers["predObs"][0, 0] = predObs
+        buffers["predObsVar"][0, 0] = predObsVar
+        prediction.obs = buffers["predObs"]
+        prediction.obsVar = buffers["predObsVar"]
+
+        # when y is missing, the model takes the predicted status
+        if y is None:
+            model.state = prediction.state
+            model.sysVar = prediction.sysVar
+            model.obs = prediction.obs
+            model.obsVar = prediction.obsVar
+            return
+
+        # then update, same as forwardFilter
+        prediction.step = 0
+        err = y - predObs
+        correction = np.divide(sysVarF, predObsVar, out=buffers["correction"])
+        model.df += 1
+        noiseVar = lastNoiseVar * (
+            1.0 - 1.0 / model.df + err * err / model.df / predObsVar
+        )
+        ratio = noiseVar / lastNoiseVar
+
+        newState = buffers["state"]
+        np.multiply(correction, err, out=newState[:, 0])
+        newState += prediction.state
+        newSysVar = buffers["sysVar"]
+        np.outer(sysVarF, sysVarF, out=newSysVar)
+        newSysVar /= predObsVar
+        np.subtract(prediction.sysVar, newSysVar, out=newSysVar)
+        newSysVar *= ratio
+
+        filteredSysVarF = ratio * (predSysVarF - predSysVarF * predSysVarF / predObsVar)
+        buffers["noiseVar"][0, 0] = noiseVar
+        buffers["obs"][0, 0] = predObs + predSysVarF / predObsVar * err
+        buffers["obsVar"][0, 0] = filteredSysVarF + noiseVar
+        model.state = newState
+        model.sysVar = newSysVar
+        model.noiseVar = buffers["noiseVar"]
+        model.obs = buffers["obs"]
+        model.obsVar = buffers["obsVar"]
+
+    def _getBuffers(self, d):
+        """Get the work buffers of the fused kernel for a d dimensional model,
+        (re)allocating them when the dimension changes.
+
+        """
+        if self._buffers is None or self._buffers["sysVar"].shape[0] != d:
+            self._buffers = {
+                "predState": (np.zeros((d, 1)), np.zeros((d, 1))),
+                "predSysVar": (np.zeros((d, d)), np.zeros((d, d))),
+                "state": np.zeros((d, 1)),
+                "sysVar": np.zeros((d, d)),
+                "work": np.zeros((d, d)),
+                "sysVarF": np.zeros(d),
+                "correction": np.zeros(d),
+                "predObs": np.zeros((1, 1)),
+                "predObsVar": np.zeros((1, 1)),
+                "noiseVar": np.zeros((1, 1)),
+                "obs": np.zeros((1, 1)),
+                "obsVar": np.zeros((1, 1)),
+            }
+        return self._buffers
+
+    def _propagateState(self, transition, state, structured=True, out=None):
+        """Propagate only the latent states by the transition, i.e., compute
+        G * state block by block in the same way as _propagate.
+
+        """
+        if self._transitionBlocks is None or not structured:
+            return np.dot(transition, state, out=out)
+
+        if out is None:
+            out = np.empty(state.shape)
+        if self._permutation is None:
+            np.copyto(out, state)
+        else:
+            np.take(state, self._permutation, axis=0, out=out, mode="clip")
+
+        for start, end, blockType in self._transitionBlocks:
+            if blockType == "trend":
+                for i in range(end - 2, start - 1, -1):
+                    out[i] += out[i + 1]
+            else:
+                out[start:end] = np.dot(
+                    transition[start:end, start:end], out[start:end]
+                )
+        return out
+
+    def resetSteadyState(self):
+        """Drop the frozen steady state, so that the next steps of
+        forwardFilter run the full recursion until it converges again. It has
+        to be called whenever the model is set to a different status.
+
+        """
+        self._steady = None
+        self._steadyCandidate = None
+
+    def _isSteady(self, model, y, structured=True):
+        """Check whether the next step can run on the frozen steady state.
+        Otherwise the steady state is dropped.
+
+        """
+        if self._steady is None:
+            return False
+        if (
+            y is None
+            or not structured
+            or model.prediction.step != 0
+            or not np.array_equal(model.evaluation[0], self._steady["evaluation"])
+        ):
+            self.resetSteadyState()
+            return False
+        return True
+
+    def _detectSteadyState(self, model, y, structured, lastNoiseVar):
+        """Freeze the covariances once the gain and the predicted covariance
+        (relative to the noise variance) have settled.
+
+        Under the discount innovation, both follow a recursion that does not
+        depend on the data, so the frozen ones only have to be scaled by the
+        current noise variance in later steps. They are compared every
+        _steadyWindow consecutive updates with those of the last check, and
+        are frozen once neither has moved by more than steadyStateTol
+        (relative to its largest entry) over the whole window. Otherwise the
+        filter simply keeps running the full recursion.
+
+        """
+        if y is None or not structured or self._innovationScale is None:
+            self._steadyCandidate = None
+            return
+
+        evaluation = model.evaluation[0]
+        candidate = self._steadyCandidate
+        if candidate is not None and np.array_equal(
+            candidate["evaluation"], evaluation
+        ):
+            candidate["age"] += 1
+            if candidate["age"] < self._steadyWindow:
+                return
+        else:
+            candidate = None
+
+        predObsVar = float(model.prediction.obsVar[0, 0])
+        gain = np.dot(model.prediction.sysVar, evaluation) / predObsVar
+        predSysVar = model.prediction.sysVar / lastNoiseVar
+        self._steadyCandidate = {
+            "evaluation": np.array(evaluation, dtype=float),
+            "gain": gain,
+            "predSysVar": predSysVar,
+            "age": 0,
+        }
+        if candidate is None:
+            return
+
+        tol = self.steadyStateTol
+        gainDrift = np.max(np.abs(gain - candidate["gain"]))
+        varDrift = np.max(np.abs(predSysVar - candidate["predSysVar"]))
+        gainSettled = gainDrift <= tol * np.max(np.abs(gain))
+        varSettled = varDrift <= tol * np.max(np.abs(predSysVar))
+        if gainSettled and varSettled:
+            self._steady = {
+                "evaluation": self._steadyCandidate["evaluation"],
+                "gain": gain,
+                "sysVar": model.sysVar / float(model.noiseVar[0, 0]),
+                "predSysVar": predSysVar,
+                "predSysVarF": predObsVar / lastNoiseVar - 1.0,
+            }
+            self._steadyCandidate = None
+
+    def _steadyForwardFilter(self, model, y):
+        """The forward filter step on the frozen steady state. Only the states
+        are propagated and corrected by the frozen gain, the covariances are
+        the frozen ones scaled by the noise variance.
+
+        """
+        steady = self._steady
+        prediction = model.prediction
+        if self.fused:
+            buffers = self._getBuffers(model.transition.shape[0])
+            k = 1 if model.state is buffers["predState"][0] else 0
+            out = {
+                "predState": buffers["predState"][k],
+                "predSysVar": buffers["predSysVar"][k],
+                "state": buffers["state"],
+                "sysVar": buffers["sysVar"],
+            }
+        else:
+            out = {"predState": None, "predSysVar": None, "state": None, "sysVar": None}
+
+        lastNoiseVar = float(model.noiseVar[0, 0])
+        prediction.state = self._propagateState(
+            model.transition, model.state, out=out["predState"]
+        )
+        prediction.sysVar = np.multiply(
+            steady["predSysVar"], lastNoiseVar, out=out["predSysVar"]
+        )
+
+        predSysVarF = steady["predSysVarF"]
+        predObs = float(np.dot(steady["evaluation"], prediction.state[:, 0]))
+        predObsVar = (predSysVarF + 1.0) * lastNoiseVar
+        err = y - predObs
+        model.df += 1
+        noiseVar = lastNoiseVar * (
+            1.0 - 1.0 / model.df + err * err / model.df / predObsVar
+        )
+
+        model.state = np.add(
+            prediction.state, (steady["gain"] * err)[:, np.newaxis], out=out["state"]
+        )
+        model.sysVar = np.multiply(steady["sysVar"], noiseVar, out=out["sysVar"])
+        values = {
+            "predObs": predObs,
+            "predObsVar": predObsVar,
+            "noiseVar": noiseVar,
+            "obs": predObs + predSysVarF / (predSysVarF + 1.0) * err,
+            "obsVar": (predSysVarF - predSysVarF * predSysVarF / (predSysVarF + 1.0))
+            * noiseVar
+            + noiseVar,
+        }
+        if self.fused:
+            for name in values:
+                buffers[name][0, 0] = values[name]
+            arrays = buffers
+        else:
+            arrays = {name: np.array(values[name], ndmin=2) for name in values}
+        prediction.obs = arrays["predObs"]
+        prediction.obsVar = arrays["predObsVar"]
+        model.noiseVar = arrays["noiseVar"]
+        model.obs = arrays["obs"]
+        model.obsVar = arrays["obsVar"]
+
+    def _setTransitionStructure(self):
+        """Set the blocks and the permutation used by _propagate from the
+        index and the transitionType. _transitionBlocks is None if the
+        structure is unknown or the model is too small to benefit from the
+        block by block propagation.
+
+        """
+        self._transitionBlocks = None
+        self._permutation = None
+        self._covPermutation = None
+        if self.index is None or self.transitionType is None:
+            return
+        d = max(indx[1] + 1 for indx in self.index.values())
+        if d < self._minStructuredDim:
+            return
+
+        # the trend and dense blocks are applied one by one, the shift blocks
+        # are merged into one permutation of the latent states.
+        blocks = []
+        permutation = np.arange(d)
+        for name in self.transitionType:
+            start, end = self.index[name][0], self.index[name][1] + 1
+            if self.transitionType[name] == "shift":
+                permutation[start:end] = np.roll(permutation[start:end], -1)
+            elif self.transitionType[name] != "identity":
+                blocks.append((start, end, self.transitionType[name]))
+
+        self._transitionBlocks = blocks
+        if np.any(permutation != np.arange(d)):
+            self._permutation = permutation
+            self._covPermutation = (
+                permutation[:, np.newaxis] * d + permutation[np.newaxis, :]
+            ).ravel()
 
     # The backward smoother for a given unsmoothed states at time t
     # what model should store:
@@ -205,7 +864,7 @@ class kalmanFilter:
     #      model.prediction.state: the predicted state for time t + 1
     #      rawState: the unsmoothed state at time t
     #      rawSysVar: the unsmoothed system variance at time t
-    def backwardSmoother(self, model, rawState, rawSysVar):
+    def backwardSmoother(self, model, rawState, rawSysVar, gain=None):
         """The backwardSmoother for one step backward smoothing
 
         Args:
@@ -221,6 +880,9 @@ class kalmanFilter:
                  rawSysVar: the unsmoothed system variance at time t
             rawState: the filtered state at the current time stamp
             rawSysVar: the filtered systematic covariance at the current time stamp
+            gain: the smoothing gain at the current time stamp, which is
+                  computed from rawSysVar and model.prediction.sysVar when
+                  not given, see _smoothingGain.
 
         Returns:
             The smoothed results are stored in the 'model' replacing the filtered result.
@@ -230,13 +892,11 @@ class kalmanFilter:
         # if dealWithMissingEvaluation:
         #    loc = self._modifyTransitionAccordingToMissingValue(model)
 
-        #### use generalized inverse to ensure the computation stability #######
-
-        predSysVarInv = self._gInverse(model.prediction.sysVar)
-
-        ################################################
-
-        backward = np.dot(np.dot(rawSysVar, model.transition.T), predSysVarInv)
+        backward = gain
+        if backward is None:
+            backward = self._smoothingGain(
+                model.transition, rawSysVar, model.prediction.sysVar
+            )
         model.state = rawState + np.dot(
             backward, (model.state - model.prediction.state)
         )
@@ -273,13 +933,9 @@ class kalmanFilter:
         Returns:
             The sampled results are stored in the 'model' replacing the filtered result.
         """
-        #### use generalized inverse to ensure the computation stability #######
-
-        predSysVarInv = self._gInverse(model.prediction.sysVar)
-
-        ################################################
-
-        backward = np.dot(np.dot(rawSysVar, model.transition.T), predSysVarInv)
+        backward = self._smoothingGain(
+            model.transition, rawSysVar, model.prediction.sysVar
+        )
         model.state = rawState + np.dot(
             backward, (model.state - model.prediction.state)
         )
@@ -294,6 +950,54 @@ class kalmanFilter:
         )
         model.obs = np.random.multivariate_normal(model.obs.A1, model.obsVar).T
 
+    def backwardSampleBatch(self, model, samples, rawState, rawSysVar, rng, gain=None):
+        """Draw the states at time t for many sampled paths at once, given
+        their sampled states at time t + 1 (forward filtering backward
+        sampling). The conditional covariance is the same for all the paths,
+        so it is factored once and all the paths are drawn by one matrix
+        product.
+
+        Args:
+            model: the @baseModel used for backward sampling, the model shall store
+                 the following information
+                 model.transition: the transition at time t + 1
+                 model.prediction.sysVar: the predicted system variance for time t + 1
+                 model.prediction.state: the predicted state for time t + 1
+            samples: a K x d array of the sampled states at time t + 1
+            rawState: the filtered state at the current time stamp
+            rawSysVar: the filtered systematic covariance at the current time stamp
+            rng: the numpy.random.Generator to draw from
+            gain: the smoothing gain at the current time stamp, see
+                  backwardSmoother.
+
+        Returns:
+            A K x d array of the sampled states at the current time stamp.
+        """
+        backward = gain
+        if backward is None:
+            backward = self._smoothingGain(
+                model.transition, rawSysVar, model.prediction.sysVar
+            )
+        mean = rawState.T + np.dot(samples - model.prediction.state.T, backward.T)
+        sysVar = rawSysVar - np.dot(
+            np.dot(backward, model.prediction.sysVar), backward.T
+        )
+        noise = rng.standard_normal(samples.shape)
+        return mean + np.dot(noise, self._covFactor(sysVar).T)
+
+    def _covFactor(self, A):
+        """A factor L of the covariance A = L * L'. The Cholesky factor when A
+        is positive definite, otherwise the factor from the eigen
+        decomposition with the negative eigenvalues (rounding errors of a
+        rank deficient A) set to zero.
+
+        """
+        try:
+            return np.linalg.cholesky(A)
+        except np.linalg.LinAlgError:
+            values, vectors = np.linalg.eigh((A + A.T) / 2)
+            return vectors * np.sqrt(np.maximum(values, 0.0))
+
     # for updating the discounting factor
     def updateDiscount(self, newDiscount):
         """For updating the discounting factor
@@ -303,7 +1007,9 @@ class kalmanFilter:
         """
 
         self.__checkDiscount__(newDiscount)
-        self.discount = np.diag(1 / np.sqrt(newDiscount))
+        self.discount = np.array(newDiscount, dtype=float)
+        self._setInnovationScale()
+        self.resetSteadyState()
 
     def __checkDiscount__(self, discount):
         """Check whether the discount fact is within (0, 1)"""
@@ -314,31 +1020,94 @@ class kalmanFilter:
 
     # update the innovation
     def __updateInnovation__(self, model):
-        """update the innovation matrix of the model"""
+        """update the innovation matrix of the model. With the discount vector
+        delta, the innovation is D P D - P for D = diag(1 / sqrt(delta)), which
+        is P scaled element-wise by the precomputed _innovationScale. The
+        innovation matrix of the model is reused when it has the right shape.
 
-        model.innovation = (
-            np.dot(np.dot(self.discount, model.prediction.sysVar), self.discount)
-            - model.prediction.sysVar
-        )
+        """
+        sysVar = model.prediction.sysVar
+        if (
+            model.innovation is None
+            or model.innovation.shape != sysVar.shape
+            or model.innovation.dtype != sysVar.dtype
+        ):
+            model.innovation = np.empty(sysVar.shape)
+        np.multiply(sysVar, self._innovationScale, out=model.innovation)
+
+    def _setInnovationScale(self):
+        """Compute the element-wise scale that turns the predicted covariance
+        into the innovation, i.e., s s' - 1 for s = 1 / sqrt(discount). For the
+        'component' type, the innovation is only added on the block diagonals
+        (each component independently), so the off block diagonal entries are
+        zero. For other types, the innovation of the model is used as is.
 
-    # update the innovation
-    def __updateInnovation2__(self, model):
-        """update the innovation matrix of the model, but only for component
-        indepdently. (i.e., only add innovation to block diagonals, not on off
-        block diagonals)
+        """
+        if self.updateInnovation not in ("whole", "component"):
+            self._innovationScale = None
+            return
+        self._innovationScale = self._discountScale(self.discount)
+
+    def _discountScale(self, discount):
+        """The element-wise scale s s' - 1 for s = 1 / sqrt(discount), with the
+        entries outside of _innovationMask set to zero. discount could also be
+        a stack of discount vectors, one scale is then given for each.
 
         """
+        s = 1 / np.sqrt(discount)
+        scale = s[..., :, np.newaxis] * s[..., np.newaxis, :] - 1
+        return np.where(self._innovationMask(scale.shape[-1]), scale, 0.0)
 
-        innovation = (
-            np.dot(np.dot(self.discount, model.prediction.sysVar), self.discount)
-            - model.prediction.sysVar
-        )
-        model.innovation = np.zeros(innovation.shape)
+    def _innovationMask(self, d):
+        """The entries of the covariance that receive the innovation, i.e.,
+        the block diagonals for the 'component' type and all entries
+        otherwise.
+
+        """
+        if self.updateInnovation != "component":
+            return np.ones((d, d), dtype=bool)
+        mask = np.zeros((d, d), dtype=bool)
         for name in self.index:
             indx = self.index[name]
-            model.innovation[indx[0] : (indx[1] + 1), indx[0] : (indx[1] + 1)] = (
-                innovation[indx[0] : (indx[1] + 1), indx[0] : (indx[1] + 1)]
-            )
+            mask[indx[0] : (indx[1] + 1), indx[0] : (indx[1] + 1)] = True
+        return mask
+
+    def _smoothingGain(self, transition, rawSysVar, predSysVar):
+        """The smoothing gain rawSysVar * transition' * predSysVar^{-1}.
+
+        With factorizedSmoother, the gain is solved from the predicted
+        covariance, which is symmetric, i.e., the gain is the transpose of
+        predSysVar^{-1} * transition * rawSysVar. The Cholesky factorization
+        checks that predSysVar is numerically positive definite, otherwise,
+        e.g., for a rank deficient predSysVar, the generalized inverse is used
+        to ensure the computation stability.
+
+        """
+        if self.factorizedSmoother:
+            lower = self._choleskyFactor(predSysVar)
+            if lower is not None:
+                rhs = np.dot(transition, rawSysVar)
+                if cho_solve is None:
+                    # numpy can not solve with the triangular factor
+                    return np.linalg.solve(predSysVar, rhs).T
+                return cho_solve((lower, True), rhs, check_finite=False).T
+        return np.dot(np.dot(rawSysVar, transition.T), self._gInverse(predSysVar))
+
+    def _choleskyFactor(self, A):
+        """The lower Cholesky factor of the symmetric matrix A, or None when A
+        is not numerically positive definite. The pivots (the squared
+        diagonal of the factor) have to be above the rank tolerance of
+        np.linalg.matrix_rank.
+
+        """
+        try:
+            lower = np.linalg.cholesky(A)
+        except np.linalg.LinAlgError:
+            return None
+        pivots = np.diagonal(lower) ** 2
+        if pivots.min() > pivots.max() * A.shape[0] * np.finfo(float).eps:
+            return lower
+        return None
 
     # a generalized inverse of matrix A
     def _gInverse(self, A):
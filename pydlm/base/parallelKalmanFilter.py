@@ -0,0 +1,595 @@
+"""
+===============================================
+
+Parallel-in-time Kalman filter and smoother
+
+===============================================
+
+This module runs the forward filter and the backward smoother of @kalmanFilter
+on one long series, splitting the time axis into chunks. It follows the
+parallel scan formulation of the Kalman filter and the RTS smoother (Sarkka and
+Garcia-Fernandez, 2021): each chunk is summarized by an affine map from the
+status at its start to the status at its end, the summaries are combined by an
+associative operator to get the status at every chunk boundary, and each chunk
+is then filtered from its boundary. The chunks are stepped through together, so
+that each step is one batched numpy operation over all chunks instead of a
+Python loop over the dates. The chunks are split into blocks of consecutive
+chunks for the thread pool, which gains from the numpy operations releasing the
+GIL.
+
+With the discount innovation, the predicted covariance is D G C G' D for
+D = diag(1 / sqrt(discount)), i.e., a model with transition D G and no innovation.
+This is not the case for the 'component' innovation of a model with more than
+one component with discount < 1, which is the default of `dlm`, so such a model
+needs `dlm.evolveMode('dependent')`, i.e., the 'whole' innovation, to be
+filtered in parallel. The covariances relative to the noise variance and the
+gains do not depend on the data, so they are scanned first. The states then
+follow an affine recursion given the gains, and the noise variance a scalar
+one. The filtered and smoothed quantities are the same as `dlm.fit()`.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+from pydlm.base.kalmanFilter import kalmanFilter
+
+
+class parallelKalmanFilter:
+    """The parallelKalmanFilter class filters and smooths one long series with
+    the time axis split into chunks.
+
+    Attributes:
+        builder: the @builder which provides the components, the transition,
+                 the priors and the discount factors.
+        updateInnovation: the innovation type, 'whole' or 'component', same as
+                          in @kalmanFilter. The chunks can only be summarized
+                          when the innovation is the same as 'whole', i.e.,
+                          for 'whole' or a model with one component.
+        noise: the prior guess of the observation noise.
+        workers: the number of threads, each runs one block of consecutive
+                 chunks. Default to the number of cpus.
+        chunks: the number of chunks. Default to about the square root of
+                the length of the series, and at least the workers.
+        factorizedSmoother: indicate whether the smoothing gain is solved by a
+                            Cholesky factorization, see @kalmanFilter.
+
+    Methods:
+        forwardFilter: run the forward filter on a series.
+        supports: check whether the forward filter supports the model and a
+                  series.
+        backwardSmoother: run the backward smoother on the filtered result.
+
+    Example:
+        >>> from pydlm.modeler.builder import builder
+        >>> template = builder() + trend(degree=1) + seasonality(period=7)
+        >>> parallelFilter = parallelKalmanFilter(template, workers=8)
+        >>> result = parallelFilter.forwardFilter(data)
+        >>> parallelFilter.backwardSmoother(result)
+        >>> result.smoothedObs  # n
+    """
+
+    def __init__(
+        self,
+        builder,
+        updateInnovation="whole",
+        noise=1.0,
+        workers=None,
+        chunks=None,
+        factorizedSmoother=False,
+    ):
+        self.builder = builder
+        self.updateInnovation = updateInnovation
+        self.noise = noise
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.chunks = chunks
+        self.factorizedSmoother = factorizedSmoother
+
+    # an inner class to store all results
+    class _result(object):
+        """Class to store the results. All quantities carry the time on the
+        first axis.
+
+        """
+
+        records = [
+            "filteredObs",
+            "predictedObs",
+            "smoothedObs",
+            "filteredObsVar",
+            "predictedObsVar",
+            "smoothedObsVar",
+            "noiseVar",
+            "df",
+            "filteredState",
+            "predictedState",
+            "smoothedState",
+            "filteredCov",
+            "predictedCov",
+            "smoothedCov",
+        ]
+
+        def __init__(self, n, d):
+            for variable in self.records:
+                if variable.endswith("State"):
+                    setattr(self, variable, np.zeros((n, d)))
+                elif variable.endswith("Cov"):
+                    setattr(self, variable, np.zeros((n, d, d)))
+                else:
+                    setattr(self, variable, np.zeros(n))
+
+            # the evaluation of each date
+            self.evaluation = None
+            # the location of each component in the latent states
+            self.componentIndex = None
+
+    def supports(self, data):
+        """Check whether forwardFilter supports the model and the series.
+        The 'component' innovation is only supported when it is the same as
+        'whole', and autoReg is not supported with missing data.
+
+        Args:
+            data: a list or 1d array of the time series.
+
+        Returns:
+            True if forwardFilter can filter the series.
+        """
+        if not self._innovationSupported():
+            return False
+        missing = any(x is None or np.isnan(x) for x in data)
+        return not (missing and self._hasAutoReg())
+
+    def forwardFilter(self, data):
+        """Run the forward filter on a series
+
+        Args:
+            data: a list or 1d array of the time series. Missing values can be
+                  supplied as None or nan.
+
+        Returns:
+            A @_result object storing the filtered results.
+        """
+        y = np.array([np.nan if x is None else x for x in data], dtype=float)
+        if y.ndim != 1:
+            raise ValueError("data must be a 1d series.")
+        n = len(y)
+        observed = ~np.isnan(y)
+
+        builder = self.builder
+        if not builder.initialized:
+            builder.initialize(noise=self.noise)
+        transition = builder.model.transition
+        d = transition.shape[0]
+        scale = self._transitionScale()
+        evaluation = self._evaluation(y, observed)
+
+        # the transition of the covariance, the innovation is only added when
+        # the previous date is observed, same as @kalmanFilter
+        fresh = np.concatenate(([True], observed[:-1]))
+        covTransition = [scale[:, np.newaxis] * transition, transition]
+
+        result = self._result(n, d)
+        result.evaluation = evaluation
+        result.componentIndex = dict(builder.componentIndex)
+        noiseVar = float(self.noise)
+        bounds = self._bounds(n)
+        # the missing data do not enter the recursions, they are zeroed so
+        # that the batched updates can be multiplied by the indicator
+        yFilled = np.where(observed, y, 0.0)
+
+        # scan the covariances relative to the noise variance
+        def _covSummary(chunks):
+            return self._covSummary(
+                bounds, chunks, covTransition, fresh, observed, evaluation
+            )
+
+        summaries = self._map(_covSummary, len(bounds) - 2)
+        start = [np.array(builder.sysVarPrior, dtype=float) / noiseVar]
+        for c in range(len(bounds) - 2):
+            summary = tuple(variable[c] for variable in summaries)
+            start.append(self._applyCovSummary(summary, start[-1]))
+
+        # filter the covariances from the boundaries, and scan the states
+        # with the gains
+        predCov = np.zeros((n, d, d))
+        filtCov = np.zeros((n, d, d))
+        gain = np.zeros((n, d))
+        predObsVar = np.zeros(n)
+        filtObsVar = np.zeros(n)
+
+        def _stateSummary(chunks):
+            return self._filterCov(
+                bounds,
+                chunks,
+                np.array(start)[chunks],
+                covTransition,
+                fresh,
+                observed,
+                evaluation,
+                yFilled,
+                transition,
+                (predCov, filtCov, gain, predObsVar, filtObsVar),
+            )
+
+        summaries = self._map(_stateSummary, len(bounds) - 1)
+        state = [np.array(builder.statePrior, dtype=float)[:, 0]]
+        for c in range(len(bounds) - 1):
+            state.append(np.dot(summaries[0][c], state[-1]) + summaries[1][c])
+
+        # filter the states from the boundaries
+        def _filterState(chunks):
+            m = np.array(state)[chunks]
+            for t, valid in self._lockstep(bounds, chunks):
+                a = np.dot(m, transition.T)
+                predObs = np.einsum("bd,bd->b", evaluation[t], a)
+                m = np.where(
+                    valid[:, np.newaxis],
+                    a + gain[t] * (yFilled[t] - predObs)[:, np.newaxis],
+                    m,
+                )
+                t = t[valid]
+                result.predictedState[t] = a[valid]
+                result.predictedObs[t] = predObs[valid]
+                result.filteredState[t] = m[valid]
+                result.filteredObs[t] = np.einsum("bd,bd->b", evaluation[t], m[valid])
+
+        self._map(_filterState, len(bounds) - 1)
+
+        # the noise variance and the degree of freedom
+        df = builder.initialDegreeFreedom
+        lastNoiseVar = np.zeros(n)
+        for t in range(n):
+            lastNoiseVar[t] = noiseVar
+            if observed[t]:
+                df += 1
+                err = y[t] - result.predictedObs[t]
+                noiseVar = noiseVar * (1.0 - 1.0 / df) + err * err / df / predObsVar[t]
+            result.noiseVar[t] = noiseVar
+            result.df[t] = df
+
+        result.predictedCov[:] = lastNoiseVar[:, np.newaxis, np.newaxis] * predCov
+        result.filteredCov[:] = result.noiseVar[:, np.newaxis, np.newaxis] * filtCov
+        result.predictedObsVar[:] = lastNoiseVar * predObsVar
+        result.filteredObsVar[:] = result.noiseVar * (filtObsVar + 1.0)
+        return result
+
+    def backwardSmoother(self, result):
+        """Run the backward smoother on the filtered result from the last date
+
+        Args:
+            result: the @_result returned by forwardFilter, the smoothed
+                    results are stored in it.
+        """
+        transition = self.builder.model.transition
+        n, d = result.filteredState.shape
+        last = n - 1
+        result.smoothedState[last] = result.filteredState[last]
+        result.smoothedCov[last] = result.filteredCov[last]
+        result.smoothedObs[last] = result.filteredObs[last]
+        result.smoothedObsVar[last] = result.filteredObsVar[last]
+        if n == 1:
+            return None
+
+        # the smoothing gains and the backward maps of the dates, the smoothed
+        # status of date t is B S B' + N given the smoothed status S of t + 1
+        Filter = self._filter()
+        backward = np.zeros((last, d, d))
+        stateShift = np.zeros((last, d))
+        covShift = np.zeros((last, d, d))
+        bounds = self._bounds(last)
+
+        def _gain(chunks):
+            steps = slice(bounds[chunks[0]], bounds[chunks[-1] + 1])
+            nextSteps = slice(steps.start + 1, steps.stop + 1)
+            B = self._smoothingGains(
+                Filter,
+                transition,
+                result.filteredCov[steps],
+                result.predictedCov[nextSteps],
+            )
+            backward[steps] = B
+            stateShift[steps] = result.filteredState[steps] - np.einsum(
+                "bde,be->bd", B, result.predictedState[nextSteps]
+            )
+            covShift[steps] = result.filteredCov[steps] - np.matmul(
+                np.matmul(B, result.predictedCov[nextSteps]), B.transpose(0, 2, 1)
+            )
+
+            # the summaries of the chunks from their ends to their starts
+            M = np.repeat(np.eye(d)[np.newaxis], len(chunks), axis=0)
+            m = np.zeros((len(chunks), d))
+            N = np.zeros((len(chunks), d, d))
+            for t, valid in self._lockstep(bounds, chunks, reverse=True):
+                Bt = backward[t]
+                M, m, N = (
+                    np.where(valid[:, np.newaxis, np.newaxis], np.matmul(Bt, M), M),
+                    np.where(
+                        valid[:, np.newaxis],
+                        np.einsum("bde,be->bd", Bt, m) + stateShift[t],
+                        m,
+                    ),
+                    np.where(
+                        valid[:, np.newaxis, np.newaxis],
+                        np.matmul(np.matmul(Bt, N), Bt.transpose(0, 2, 1))
+                        + covShift[t],
+                        N,
+                    ),
+                )
+            return M, m, N
+
+        summaries = self._map(_gain, len(bounds) - 1)
+        state = [None] * len(bounds)
+        cov = [None] * len(bounds)
+        state[-1] = result.smoothedState[last]
+        cov[-1] = result.smoothedCov[last]
+        for c in range(len(bounds) - 2, -1, -1):
+            M, m, N = (variable[c] for variable in summaries)
+            state[c] = np.dot(M, state[c + 1]) + m
+            cov[c] = np.dot(np.dot(M, cov[c + 1]), M.T) + N
+
+        # smooth the dates from the boundaries
+        noiseVar = result.noiseVar[last]
+
+        def _smooth(chunks):
+            s = np.array(state)[chunks + 1]
+            S = np.array(cov)[chunks + 1]
+            for t, valid in self._lockstep(bounds, chunks, reverse=True):
+                Bt = backward[t]
+                s = np.where(
+                    valid[:, np.newaxis],
+                    np.einsum("bde,be->bd", Bt, s) + stateShift[t],
+                    s,
+                )
+                S = np.where(
+                    valid[:, np.newaxis, np.newaxis],
+                    np.matmul(np.matmul(Bt, S), Bt.transpose(0, 2, 1)) + covShift[t],
+                    S,
+                )
+                t = t[valid]
+                F = result.evaluation[t]
+                result.smoothedState[t] = s[valid]
+                result.smoothedCov[t] = S[valid]
+                result.smoothedObs[t] = np.einsum("bd,bd->b", F, s[valid])
+                result.smoothedObsVar[t] = (
+                    np.einsum("bd,bde,be->b", F, S[valid], F) + noiseVar
+                )
+
+        self._map(_smooth, len(bounds) - 1)
+
+    def _covSummary(self, bounds, chunks, covTransition, fresh, observed, evaluation):
+        """Summarize the covariance recursion over each of the chunks by
+        (A, C, J), so that the covariance after the chunk is
+        A (I + C0 J)^{-1} C0 A' + C for the covariance C0 before the chunk.
+        Each step has the transition A_t, no innovation and the information
+        J_t = u u' for u = A_t' F', which is a rank one update of the summary.
+        The chunks are updated together, one step at a time.
+
+        """
+        d = covTransition[1].shape[0]
+        A = np.repeat(np.eye(d)[np.newaxis], len(chunks), axis=0)
+        C = np.zeros((len(chunks), d, d))
+        J = np.zeros((len(chunks), d, d))
+        for t, valid in self._lockstep(bounds, chunks):
+            At = np.where(
+                fresh[t][:, np.newaxis, np.newaxis], covTransition[0], covTransition[1]
+            )
+            u = np.einsum("bd,bde->be", evaluation[t], At)
+            w = np.einsum("bde,be->bd", C, u)
+            Au = np.einsum("bd,bde->be", u, A)
+            # the missing dates bring no information
+            z = (observed[t] / (1.0 + np.einsum("bd,bd->b", u, w)))[
+                :, np.newaxis, np.newaxis
+            ]
+            newA = np.matmul(At, A - z * w[:, :, np.newaxis] * Au[:, np.newaxis, :])
+            newC = np.matmul(
+                np.matmul(At, C - z * w[:, :, np.newaxis] * w[:, np.newaxis, :]),
+                At.transpose(0, 2, 1),
+            )
+            newJ = J + z * Au[:, :, np.newaxis] * Au[:, np.newaxis, :]
+            valid = valid[:, np.newaxis, np.newaxis]
+            A = np.where(valid, newA, A)
+            C = np.where(valid, newC, C)
+            J = np.where(valid, newJ, J)
+        return A, C, J
+
+    def _applyCovSummary(self, summary, cov):
+        """Apply the summary of _covSummary to the covariance before the steps"""
+        A, C, J = summary
+        d = cov.shape[0]
+        return (
+            np.dot(np.dot(A, np.linalg.solve(np.eye(d) + np.dot(cov, J), cov)), A.T) + C
+        )
+
+    def _filterCov(
+        self,
+        bounds,
+        chunks,
+        cov,
+        covTransition,
+        fresh,
+        observed,
+        evaluation,
+        y,
+        transition,
+        out,
+    ):
+        """Filter the covariances relative to the noise variance over each of
+        the chunks from the covariance before the chunk, and summarize the
+        state recursion m_t = (G - K_t F_t G) m_{t - 1} + K_t y_t over the
+        chunk by (M, c), so that the state after the chunk is M m0 + c. The
+        missing data in y have to be zeroed.
+
+        """
+        predCov, filtCov, gain, predObsVar, filtObsVar = out
+        d = cov.shape[1]
+        M = np.repeat(np.eye(d)[np.newaxis], len(chunks), axis=0)
+        c = np.zeros((len(chunks), d))
+        for t, valid in self._lockstep(bounds, chunks):
+            At = np.where(
+                fresh[t][:, np.newaxis, np.newaxis], covTransition[0], covTransition[1]
+            )
+            F = evaluation[t]
+            P = np.matmul(np.matmul(At, cov), At.transpose(0, 2, 1))
+            PF = np.einsum("bde,be->bd", P, F)
+            q = np.einsum("bd,bd->b", F, PF) + 1.0
+            GM = np.matmul(transition, M)
+            Gc = np.dot(c, transition.T)
+            # K K' q = P F' F P / q keeps the covariance symmetric, the
+            # missing dates have no gain
+            z = observed[t] / q
+            K = z[:, np.newaxis] * PF
+            newCov = P - z[:, np.newaxis, np.newaxis] * (
+                PF[:, :, np.newaxis] * PF[:, np.newaxis, :]
+            )
+            newM = (
+                GM
+                - K[:, :, np.newaxis] * np.einsum("bd,bde->be", F, GM)[:, np.newaxis, :]
+            )
+            newC = Gc + K * (y[t] - np.einsum("bd,bd->b", F, Gc))[:, np.newaxis]
+            cov = np.where(valid[:, np.newaxis, np.newaxis], newCov, cov)
+            M = np.where(valid[:, np.newaxis, np.newaxis], newM, M)
+            c = np.where(valid[:, np.newaxis], newC, c)
+
+            t, F = t[valid], F[valid]
+            predCov[t] = P[valid]
+            predObsVar[t] = q[valid]
+            filtCov[t] = cov[valid]
+            gain[t] = K[valid]
+            filtObsVar[t] = np.einsum("bd,bde,be->b", F, cov[valid], F)
+        return M, c
+
+    def _evaluation(self, y, observed):
+        """The n x d evaluations of all dates"""
+        builder = self.builder
+        n = len(y)
+        evaluation = np.repeat(
+            np.array(builder.model.evaluation, dtype=float), n, axis=0
+        )
+        if (
+            len(builder.dynamicComponents) == 0
+            and len(builder.automaticComponents) == 0
+        ):
+            return evaluation
+
+        # the autoReg features are the previous observations, which are
+        # padded by the filtered results when missing
+        if self._hasAutoReg() and not observed.all():
+            raise ValueError(
+                "The parallel filter does not support autoReg with missing data."
+            )
+        padded = y.tolist()
+        for step in range(n):
+            builder.updateEvaluation(step, padded)
+            evaluation[step] = builder.model.evaluation[0]
+        return evaluation
+
+    def _transitionScale(self):
+        """The diagonal scale D of the covariance transition D G. The chunks
+        can only be summarized when the innovation is D G C G' D - G C G', so
+        the 'component' innovation is only supported when it is the same as
+        'whole'.
+
+        """
+        if self.updateInnovation not in ("whole", "component"):
+            raise ValueError("The innovation type must be 'whole' or 'component'.")
+        if not self._innovationSupported():
+            raise ValueError(
+                "The parallel filter needs the 'whole' innovation when "
+                "there are more than one component with discount < 1."
+            )
+        return 1 / np.sqrt(np.array(self.builder.discount, dtype=float))
+
+    def _innovationSupported(self):
+        """Check whether the innovation is the same as 'whole'"""
+        if self.updateInnovation not in ("whole", "component"):
+            return False
+        whole = kalmanFilter(discount=self.builder.discount)._innovationScale
+        return np.array_equal(self._filter()._innovationScale, whole)
+
+    def _filter(self):
+        """The @kalmanFilter of the model, which provides the innovation and
+        the smoothing gain
+
+        """
+        return kalmanFilter(
+            discount=self.builder.discount,
+            updateInnovation=self.updateInnovation,
+            index=self.builder.componentIndex,
+            factorizedSmoother=self.factorizedSmoother,
+        )
+
+    def _hasAutoReg(self):
+        """Check whether the model has an autoReg component"""
+        return any(
+            comp.componentType == "autoReg"
+            for comp in self.builder.automaticComponents.values()
+        )
+
+    def _bounds(self, n):
+        """The boundaries of the chunks over n steps. Default to about sqrt(n)
+        chunks, which balances the steps within a chunk against the chunks
+        that are combined one after another.
+
+        """
+        chunks = self.chunks
+        if chunks is None:
+            chunks = max(int(np.sqrt(n)), self.workers)
+        chunks = max(min(chunks, n), 1)
+        return np.linspace(0, n, chunks + 1).astype(int).tolist()
+
+    def _lockstep(self, bounds, chunks, reverse=False):
+        """Iterate over the steps of the chunks together. Each iteration gives
+        the date of each chunk and whether the chunk still has the date, as
+        the chunks may differ in length by one.
+
+        """
+        starts = np.array(bounds)[chunks]
+        ends = np.array(bounds)[chunks + 1]
+        for k in range(int(np.max(ends - starts))):
+            if reverse:
+                t = ends - 1 - k
+                valid = t >= starts
+            else:
+                t = starts + k
+                valid = t < ends
+            yield np.clip(t, starts, ends - 1), valid
+
+    def _map(self, func, count):
+        """Map func over the blocks of consecutive chunks out of count chunks,
+        one block per worker, in the thread pool. Returns the outputs of the
+        blocks concatenated over the chunks.
+
+        """
+        blocks = [
+            block
+            for block in np.array_split(np.arange(count), self.workers)
+            if len(block) > 0
+        ]
+        if len(blocks) <= 1:
+            outputs = list(map(func, blocks))
+        else:
+            with ThreadPoolExecutor(max_workers=len(blocks)) as pool:
+                outputs = list(pool.map(func, blocks))
+        if len(outputs) == 0 or outputs[0] is None:
+            return None
+        return tuple(
+            np.concatenate([output[k] for output in outputs])
+            for k in range(len(outputs[0]))
+        )
+
+    def _smoothingGains(self, Filter, transition, rawSysVar, predSysVar):
+        """The smoothing gains of many dates, see @kalmanFilter._smoothingGain.
+        The generalized inverses are taken at once.
+
+        """
+        if self.factorizedSmoother:
+            return np.array(
+                [
+                    Filter._smoothingGain(transition, raw, pred)
+                    for raw, pred in zip(rawSysVar, predSysVar)
+                ]
+            )
+        return np.matmul(
+            np.matmul(rawSysVar, transition.T), Filter._gInverse(predSysVar)
+        )
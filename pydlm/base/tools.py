@@ -1,4 +1,6 @@
+import functools
 import math
+import numpy as np
 
 
 def isPandasObject(data):
@@ -51,6 +53,42 @@ def duplicateList(aList):
     return aList
 
 
+# the log density of the one-day ahead predictive distribution
+def studentLogDensity(err, var, df):
+    """The log density of the prediction error err under the Student t
+    distribution with df degrees of freedom and scale var, which is the one-day
+    ahead predictive distribution of the dlm with the unknown noise variance.
+    err is either a python scalar (so are var and df) or an array, with var
+    and df of the same shape. The density is nan when the variance is not
+    positive, which happens when the filter breaks down numerically.
+
+    """
+    if not isinstance(err, np.ndarray):
+        if not var > 0:
+            return math.nan
+        return (
+            _logGammaRatio(df)
+            - 0.5 * math.log(df * math.pi * var)
+            - (df + 1) / 2.0 * math.log1p(err * err / df / var)
+        )
+
+    err, var, df = np.broadcast_arrays(*map(np.asarray, (err, var, df)))
+    # the degrees of freedom take few distinct values
+    values, inverse = np.unique(df, return_inverse=True)
+    logGamma = np.array([_logGammaRatio(v) for v in values])
+    with np.errstate(invalid="ignore"):
+        return (
+            logGamma[inverse.reshape(df.shape)]
+            - 0.5 * np.log(df * math.pi * var)
+            - (df + 1) / 2.0 * np.log1p(err * err / df / var)
+        )
+
+
+@functools.lru_cache(maxsize=4096)
+def _logGammaRatio(df):
+    return math.lgamma((df + 1) / 2.0) - math.lgamma(df / 2.0)
+
+
 # inverse normal cdf function
 def rational_approximation(t):
     # Abramowitz and Stegun formula 26.2.23.
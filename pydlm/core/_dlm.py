@@ -11,11 +11,16 @@ It provides the basic modeling, filtering, forecasting and smoothing of a dlm.
 """
 
 from pydlm.base.kalmanFilter import kalmanFilter
+from pydlm.base.parallelKalmanFilter import parallelKalmanFilter
 import pydlm.base.tools as tl
 from pydlm.modeler.builder import builder
 
+from copy import deepcopy
+import numpy as np
 from numpy import var
+import json
 import logging
+import os
 
 # this class defines the basic functionalities for dlm, which is not supposed
 # to be used by the user. Most functionality in the main dlm will be
@@ -54,6 +59,7 @@ class _dlm(object):
         _result: a class to store the results
         _copy: copy the result from the model to the _result class
         _reverseCopy: copy the result from the _result class to the model
+        _isMissing: check whether the data of a filtered date was missing
         _checkFeatureSize: check whether the features's n matches the data's n
         _checkComponent: check whether a component is in dlm
         _checkPlotOptions: set the correct options according to the fit
@@ -97,6 +103,42 @@ class _dlm(object):
             # Stable mode is basically doing rolling window refitting. Use with caution.
             self.stable = kwargs.get("stable", False)
             self.innovationType = kwargs.get("component", "component")
+            # Run the forward filter with the fused kernel that reuses its work
+            # buffers. The results are copied into the result store.
+            self.fused = kwargs.get("fused", False)
+            # Freeze the covariances and the gain of the filter once they have
+            # converged, see @kalmanFilter. Only has effect on models whose
+            # evaluation does not change, e.g., trend and seasonality. The
+            # result still keeps a full covariance for every date, so lower
+            # covRetention as well to save the memory.
+            self.steadyState = kwargs.get("steadyState", False)
+            # The relative change of the gain and the covariance below which
+            # the steady state is taken to be reached.
+            self.steadyStateTol = kwargs.get("steadyStateTol", 1e-6)
+            # Solve the smoothing gain by a Cholesky factorization instead of
+            # the generalized inverse, see @kalmanFilter.
+            self.factorizedSmoother = kwargs.get("factorizedSmoother", False)
+            # How much of the latent covariance is kept in the result: 'full',
+            # 'smoother', 'diagonal', 'none' or 'checkpoint', see @_result.
+            self.covRetention = kwargs.get("covRetention", "full")
+            # The number of dates between two checkpoints for 'checkpoint'.
+            # Default to sqrt(n).
+            self.checkpointInterval = kwargs.get("checkpointInterval", None)
+            # Keep the smoothing gains computed by the backward smoother for
+            # later smoother runs, see @_result.
+            self.cacheSmootherGain = kwargs.get("cacheSmootherGain", False)
+            # The number of the last dates smoothed again on each update under
+            # the fixed-lag mode, None for smoothing the whole history.
+            self.smootherLag = kwargs.get("smootherLag", None)
+            # The number of threads to fit the whole series with the parallel
+            # in time filter and smoother, see @parallelKalmanFilter. None for
+            # the sequential filter. The parallel filter needs the 'whole'
+            # innovation for more than one discounted component, otherwise
+            # the series is filtered sequentially with a warning.
+            self.workers = kwargs.get("workers", None)
+            # The directory to keep the result in memory mapped files instead
+            # of the memory, see @_result.
+            self.resultDir = kwargs.get("resultDir", None)
 
             self.plotOriginalData = kwargs.get("plotOriginalData", True)
             self.plotFilteredData = kwargs.get("plotFilteredData", True)
@@ -125,7 +167,50 @@ class _dlm(object):
 
     # an inner class to store all results
     class _result(object):
-        """Class to store the results"""
+        """Class to store the results. Each record is a contiguous array with
+        the time on the first axis, i.e., n x 1 x 1 for the observations and
+        the variances, n x d x 1 for the states, n x d x d for the covariances
+        and n for the degree of freedom. The records are views of larger
+        buffers, which grow by doubling when new data is appended. Entries
+        that have not been computed are nan.
+
+        How much of the covariances is kept is set by covRetention:
+            'full': the full covariances (n x d x d) of all records.
+            'smoother': the full filteredCov and predictedCov, which the
+                        backward smoother needs, and the diagonal (n x d) of
+                        smoothedCov.
+            'diagonal': the diagonal (n x d) of all covariances.
+            'none': no covariance is kept, the records are None.
+            'checkpoint': same records as 'diagonal', plus the full
+                          filteredCov and predictedCov on every
+                          checkpointInterval dates. The backward smoother
+                          filters the dates in between again from the
+                          checkpoints, see @_dlm.
+        Except for 'full', the full covariance of the last saved date is
+        always kept for each record, so that the filter and the smoother can
+        continue from it.
+
+        When cacheGain is True, smootherGain (n x d x d) keeps the smoothing
+        gain of each date once the backward smoother has computed it, so that
+        later smoother runs do not solve it again. The gain of a date depends
+        on the filtered result of the date and the next one, thus it is reset
+        to nan whenever the forward filter saves either date. Otherwise the
+        record is None.
+
+        lossTerms (n x 3) keeps the log density of the observation under the
+        one-day ahead predictive (Student t) distribution, the squared and the
+        absolute one-day ahead prediction error of each filtered date, nan for
+        the missing data. Their sums over the dates are kept as running
+        totals in lossTotals, see @_saveLossTerms.
+
+        When a directory is given, the buffers are np.memmap files in it
+        (one file per record) instead of arrays in memory, and _flush writes
+        the status of the result to 'result.json' in the same directory, so
+        that _open can reopen the result later. A new result or a grown
+        buffer replaces the files, the results that still map the old files
+        are not affected.
+
+        """
 
         # class level (static) variables to record all names
         records = [
@@ -143,13 +228,77 @@ class _dlm(object):
             "filteredCov",
             "predictedCov",
             "smoothedCov",
+            "smootherGain",
+            "lossTerms",
         ]
 
+        covRecords = ["filteredCov", "predictedCov", "smoothedCov"]
+
+        covRetentions = ["full", "smoother", "diagonal", "none", "checkpoint"]
+
         # quantites to record the result
-        def __init__(self, n):
-            # initialize all records to be [None] * n
+        def __init__(
+            self,
+            n,
+            d,
+            covRetention="full",
+            directory=None,
+            checkpointInterval=None,
+            cacheGain=False,
+        ):
+            if covRetention not in self.covRetentions:
+                raise NameError(
+                    "covRetention must be one of " + ", ".join(self.covRetentions)
+                )
+            self.covRetention = covRetention
+            self._directory = directory
+            if directory is not None:
+                os.makedirs(directory, exist_ok=True)
+
+            # the shape of each record at one time stamp, None if not kept
+            self._shapes = {}
+            for variable in self.records:
+                if variable.endswith("State"):
+                    self._shapes[variable] = (d, 1)
+                elif variable.endswith("Cov"):
+                    self._shapes[variable] = self._covShape(variable, d)
+                elif variable == "df":
+                    self._shapes[variable] = ()
+                elif variable == "smootherGain":
+                    self._shapes[variable] = (d, d) if cacheGain else None
+                elif variable == "lossTerms":
+                    self._shapes[variable] = (3,)
+                else:
+                    self._shapes[variable] = (1, 1)
+            self._buffers = {}
             for variable in self.records:
-                setattr(self, variable, [None] * n)
+                self._buffers[variable] = self._allocate(variable, n)
+            self._resize(n)
+
+            # the full covariance of the last saved date of each record that
+            # does not keep the full covariances, in a form of [date, cov]
+            self._lastCov = {}
+            for variable in self.covRecords:
+                if self._shapes[variable] != (d, d):
+                    self._lastCov[variable] = [
+                        None,
+                        self._newArray(variable + "Last", (d, d)),
+                    ]
+
+            # the full filteredCov and predictedCov on every checkpointInterval
+            # dates, the default interval sqrt(n) minimizes the memory of the
+            # checkpoints and a segment between two checkpoints.
+            self._checkpoints = {}
+            self.checkpointInterval = None
+            if covRetention == "checkpoint":
+                if checkpointInterval is None:
+                    checkpointInterval = max(int(np.sqrt(n)), 1)
+                self.checkpointInterval = checkpointInterval
+                for variable in ["filteredCov", "predictedCov"]:
+                    self._checkpoints[variable] = self._newArray(
+                        variable + "Checkpoint",
+                        (self._checkpointCount(self._buffers["df"].shape[0]), d, d),
+                    )
 
             # record the dates that have been filtered
             self.filteredSteps = [0, -1]
@@ -160,29 +309,318 @@ class _dlm(object):
             # record the current prediction status in the form of
             # [start date, current date, [predictedObs1, predictedObs2,...]]
             self.predictStatus = None
-            # One day ahead prediction squared error
+            # the sums of the log density, the squared error and the absolute
+            # error, the number of the observed dates and the number of the nan
+            # log densities in lossTerms
+            self.lossTotals = [0.0, 0.0, 0.0, 0, 0]
 
         # extend the current record by n blocks
         def _appendResult(self, n):
-            for variable in self.records:
-                getattr(self, variable).extend([None] * n)
+            length = self._length + n
+            capacity = self._buffers["df"].shape[0]
+            if length > capacity:
+                capacity = max(length, 2 * capacity)
+                for variable in self.records:
+                    if self._buffers[variable] is None:
+                        continue
+                    buffer = self._allocate(variable, capacity)
+                    buffer[: self._length] = self._buffers[variable][: self._length]
+                    self._buffers[variable] = buffer
+                for variable, checkpoint in self._checkpoints.items():
+                    count = self._checkpointCount(capacity)
+                    buffer = self._newArray(
+                        variable + "Checkpoint", (count,) + checkpoint.shape[1:]
+                    )
+                    buffer[: len(checkpoint)] = checkpoint
+                    self._checkpoints[variable] = buffer
+            self._resize(length)
 
         # pop out a specific date
         def _popout(self, date):
+            self._saveLossTerms(date, None)
+            for variable in self.records:
+                buffer = self._buffers[variable]
+                if buffer is None:
+                    continue
+                buffer[date : self._length - 1] = buffer[date + 1 : self._length]
+                buffer[self._length - 1] = np.nan
+            for last in self._lastCov.values():
+                if last[0] is not None and last[0] > date:
+                    last[0] -= 1
+                elif last[0] == date:
+                    last[0] = None
+            self._resize(self._length - 1)
+
+        def _covShape(self, variable, d):
+            """The shape of a covariance record at one time stamp"""
+            if self.covRetention == "full" or (
+                self.covRetention == "smoother" and variable != "smoothedCov"
+            ):
+                return (d, d)
+            elif self.covRetention == "none":
+                return None
+            return (d,)
+
+        def _checkpointCount(self, n):
+            """The number of checkpoints for n dates"""
+            return (n + self.checkpointInterval - 1) // self.checkpointInterval
+
+        def _isCheckpoint(self, variable, step):
+            """Check whether a date of a record is a checkpoint"""
+            return variable in self._checkpoints and step % self.checkpointInterval == 0
+
+        def _allocate(self, variable, n):
+            """Allocate a buffer of n time stamps for a record"""
+            if self._shapes[variable] is None:
+                return None
+            # a memory map can not be empty
+            if self._directory is not None:
+                n = max(n, 1)
+            return self._newArray(variable, (n,) + self._shapes[variable])
+
+        def _newArray(self, name, shape):
+            """Create an array of nan, which is a memory map of the file
+            <name>.dat when the result has a directory.
+
+            """
+            if self._directory is None:
+                return np.full(shape, np.nan)
+
+            # write to a new file and then replace the old one, so that the
+            # arrays mapping the old file stay valid
+            path = os.path.join(self._directory, name + ".dat")
+            array = np.memmap(path + ".new", dtype=float, mode="w+", shape=shape)
+            array[:] = np.nan
+            os.replace(path + ".new", path)
+            return array
+
+        def _flush(self):
+            """Flush the memory maps and write the status of the result to
+            the directory. Nothing to do for a result in memory.
+
+            """
+            if self._directory is None:
+                return
+            for variable in self.records:
+                if self._buffers[variable] is not None:
+                    self._buffers[variable].flush()
+            for last in self._lastCov.values():
+                last[1].flush()
+            for checkpoint in self._checkpoints.values():
+                checkpoint.flush()
+
+            status = {
+                "length": self._length,
+                "capacity": int(self._buffers["df"].shape[0]),
+                "shapes": self._shapes,
+                "covRetention": self.covRetention,
+                "checkpointInterval": self.checkpointInterval,
+                "lastCov": {name: last[0] for name, last in self._lastCov.items()},
+                "filteredSteps": list(self.filteredSteps),
+                "smoothedSteps": list(self.smoothedSteps),
+                "filteredType": self.filteredType,
+            }
+            with open(os.path.join(self._directory, "result.json"), "w") as f:
+                json.dump(status, f)
+
+        @classmethod
+        def _open(cls, directory):
+            """Reopen the result written to a directory by _flush"""
+            with open(os.path.join(directory, "result.json")) as f:
+                status = json.load(f)
+
+            def _map(name, shape):
+                return np.memmap(
+                    os.path.join(directory, name + ".dat"),
+                    dtype=float,
+                    mode="r+",
+                    shape=tuple(shape),
+                )
+
+            result = cls.__new__(cls)
+            result.covRetention = status["covRetention"]
+            result._directory = directory
+            result._shapes = {}
+            result._buffers = {}
+            for variable in cls.records:
+                shape = status["shapes"].get(variable)
+                if variable == "lossTerms" and shape is None:
+                    # written before the loss terms were kept
+                    result._shapes[variable] = (3,)
+                    result._buffers[variable] = result._newArray(
+                        variable, (status["capacity"], 3)
+                    )
+                elif shape is None:
+                    result._shapes[variable] = None
+                    result._buffers[variable] = None
+                else:
+                    result._shapes[variable] = tuple(shape)
+                    result._buffers[variable] = _map(
+                        variable, [status["capacity"]] + shape
+                    )
+            result._resize(status["length"])
+
+            d = result._buffers["filteredState"].shape[1]
+            result._lastCov = {}
+            for variable, step in status["lastCov"].items():
+                result._lastCov[variable] = [step, _map(variable + "Last", (d, d))]
+
+            result.checkpointInterval = status["checkpointInterval"]
+            result._checkpoints = {}
+            if result.covRetention == "checkpoint":
+                count = result._checkpointCount(status["capacity"])
+                for variable in ["filteredCov", "predictedCov"]:
+                    result._checkpoints[variable] = _map(
+                        variable + "Checkpoint", (count, d, d)
+                    )
+
+            result.filteredSteps = status["filteredSteps"]
+            result.smoothedSteps = status["smoothedSteps"]
+            result.filteredType = status["filteredType"]
+            result.predictStatus = None
+            result._sumLossTerms()
+            return result
+
+        def _resize(self, n):
+            """Point the records to the first n time stamps of the buffers"""
+            self._length = n
             for variable in self.records:
-                getattr(self, variable).pop(date)
+                buffer = self._buffers[variable]
+                setattr(self, variable, None if buffer is None else buffer[:n])
+
+        def _saveCov(self, variable, step, cov):
+            """Save the covariance of a date as much as covRetention keeps"""
+            record = getattr(self, variable)
+            if variable in self._lastCov:
+                self._lastCov[variable][0] = step
+                np.copyto(self._lastCov[variable][1], cov)
+            if self._isCheckpoint(variable, step):
+                self._checkpoints[variable][step // self.checkpointInterval] = cov
+            if record is None:
+                return
+            if record.ndim == 3:
+                record[step] = cov
+            else:
+                record[step] = np.diagonal(cov)
+
+        def _saveLossTerms(self, step, terms):
+            """Save the loss terms of a date (None for a missing date) and
+            update the running totals. The terms that the date had before are
+            taken out of the totals, so refiltering a date does not count it
+            twice.
+
+            """
+            old = self.lossTerms[step].tolist()
+            # a date is observed when its squared error is not nan
+            if old[1] == old[1]:
+                self._addLossTerms(old, -1)
+            if terms is None:
+                self.lossTerms[step] = np.nan
+            else:
+                self.lossTerms[step] = terms
+                self._addLossTerms(terms, 1)
+
+        def _addLossTerms(self, terms, sign):
+            """Add (sign = 1) or take out (sign = -1) the terms of an observed
+            date to the totals. A nan log density (the filter broke down
+            numerically) is counted separately, so that it can be taken out of
+            the totals again.
+
+            """
+            totals = self.lossTotals
+            if terms[0] == terms[0]:
+                totals[0] += sign * terms[0]
+            else:
+                totals[4] += sign
+            totals[1] += sign * terms[1]
+            totals[2] += sign * terms[2]
+            totals[3] += sign
+
+        def _clearLossTerms(self, start):
+            """Take the loss terms of the dates from start on out of the
+            totals, once these dates are no longer filtered (e.g., after
+            alter or popout).
+
+            """
+            terms = self.lossTerms[start:]
+            observed = terms[:, 1] == terms[:, 1]
+            if not np.any(observed):
+                return
+            kept = terms[observed]
+            valid = kept[:, 0] == kept[:, 0]
+            totals = self.lossTotals
+            totals[0] -= float(np.sum(kept[valid, 0]))
+            totals[1] -= float(np.sum(kept[:, 1]))
+            totals[2] -= float(np.sum(kept[:, 2]))
+            totals[3] -= int(np.sum(observed))
+            totals[4] -= int(np.sum(~valid))
+            terms[:] = np.nan
+
+        def _sumLossTerms(self):
+            """Sum the loss terms of all dates into the running totals"""
+            self.lossTotals = [0.0, 0.0, 0.0, 0, 0]
+            for terms in self.lossTerms.tolist():
+                if terms[1] == terms[1]:
+                    self._addLossTerms(terms, 1)
+
+        def _loadCov(self, variable, step):
+            """Load the full covariance of a date"""
+            record = getattr(self, variable)
+            if record is not None and record.ndim == 3:
+                return record[step]
+            if variable in self._lastCov and self._lastCov[variable][0] == step:
+                return self._lastCov[variable][1]
+            if self._isCheckpoint(variable, step):
+                return self._checkpoints[variable][step // self.checkpointInterval]
+            raise ValueError(
+                "The full " + variable + " of date " + str(step) + " is not "
+                "kept under covRetention='" + self.covRetention + "'."
+            )
+
+        def _covDiagonal(self, variable, start, end):
+            """Get the diagonal of the covariance from start to end - 1"""
+            record = getattr(self, variable)
+            if record is None:
+                raise ValueError(
+                    "No "
+                    + variable
+                    + " is kept under covRetention='"
+                    + self.covRetention
+                    + "'."
+                )
+            if record.ndim == 3:
+                return np.diagonal(record[start:end], axis1=1, axis2=2)
+            return record[start:end]
 
     # initialize the builder
-    def _initialize(self):
-        """Initialize the model: initialize builder and filter."""
+    def _initialize(self, result=None):
+        """Initialize the model: initialize builder and filter.
+
+        Args:
+            result: an existing @_result to use instead of a new one.
+        """
         self._autoNoise()
         self.builder.initialize(noise=self.options.noise, data=self.padded_data)
         self.Filter = kalmanFilter(
             discount=self.builder.discount,
             updateInnovation=self.options.innovationType,
             index=self.builder.componentIndex,
+            transitionType=self.builder.transitionType,
+            fused=self.options.fused,
+            steadyState=self.options.steadyState,
+            steadyStateTol=self.options.steadyStateTol,
+            factorizedSmoother=self.options.factorizedSmoother,
         )
-        self.result = self._result(self.n)
+        if result is None:
+            result = self._result(
+                self.n,
+                self.builder.model.state.shape[0],
+                self.options.covRetention,
+                self.options.resultDir,
+                self.options.checkpointInterval,
+                self.options.cacheSmootherGain,
+            )
+        self.result = result
         self.initialized = True
 
     def _initializeFromBuilder(self, exported_builder):
@@ -193,8 +631,20 @@ class _dlm(object):
             discount=self.builder.discount,
             updateInnovation=self.options.innovationType,
             index=self.builder.componentIndex,
+            transitionType=self.builder.transitionType,
+            fused=self.options.fused,
+            steadyState=self.options.steadyState,
+            steadyStateTol=self.options.steadyStateTol,
+            factorizedSmoother=self.options.factorizedSmoother,
+        )
+        self.result = self._result(
+            self.n,
+            self.builder.model.state.shape[0],
+            self.options.covRetention,
+            self.options.resultDir,
+            self.options.checkpointInterval,
+            self.options.cacheSmootherGain,
         )
-        self.result = self._result(self.n)
         self.initialized = True
 
     def _autoNoise(self):
@@ -244,8 +694,29 @@ class _dlm(object):
         if start > end:
             return None
 
+        # the whole series can be filtered in parallel, when the parallel
+        # filter supports the model, otherwise it is filtered sequentially
+        if (
+            self.options.workers is not None
+            and start == 0
+            and end == self.n - 1
+            and save == "all"
+            and not renew
+        ):
+            if self._parallelEngine().supports(self.data):
+                return self._parallelForwardFilter()
+            self._logger.warning(
+                "The parallel filter does not support the model, e.g., the "
+                "'component' innovation with more than one discounted "
+                "component or autoReg with missing data. The series is "
+                "filtered sequentially. Use evolveMode('dependent') for the "
+                "'whole' innovation."
+            )
+
         # first we need to initialize the model to the correct status
         # if the start point is 0 or we want to forget the previous result
+        # the filter restarts from the full recursion on the new status
+        self.Filter.resetSteadyState()
         if start == 0 or ForgetPrevious:
             self._resetModelStatus()
 
@@ -278,6 +749,7 @@ class _dlm(object):
             ):
                 # we renew the state of the day
                 self._resetModelStatus()
+                self.Filter.resetSteadyState()
                 for innerStep in range(step - int(self.builder.renewTerm), step):
                     self.Filter.forwardFilter(self.builder.model, self.data[innerStep])
                 lastRenewPoint = step
@@ -319,6 +791,14 @@ class _dlm(object):
         else:
             end = max(start - days + 1, 0)
 
+        # the smoother needs the full filtered and predicted covariance, or
+        # the checkpoints to filter them again
+        if self.result.covRetention not in ("full", "smoother", "checkpoint"):
+            raise ValueError(
+                "The backward smoother needs covRetention to be 'full', "
+                "'smoother' or 'checkpoint'."
+            )
+
         # the forwardFilter has to be run before the smoother
         if self.result.filteredSteps[1] < start:
             raise valueError(
@@ -326,11 +806,22 @@ class _dlm(object):
                 "check the <filteredSteps> in <result> object."
             )
 
+        # the whole series can be smoothed in parallel
+        if (
+            self.options.workers is not None
+            and start == self.n - 1
+            and end == 0
+            and self.result.covRetention in ("full", "smoother")
+        ):
+            return self._parallelBackwardSmoother()
+
         # and we record the most recent day which does not need to be smooth
         if start == self.n - 1 or ignoreFuture is True:
             self.result.smoothedState[start] = self.result.filteredState[start]
             self.result.smoothedObs[start] = self.result.filteredObs[start]
-            self.result.smoothedCov[start] = self.result.filteredCov[start]
+            self.result._saveCov(
+                "smoothedCov", start, self.result._loadCov("filteredCov", start)
+            )
             self.result.smoothedObsVar[start] = self.result.filteredObsVar[start]
             self.builder.model.noiseVar = self.result.noiseVar[start]
             start -= 1
@@ -343,15 +834,21 @@ class _dlm(object):
 
         # insert the previous smoothed dates
         self.builder.model.state = self.result.smoothedState[start + 1]
-        self.builder.model.sysVar = self.result.smoothedCov[start + 1]
+        self.builder.model.sysVar = self.result._loadCov("smoothedCov", start + 1)
 
         # we smooth the result sequantially from start - 1 to end
         dates = list(range(end, start + 1))
         dates.reverse()
+        segment = {}
         for day in dates:
-            # we first update the model to be correct status before smooth
+            # we first update the model to be correct status before smooth,
+            # the covariances are loaded before updating the evaluation as
+            # loading them may filter a segment again
             self.builder.model.prediction.state = self.result.predictedState[day + 1]
-            self.builder.model.prediction.sysVar = self.result.predictedCov[day + 1]
+            self.builder.model.prediction.sysVar = self._loadFilterCov(
+                "predictedCov", day + 1, segment
+            )
+            rawSysVar = self._loadFilterCov("filteredCov", day, segment)
 
             if (
                 len(self.builder.dynamicComponents) > 0
@@ -363,7 +860,8 @@ class _dlm(object):
             self.Filter.backwardSmoother(
                 model=self.builder.model,
                 rawState=self.result.filteredState[day],
-                rawSysVar=self.result.filteredCov[day],
+                rawSysVar=rawSysVar,
+                gain=self._loadSmootherGain(day, rawSysVar),
             )
 
             # extract the result
@@ -374,6 +872,232 @@ class _dlm(object):
                 filterType="backwardSmoother",
             )
 
+    def _parallelEngine(self):
+        """The parallel in time filter and smoother of the model"""
+        return parallelKalmanFilter(
+            self.builder,
+            updateInnovation=self.Filter.updateInnovation,
+            noise=self.builder.noiseVar[0, 0],
+            workers=self.options.workers,
+            factorizedSmoother=self.options.factorizedSmoother,
+        )
+
+    def _parallelForwardFilter(self):
+        """Run the forward filter on the whole series with the parallel in
+        time filter, which gives the same result as _forwardFilter.
+
+        """
+        filtered = self._parallelEngine().forwardFilter(self.data)
+        result = self.result
+        for variable in [
+            "filteredObs",
+            "predictedObs",
+            "filteredObsVar",
+            "predictedObsVar",
+            "noiseVar",
+        ]:
+            getattr(result, variable)[:, 0, 0] = getattr(filtered, variable)
+        result.df[:] = filtered.df
+        result.filteredState[:, :, 0] = filtered.filteredState
+        result.predictedState[:, :, 0] = filtered.predictedState
+        err = np.array(self.data, dtype=float) - filtered.predictedObs
+        observed = ~np.isnan(err)
+        logDensity = np.full(self.n, np.nan)
+        logDensity[observed] = tl.studentLogDensity(
+            err[observed],
+            filtered.predictedObsVar[observed],
+            filtered.df[observed] - 1,
+        )
+        for step in range(self.n):
+            result._saveCov("filteredCov", step, filtered.filteredCov[step])
+            result._saveCov("predictedCov", step, filtered.predictedCov[step])
+            result._saveLossTerms(
+                step,
+                (
+                    [logDensity[step], err[step] ** 2, abs(err[step])]
+                    if observed[step]
+                    else None
+                ),
+            )
+            # pad missing value with filtered result
+            if self.data[step] is None:
+                self.padded_data[step] = filtered.filteredObs[step]
+        if result.smootherGain is not None:
+            result.smootherGain[:] = np.nan
+
+        # leave the model at the last date as the sequential filter does
+        self._reverseCopy(model=self.builder.model, result=result, step=self.n - 1)
+
+    def _parallelBackwardSmoother(self):
+        """Run the backward smoother on the whole series with the parallel in
+        time smoother, which gives the same result as _backwardSmoother.
+
+        """
+        engine = self._parallelEngine()
+        result = self.result
+        filtered = engine._result(self.n, result.filteredState.shape[1])
+        filtered.filteredState = result.filteredState[:, :, 0]
+        filtered.predictedState = result.predictedState[:, :, 0]
+        filtered.filteredCov = result.filteredCov
+        filtered.predictedCov = result.predictedCov
+        filtered.filteredObs = result.filteredObs[:, 0, 0]
+        filtered.filteredObsVar = result.filteredObsVar[:, 0, 0]
+        filtered.noiseVar = result.noiseVar[:, 0, 0]
+        filtered.evaluation = engine._evaluation(
+            np.array(self.padded_data, dtype=float), np.ones(self.n, dtype=bool)
+        )
+        engine.backwardSmoother(filtered)
+
+        result.smoothedObs[:, 0, 0] = filtered.smoothedObs
+        result.smoothedObsVar[:, 0, 0] = filtered.smoothedObsVar
+        result.smoothedState[:, :, 0] = filtered.smoothedState
+        for step in range(self.n):
+            result._saveCov("smoothedCov", step, filtered.smoothedCov[step])
+
+    # draw posterior paths of the latent states
+    def _backwardSampler(self, size, rng):
+        """Draw posterior paths of the latent states by backward sampling
+        over the filtered results (forward filtering backward sampling)
+
+        Args:
+            size: the number of paths
+            rng: the numpy.random.Generator to draw from
+
+        Returns:
+            A size x n x d array of the sampled latent states.
+        """
+        # the sampler needs the full filtered and predicted covariance, or
+        # the checkpoints to filter them again
+        if self.result.covRetention not in ("full", "smoother", "checkpoint"):
+            raise ValueError(
+                "The backward sampler needs covRetention to be 'full', "
+                "'smoother' or 'checkpoint'."
+            )
+
+        if self.result.filteredSteps != [0, self.n - 1]:
+            raise ValueError(
+                "Forward Fiter needs to run on full data before "
+                "using backward sampler."
+            )
+
+        d = self.builder.model.state.shape[0]
+        samples = np.empty((size, self.n, d))
+        segment = {}
+        last = self.n - 1
+        samples[:, last] = self.result.filteredState[last].T + np.dot(
+            rng.standard_normal((size, d)),
+            self.Filter._covFactor(self._loadFilterCov("filteredCov", last, segment)).T,
+        )
+        for day in range(last - 1, -1, -1):
+            self.builder.model.prediction.state = self.result.predictedState[day + 1]
+            self.builder.model.prediction.sysVar = self._loadFilterCov(
+                "predictedCov", day + 1, segment
+            )
+            rawSysVar = self._loadFilterCov("filteredCov", day, segment)
+            samples[:, day] = self.Filter.backwardSampleBatch(
+                model=self.builder.model,
+                samples=samples[:, day + 1],
+                rawState=self.result.filteredState[day],
+                rawSysVar=rawSysVar,
+                rng=rng,
+                gain=self._loadSmootherGain(day, rawSysVar),
+            )
+        return samples
+
+    def _loadSmootherGain(self, step, rawSysVar):
+        """Load the smoothing gain of a date when it is kept in the result,
+        computing it on the first use. None when the gains are not kept.
+
+        """
+        if self.result.smootherGain is None:
+            return None
+        gain = self.result.smootherGain[step]
+        if np.isnan(gain[0, 0]):
+            gain[:] = self.Filter._smoothingGain(
+                self.builder.model.transition,
+                rawSysVar,
+                self.builder.model.prediction.sysVar,
+            )
+        return gain
+
+    def _loadFilterCov(self, variable, step, segment):
+        """Load the full filteredCov or predictedCov of a date for the smoother
+
+        Under covRetention='checkpoint', the covariances between two
+        checkpoints are filtered again on the first use and cached in
+        segment until the smoother leaves the segment.
+
+        Args:
+            variable: 'filteredCov' or 'predictedCov'
+            step: the date
+            segment: a dict caching the covariances of the current segment
+
+        Returns:
+            The full covariance of the date.
+
+        """
+        if step in segment.get(variable, {}):
+            return segment[variable][step]
+        if self.result.covRetention != "checkpoint" or self.result._isCheckpoint(
+            variable, step
+        ):
+            return self.result._loadCov(variable, step)
+
+        segment.clear()
+        segment.update(self._refilterSegment(step))
+        return segment[variable][step]
+
+    def _refilterSegment(self, step):
+        """Filter again the segment between two checkpoints containing a date
+
+        The filter restarts from the checkpoint before the date and runs
+        until the next checkpoint, on copies of the model and the filter,
+        so that neither the result nor the model of the dlm are changed.
+
+        Args:
+            step: the date
+
+        Returns:
+            A dict of {'filteredCov': {date: cov}, 'predictedCov': {date: cov}}
+            for the dates in the segment.
+
+        """
+        if self.result.filteredType == "rolling" or self.options.stable:
+            raise ValueError(
+                "The covariances can not be filtered again from the "
+                "checkpoints for rolling window filtering or the stable mode, "
+                "use covRetention='full' or 'smoother' instead."
+            )
+
+        interval = self.result.checkpointInterval
+        start = step // interval * interval
+        end = min(start + interval, self.result.filteredSteps[1] + 1)
+
+        model = deepcopy(self.builder.model)
+        Filter = deepcopy(self.Filter)
+        Filter.resetSteadyState()
+        self._reverseCopy(model=model, result=self.result, step=start)
+        segment = {
+            "filteredCov": {start: model.sysVar},
+            "predictedCov": {start: model.prediction.sysVar},
+        }
+        for day in range(start + 1, end):
+            if (
+                len(self.builder.dynamicComponents) > 0
+                or len(self.builder.automaticComponents) > 0
+            ):
+                self.builder.updateEvaluation(day, self.padded_data)
+                model.evaluation = self.builder.model.evaluation.copy()
+
+            if self._isMissing(self.result, day):
+                y = None
+            else:
+                y = self.data[day]
+            Filter.forwardFilter(model, y)
+            segment["filteredCov"][day] = model.sysVar.copy()
+            segment["predictedCov"][day] = model.prediction.sysVar.copy()
+        return segment
+
     # Forecast the result based on filtered chains
     def _predictInSample(self, date, days=1):
         """Predict the model's status based on the model of a specific day
@@ -448,33 +1172,62 @@ class _dlm(object):
             result.predictedObsVar[step] = model.prediction.obsVar
             result.filteredState[step] = model.state
             result.predictedState[step] = model.prediction.state
-            result.filteredCov[step] = model.sysVar
-            result.predictedCov[step] = model.prediction.sysVar
+            result._saveCov("filteredCov", step, model.sysVar)
+            result._saveCov("predictedCov", step, model.prediction.sysVar)
             result.noiseVar[step] = model.noiseVar
             result.df[step] = model.df
-            # pad missing value with filtered result
+            # the smoothing gains of the date and the previous date depend on
+            # the result that has been refiltered
+            if result.smootherGain is not None:
+                result.smootherGain[max(step - 1, 0) : step + 1] = np.nan
             if self.data[step] is None:
-                self.padded_data[step] = result.filteredObs[step]
+                result._saveLossTerms(step, None)
+                # pad missing value with filtered result
+                self.padded_data[step] = result.filteredObs[step][0, 0]
+            else:
+                # the degree of freedom before the update of the date
+                err = self.data[step] - float(model.prediction.obs[0, 0])
+                logDensity = tl.studentLogDensity(
+                    err, float(model.prediction.obsVar[0, 0]), model.df - 1
+                )
+                result._saveLossTerms(step, [logDensity, err * err, abs(err)])
 
         elif filterType == "backwardSmoother":
             result.smoothedState[step] = model.state
             result.smoothedObs[step] = model.obs
-            result.smoothedCov[step] = model.sysVar
+            result._saveCov("smoothedCov", step, model.sysVar)
             result.smoothedObsVar[step] = model.obsVar
 
     def _reverseCopy(self, model, result, step):
         """Copy result from _result class to the model"""
 
-        model.obs = result.filteredObs[step]
-        model.prediction.obs = result.predictedObs[step]
-        model.obsVar = result.filteredObsVar[step]
-        model.prediction.obsVar = result.predictedObsVar[step]
-        model.state = result.filteredState[step]
-        model.prediction.state = result.predictedState[step]
-        model.sysVar = result.filteredCov[step]
-        model.prediction.sysVar = result.predictedCov[step]
-        model.noiseVar = result.noiseVar[step]
-        model.df = result.df[step]
+        model.obs = result.filteredObs[step].copy()
+        model.prediction.obs = result.predictedObs[step].copy()
+        model.obsVar = result.filteredObsVar[step].copy()
+        model.prediction.obsVar = result.predictedObsVar[step].copy()
+        model.state = result.filteredState[step].copy()
+        model.prediction.state = result.predictedState[step].copy()
+        model.sysVar = result._loadCov("filteredCov", step).copy()
+        model.prediction.sysVar = result._loadCov("predictedCov", step).copy()
+        model.noiseVar = result.noiseVar[step].copy()
+        model.df = int(result.df[step])
+
+        # the prediction step counts the missing dates up to the date, the
+        # next prediction only adds the innovation when it is zero
+        missing = 0
+        while missing <= step and self._isMissing(result, step - missing):
+            missing += 1
+        model.prediction.step = missing
+
+    def _isMissing(self, result, step):
+        """Check whether the data of a filtered date was missing. The missing
+        data has been padded, which is told by the degree of freedom that
+        only grows on the observed dates.
+
+        """
+        if step == 0:
+            return result.df[0] == self.builder.initialDegreeFreedom
+        return result.df[step] == result.df[step - 1]
 
     # check if the data size matches the dynamic features
     def _checkFeatureSize(self):
@@ -488,6 +1241,8 @@ class _dlm(object):
 
     def _1DmatrixToArray(self, arrayOf1dMatrix):
         """Change an array of 1 x 1 matrix to normal array."""
+        if isinstance(arrayOf1dMatrix, np.ndarray):
+            return arrayOf1dMatrix.reshape(len(arrayOf1dMatrix)).tolist()
         to_array = lambda x: None if x is None else x.tolist()[0][0]
         return [to_array(item) for item in arrayOf1dMatrix]
 
@@ -32,6 +32,7 @@ Example:
 # Kalman filter functionality for filtering the data
 
 from copy import deepcopy
+import numpy as np
 from numpy import matrix
 from pydlm.predict.dlmPredictMod import dlmPredictModule
 from pydlm.access.dlmAccessMod import dlmAccessModule
@@ -81,10 +82,9 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
     def __init__(self, data, **options):
         super(dlm, self).__init__(data, **options)
 
-        # This model is used for prediction. Prediction functions
-        # will change the model status to forecast at a particular
-        # date. Using a copied model will help the main model from
-        # being changed and behaving abnormally.
+        # The forecast state used for prediction. It holds the filtered
+        # result of the date the prediction starts from, so that prediction
+        # functions do not change the main model.
         self._predictModel = None
 
     def exportModel(self):
@@ -217,6 +217,7 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
                 )
 
         self.result.filteredSteps = [0, self.n - 1]
+        self.result._flush()
         self.turnOn("filtered plot")
         self.turnOn("predict plot")
 
@@ -229,6 +230,10 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
             backLength: integer, indicating how many days the backward smoother
             should go, starting from the last date.
 
+        Under the fixed-lag mode (see fixedLagMode), when backLength is not
+        given and the earlier dates have been smoothed, only the last lag
+        dates and the newly appended ones are smoothed again.
+
         """
 
         # see if the model has been initialized
@@ -243,6 +248,25 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
                 + "using backward Smoother"
             )
 
+        # under the fixed-lag mode, the smoothed results before the last lag
+        # dates are frozen and the smoother only goes back over the lag
+        lag = self.options.smootherLag
+        if (
+            backLength is None
+            and lag is not None
+            and 0 <= self.result.smoothedSteps[1] < self.n - 1
+        ):
+            self._logger.info("Starting fixed-lag backward smoothing...")
+            days = min(max(lag, self.n - 1 - self.result.smoothedSteps[1]), self.n)
+            self._backwardSmoother(start=self.n - 1, days=days)
+            self.result.smoothedSteps = [
+                min(self.result.smoothedSteps[0], self.n - days),
+                self.n - 1,
+            ]
+            self.result._flush()
+            self._logger.info("Backward smoothing completed.")
+            return None
+
         # default value for backLength
         if backLength is None:
             backLength = self.n
@@ -267,14 +291,98 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
             self._backwardSmoother(start=self.n - 1, days=backLength)
 
         self.result.smoothedSteps = [self.n - backLength, self.n - 1]
+        self.result._flush()
         self.turnOn("smoothed plot")
 
         self._logger.info("Backward smoothing completed.")
 
     def fit(self):
-        """An easy caller for fitting both the forward filter and backward smoother."""
+        """An easy caller for fitting both the forward filter and backward smoother.
+
+        The backward smoother is skipped when the model does not keep the
+        covariance it needs (covRetention = 'diagonal' or 'none').
+        """
         self.fitForwardFilter()
-        self.fitBackwardSmoother()
+        if self.result.covRetention in ("full", "smoother", "checkpoint"):
+            self.fitBackwardSmoother()
+        else:
+            self._logger.info(
+                "Backward smoothing skipped under covRetention='"
+                + self.result.covRetention
+                + "'."
+            )
+
+    def sampleLatentState(self, size=1, name="all", seed=None):
+        """Draw posterior paths of the latent states given all the data, by
+        backward sampling over the filtered results (forward filtering
+        backward sampling). All the paths are drawn together, one step at a
+        time.
+
+        Args:
+            size: the number of paths to draw.
+            name: the component to draw the latent states of. Default to
+                  'all' for the latent states of the time series.
+            seed: the seed of the random draws, either an integer or a
+                  numpy.random.Generator.
+
+        Returns:
+            A numpy array of size x n x d, standing for the sampled paths of
+            the latent states (d is the dimension of the component).
+
+        """
+        if not self.initialized:
+            raise ValueError("Backward sampler has to be run after" + " forward filter")
+
+        samples = self._backwardSampler(size=size, rng=np.random.default_rng(seed))
+        if name == "all":
+            return samples
+
+        self._checkComponent(name)
+        indx = self.builder.componentIndex[name]
+        return samples[:, :, indx[0] : (indx[1] + 1)]
+
+    def loadResult(self, directory=None):
+        """Reopen the result that a previous fit wrote to a directory (see
+        the resultDir option), so that the results can be accessed and the
+        filtering can continue without refitting. The dlm must be constructed
+        with the same data and components as the one that was fitted.
+
+        Args:
+            directory: the directory of the result. Default to the resultDir
+                       option.
+
+        """
+        if directory is None:
+            directory = self.options.resultDir
+        if directory is None:
+            raise ValueError("The directory of the result is not given.")
+
+        # check the stored result before it replaces the current one
+        result = self._result._open(directory)
+        stateDimension = sum(
+            comp.d
+            for components in [
+                self.builder.staticComponents,
+                self.builder.dynamicComponents,
+                self.builder.automaticComponents,
+            ]
+            for comp in components.values()
+        )
+        if len(result.df) != self.n or result.filteredState.shape[1] != stateDimension:
+            raise ValueError("The stored result does not match the dlm.")
+
+        if not self.initialized:
+            self._initialize(result=result)
+        else:
+            self.result = result
+        self.options.resultDir = directory
+        self.options.covRetention = result.covRetention
+        self.options.checkpointInterval = result.checkpointInterval
+
+        # pad the missing data with the filtered result as the filter does
+        for step in range(result.filteredSteps[0], result.filteredSteps[1] + 1):
+            if self.data[step] is None:
+                self.padded_data[step] = result.filteredObs[step][0, 0]
 
     # ======================= data appending, popping and altering ===============
 
@@ -302,6 +410,7 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
             # update the length
             self.n += len(data)
             self.result._appendResult(len(data))
+            self.result._flush()
 
             # update the automatic components as well
             for component in self.builder.automaticComponents:
@@ -361,6 +470,11 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
         elif self.result.smoothedSteps[0] > self.result.smoothedSteps[1]:
             self.result.smoothedSteps = [0, -1]
 
+        # the losses of the dates to be filtered again
+        self.result._clearLossTerms(self.result.filteredSteps[1] + 1)
+
+        self.result._flush()
+
     # alter the data of a specific days
     def alter(self, date, data, component="main"):
         """To alter the data for a specific date and a specific component.
@@ -408,6 +522,11 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
         elif self.result.smoothedSteps[0] > self.result.smoothedSteps[1]:
             self.result.smoothedSteps = [0, -1]
 
+        # the losses of the dates to be filtered again
+        self.result._clearLossTerms(self.result.filteredSteps[1] + 1)
+
+        self.result._flush()
+
     # ignore the data of a given date
     def ignore(self, date):
         """Ignore the data for a specific day. treat it as missing data
@@ -484,6 +603,30 @@ class dlm(dlmPlotModule, dlmPredictModule, dlmAccessModule, dlmTuneModule):
         # for chaining
         return self
 
+    def fixedLagMode(self, lag=None):
+        """Turn on the fixed-lag smoothing for streaming data. After new data
+        is appended and filtered, fitBackwardSmoother only smooths the last
+        lag dates (and the newly appended ones) again, instead of the whole
+        history. The smoothed results of the earlier dates are kept as they
+        are, i.e., they do not take the new data into account. With the
+        discount, the information of a new data decays quickly towards the
+        past, so a lag of a few times the renew term of the model barely
+        changes the results.
+
+        Args:
+            lag: the number of dates to smooth again on each update. None
+                 turns off the fixed-lag mode.
+
+        Returns:
+            A dlm object (for chaining purpose)
+        """
+        if lag is not None and lag < 1:
+            raise ValueError("The lag must be a positive integer.")
+        self.options.smootherLag = lag
+
+        # for chaining
+        return self
+
     def noisePrior(self, prior=0):
         """To set the prior for the observational noise. Calling with empty
         argument will enable the auto noise intializer (currently, the min of 1
@@ -100,6 +100,12 @@ class builder:
         # can be used to extract information for each componnet
         self.componentIndex = {}
 
+        # store the type of the transition matrix of all components, i.e.,
+        # 'identity', 'trend', 'shift' (seasonality) or 'dense', see
+        # _getTransitionType. Used by the kalmanFilter to propagate the
+        # latent states block by block.
+        self.transitionType = {}
+
         # record the prior guess on the latent state and system covariance
         self.statePrior = None
         self.sysVarPrior = None
@@ -239,6 +245,8 @@ class builder:
         state = None
         sysVar = None
         self.discount = np.array([])
+        self.componentIndex = {}
+        self.transitionType = {}
 
         # first construct for the static components
         # the evaluation will be treated separately for static or dynamic
@@ -252,6 +260,7 @@ class builder:
             sysVar = mt.matrixAddInDiag(sysVar, comp.covPrior)
             self.discount = np.concatenate((self.discount, comp.discount))
             self.componentIndex[i] = (currentIndex, currentIndex + comp.d - 1)
+            self.transitionType[i] = self._getTransitionType(comp)
             currentIndex += comp.d
 
         # if the model contains the dynamic part, we add the dynamic components
@@ -266,6 +275,7 @@ class builder:
                 sysVar = mt.matrixAddInDiag(sysVar, comp.covPrior)
                 self.discount = np.concatenate((self.discount, comp.discount))
                 self.componentIndex[i] = (currentIndex, currentIndex + comp.d - 1)
+                self.transitionType[i] = self._getTransitionType(comp)
                 currentIndex += comp.d
 
         # if the model contains the automatic dynamic part, we add
@@ -281,6 +291,7 @@ class builder:
                 sysVar = mt.matrixAddInDiag(sysVar, comp.covPrior)
                 self.discount = np.concatenate((self.discount, comp.discount))
                 self.componentIndex[i] = (currentIndex, currentIndex + comp.d - 1)
+                self.transitionType[i] = self._getTransitionType(comp)
                 currentIndex += comp.d
 
         self.statePrior = state
@@ -308,6 +319,28 @@ class builder:
         self.initialized = True
         self._logger.info("Initialization finished.")
 
+    # the transition of each component takes a special form. We record the
+    # form so that the filter does not need to multiply the full matrix.
+    def _getTransitionType(self, comp):
+        """Get the type of the transition matrix of a component.
+
+        Returns:
+            'identity' for dynamic, autoReg and longSeason, 'trend' for the
+            upper triangular matrix of ones used by trend, 'shift' for the
+            cyclic permutation used by seasonality and 'dense' for everything
+            else (including user modified transitions).
+        """
+        shift = np.diag(np.ones(comp.d - 1), 1)
+        shift[comp.d - 1, 0] = 1
+        if np.array_equal(comp.transition, np.eye(comp.d)):
+            return "identity"
+        elif np.array_equal(comp.transition, np.triu(np.ones((comp.d, comp.d)))):
+            return "trend"
+        elif np.array_equal(comp.transition, shift):
+            return "shift"
+        else:
+            return "dense"
+
     # Initialize from another builder exported from other dlm class
     def initializeFromBuilder(self, data, exported_builder):
         # Copy the components
@@ -315,6 +348,7 @@ class builder:
         self.automaticComponents = deepcopy(exported_builder.automaticComponents)
         self.dynamicComponents = deepcopy(exported_builder.dynamicComponents)
         self.componentIndex = deepcopy(exported_builder.componentIndex)
+        self.transitionType = deepcopy(exported_builder.transitionType)
         self.discount = deepcopy(exported_builder.discount)
         self.initialDegreeFreedom = exported_builder.model.df
 
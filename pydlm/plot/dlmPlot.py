@@ -302,9 +302,7 @@ def plotSingleState(time, dimension, result, options):
         start = result.filteredSteps[0]
         end = result.filteredSteps[1] + 1
         data = [item[dimension, 0] for item in result.filteredState[start:end]]
-        var = [
-            abs(item[dimension, dimension]) for item in result.filteredCov[start:end]
-        ]
+        var = abs(result._covDiagonal("filteredCov", start, end)[:, dimension]).tolist()
 
         plotData(
             time=time[start:end],
@@ -330,9 +328,9 @@ def plotSingleState(time, dimension, result, options):
         start = result.filteredSteps[0]
         end = result.filteredSteps[1] + 1
         data = [item[dimension, 0] for item in result.predictedState[start:end]]
-        var = [
-            abs(item[dimension, dimension]) for item in result.predictedCov[start:end]
-        ]
+        var = abs(
+            result._covDiagonal("predictedCov", start, end)[:, dimension]
+        ).tolist()
 
         plotData(
             time=time[start:end],
@@ -358,9 +356,7 @@ def plotSingleState(time, dimension, result, options):
         start = result.smoothedSteps[0]
         end = result.smoothedSteps[1] + 1
         data = [item[dimension, 0] for item in result.smoothedState[start:end]]
-        var = [
-            abs(item[dimension, dimension]) for item in result.smoothedCov[start:end]
-        ]
+        var = abs(result._covDiagonal("smoothedCov", start, end)[:, dimension]).tolist()
 
         plotData(
             time=time[start:end],
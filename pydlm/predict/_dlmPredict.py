@@ -7,6 +7,10 @@ The code for all predicting methods
 
 """
 
+from copy import deepcopy
+import numpy as np
+
+from pydlm.base.baseModel import baseModel
 from pydlm.core._dlm import _dlm
 
 
@@ -16,21 +20,64 @@ class _dlmPredict(_dlm):
     Methods:
         _oneDayAheadPredict: predict one day a head.
         _continuePredict: continue predicting one day after _oneDayAheadPredict
+        _multiDayAheadPredict: predict multiple days ahead at once for models
+                               with only static components
+        _backtest: predict from all origins of a period for multiple horizons
+        _scenarioPredict: predict multiple days ahead for a batch of features
+        _forecastSnapshot: take the forecast state of a filtered date
+        _forecastNext: predict one more day from a forecast state
+        _forecastState: a class to store the state needed for forecasting
     """
 
-    # Note the following functions will modify the status of the model, so they
-    # shall not be directly call through the main model if this behavior is not
-    # desired.
+    # an inner class to store what a forecast needs
+    class _forecastState(object):
+        """The compact state needed to forecast from a filtered date, so that
+        predictions neither copy nor change the dlm and its history.
+
+        Attributes:
+            model: a @baseModel holding the filtered state, covariance,
+                   noiseVar and df of the origin date.
+            features: the feature sources of the dynamic components. The
+                      stored features are shared with the components, and the
+                      features supplied for prediction are kept in overrides.
+            automaticComponents: copies of the automatic components.
+            history: the observations the automatic components depend on,
+                     followed by the predictions.
+            predictStatus: (start_date, current_date,
+                            [all_predicted_values]).
+        """
+
+        def __init__(self, model, features, automaticComponents, history, date):
+            self.model = model
+            self.features = features
+            self.automaticComponents = automaticComponents
+            self.history = history
+            self.predictStatus = [date, date, []]
+
+    # the recent observations seen by the automatic components
+    class _forecastHistory(object):
+        """The last window observations up to the origin date followed by the
+        predictions after it. It is indexed and sliced by the dates of the
+        full time series, as the automatic components expect.
+        """
+
+        def __init__(self, data, date, window):
+            self.offset = max(date + 1 - window, 0)
+            self.values = list(data[self.offset : (date + 1)])
+
+        def __len__(self):
+            return self.offset + len(self.values)
+
+        def __getitem__(self, index):
+            start, stop, _ = index.indices(len(self))
+            return self.values[max(start - self.offset, 0) : max(stop - self.offset, 0)]
+
+        def append(self, value):
+            self.values.append(value)
 
-    # featureDict contains all the features for prediction.
-    # It is a dictionary with key equals to the name of the component and
-    # the value as the new feature (a list). The function
-    # will first use the features provided in this feature dict, if not
-    # found, it will fetch the default feature from the component. If
-    # it could not find feature for some component, it returns an error
     # The intermediate result will be stored in result.predictStatus as
     # (start_date, next_pred_date, [all_predicted_values]), which will be
-    # used by _continuePredict.
+    # used by _continuePredict. The forecast state is kept in _predictModel.
     def _oneDayAheadPredict(self, date, featureDict=None):
         """One day ahead prediction based on the date and the featureDict.
         The prediction could be on the last day and into the future or in
@@ -54,32 +101,9 @@ class _dlmPredict(_dlm):
         Returns:
             A tuple of (predicted_mean, predicted_variance)
         """
-        if date > self.n - 1:
-            raise NameError("The date is beyond the data range.")
-
-        # get the correct status of the model
-        self._setModelStatus(date=date)
-        self._constructEvaluationForPrediction(
-            date=date + 1,
-            featureDict=featureDict,
-            padded_data=self.padded_data[: (date + 1)],
-        )
-
-        # initialize the prediction status
-        self.builder.model.prediction.step = 0
-
-        # start predicting
-        self.Filter.predict(self.builder.model)
-
-        predictedObs = self.builder.model.prediction.obs
-        predictedObsVar = self.builder.model.prediction.obsVar
-        self.result.predictStatus = [
-            date,  # start_date
-            date + 1,  # current_date
-            [predictedObs[0, 0]],  # all historical predictions
-        ]
-
-        return (predictedObs, predictedObsVar)
+        self._predictModel = self._forecastSnapshot(date)
+        self.result.predictStatus = self._predictModel.predictStatus
+        return self._forecastNext(self._predictModel, featureDict=featureDict)
 
     def _continuePredict(self, featureDict=None):
         """Continue predicting one day after _oneDayAheadPredict or
@@ -99,60 +123,378 @@ class _dlmPredict(_dlm):
             raise NameError(
                 "_continoousPredict can only be used after " + "_oneDayAheadPredict"
             )
-        startDate = self.result.predictStatus[0]
-        currentDate = self.result.predictStatus[1]
+        return self._forecastNext(self._predictModel, featureDict=featureDict)
+
+    def _multiDayAheadPredict(self, date, N):
+        """Predict the N days after the date at once. This is only valid when
+        the model has no dynamic or automatic component, i.e., the evaluation
+        and the transition do not change over time. The predictions can be
+        continued by _continuePredict.
+
+        Args:
+            date: the prediction starts (based on the observation before and
+                  on this date)
+            N: the number of days to predict.
+
+        Returns:
+            A tuple of two arrays (predicted_mean, predicted_variance)
+        """
+        if (
+            len(self.builder.dynamicComponents) > 0
+            or len(self.builder.automaticComponents) > 0
+        ):
+            raise NameError(
+                "Multiple days can only be predicted at once for models "
+                + "with only static components."
+            )
+
+        self._predictModel = self._forecastSnapshot(date)
+        self.result.predictStatus = self._predictModel.predictStatus
+        predictedObs, predictedObsVar = self.Filter.predictHorizon(
+            self._predictModel.model, N
+        )
+        self._predictModel.predictStatus[1] = date + N
+        self._predictModel.predictStatus[2].extend(predictedObs)
+        return (predictedObs, predictedObsVar)
+
+    def _backtest(self, horizon, start, end):
+        """Predict the next horizon days from every date between start and end
+        (the origins) based on the stored filtered results. The origins are
+        handled together: the states and covariances of all origins are
+        propagated by one batched product per horizon. The features of the
+        dynamic components are taken from the stored features and the auto
+        regressor uses the observations up to the origin and the predictions
+        after it, same as predictN.
+
+        Args:
+            horizon: the number of days to predict from each origin.
+            start: the first origin.
+            end: the last origin.
+
+        Returns:
+            A tuple of two (end - start + 1) x horizon arrays (predicted_mean,
+            predicted_variance). Entry [i, h] is the prediction of the date
+            start + i + h + 1 from the origin start + i. The dates beyond the
+            data are nan.
+        """
+        if start < self.result.filteredSteps[0] or end > self.result.filteredSteps[1]:
+            raise ValueError(
+                "The date has yet to be filtered yet. "
+                "Check the <filteredSteps> in <result> object."
+            )
+
+        origins = np.arange(start, end + 1)
+        state = self.result.filteredState[start : (end + 1), :, 0]
+        if self.result.filteredCov is not None and self.result.filteredCov.ndim == 3:
+            sysVar = self.result.filteredCov[start : (end + 1)]
+        else:
+            segment = {}
+            sysVar = np.array(
+                [self._loadFilterCov("filteredCov", t, segment) for t in origins]
+            )
+        noiseVar = self.result.noiseVar[start : (end + 1), 0, 0]
+
+        transition = self.builder.model.transition
+        features = {
+            name: np.array(self.builder.dynamicComponents[name].features, dtype=float)
+            for name in self.builder.dynamicComponents
+        }
+        data = np.array(self.padded_data, dtype=float)
+        predictedObs = np.full((len(origins), horizon), np.nan)
+        predictedObsVar = np.full((len(origins), horizon), np.nan)
+        for h in range(1, horizon + 1):
+            state = np.dot(state, transition.T)
+            sysVar = np.matmul(np.matmul(transition, sysVar), transition.T)
+            # the innovation is added once, on the first predicted day
+            if h == 1:
+                if self.Filter._innovationScale is not None:
+                    sysVar = sysVar + sysVar * self.Filter._innovationScale
+                else:
+                    sysVar = sysVar + self.builder.model.innovation
+
+            valid = origins + h < self.n
+            if not np.any(valid):
+                break
+            evaluation = self._backtestEvaluation(
+                origins, h, predictedObs, features, data
+            )
+            obs = np.sum(evaluation * state, axis=1)
+            sysVarF = np.matmul(sysVar, evaluation[:, :, np.newaxis])[:, :, 0]
+            obsVar = np.sum(evaluation * sysVarF, axis=1) + noiseVar
+            predictedObs[valid, h - 1] = obs[valid]
+            predictedObsVar[valid, h - 1] = obsVar[valid]
+
+        return (predictedObs, predictedObsVar)
+
+    def _backtestEvaluation(self, origins, h, predictedObs, features, data):
+        """Construct the evaluation of the date origin + h for all origins. The
+        dates beyond the data reuse the evaluation of the last date, their
+        predictions are discarded by _backtest.
+
+        Args:
+            origins: the origins of the predictions.
+            h: the horizon.
+            predictedObs: the predictions of the earlier horizons, used by the
+                          auto regressor.
+            features: the stored features of the dynamic components as arrays.
+            data: the padded data as an array.
+
+        Returns:
+            A len(origins) x d array.
+        """
+        steps = np.minimum(origins + h, self.n - 1)
+        evaluation = np.repeat(self.builder.model.evaluation, len(origins), axis=0)
+        evaluation = evaluation.astype(float)
+        componentIndex = self.builder.componentIndex
+
+        for name in self.builder.dynamicComponents:
+            indx = componentIndex[name]
+            evaluation[:, indx[0] : (indx[1] + 1)] = features[name][steps]
+
+        self._automaticEvaluation(evaluation, origins, steps, predictedObs, data)
+        return evaluation
+
+    def _automaticEvaluation(self, evaluation, origins, steps, predictedObs, data):
+        """Fill the evaluation of the automatic components for a batch of
+        predictions. Row i predicts the date steps[i] from the date origins[i].
+
+        Args:
+            evaluation: the batch x d evaluation to be filled.
+            origins: the origins of the predictions.
+            steps: the predicted dates.
+            predictedObs: the predictions of the earlier horizons of each row,
+                          used by the auto regressor.
+            data: the padded data as an array.
+        """
+        componentIndex = self.builder.componentIndex
+        for name in self.builder.automaticComponents:
+            comp = self.builder.automaticComponents[name]
+            indx = componentIndex[name]
+            if comp.componentType == "longSeason":
+                position = (steps // comp.stay) % comp.period
+                evaluation[:, indx[0] : (indx[1] + 1)] = np.eye(comp.period)[position]
+            else:
+                # autoReg, the observations up to the origin and the
+                # predictions after it, padded for the first few dates.
+                lags = steps[:, np.newaxis] - comp.d + np.arange(comp.d)
+                ahead = lags - origins[:, np.newaxis]
+                values = np.where(
+                    lags < 0, comp.padding, data[np.clip(lags, 0, self.n - 1)]
+                )
+                rows = np.arange(len(origins))[:, np.newaxis]
+                predicted = predictedObs[rows, np.clip(ahead - 1, 0, None)]
+                evaluation[:, indx[0] : (indx[1] + 1)] = np.where(
+                    ahead > 0, predicted, values
+                )
+
+    def _scenarioPredict(self, date, N, scenarios):
+        """Predict the N days after the date for a batch of scenarios, each
+        providing its own features of the dynamic components. The latent
+        states and their covariance are propagated once and shared by all
+        scenarios, only the evaluations differ.
+
+        Args:
+            date: the prediction starts (based on the observation before and
+                  on this date)
+            N: the number of days to predict.
+            scenarios: a list of featureDict, each in the form of
+                       {component_name: N feature vectors}. A dynamic
+                       component missing in a scenario uses its stored
+                       features.
+
+        Returns:
+            A tuple of two len(scenarios) x N arrays (predicted_mean,
+            predicted_variance)
+        """
+        S = len(scenarios)
+        componentIndex = self.builder.componentIndex
+
+        # the features of all scenarios, S x N x k for each dynamic component
+        features = {}
+        for name in self.builder.dynamicComponents:
+            comp = self.builder.dynamicComponents[name]
+            k = componentIndex[name][1] - componentIndex[name][0] + 1
+            stored = None
+            batch = np.empty((S, N, k))
+            for i, scenario in enumerate(scenarios):
+                if name in scenario:
+                    if len(scenario[name]) != N:
+                        raise NameError(
+                            "The features of " + name + " must have N elements."
+                        )
+                    batch[i] = np.reshape(np.array(scenario[name], dtype=float), (N, k))
+                else:
+                    if date + N > comp.n - 1:
+                        raise NameError(
+                            "Feature of "
+                            + name
+                            + " is missing for dates "
+                            + "beyond the data."
+                        )
+                    if stored is None:
+                        stored = np.array(
+                            comp.features[(date + 1) : (date + N + 1)], dtype=float
+                        )
+                    batch[i] = stored
+            features[name] = batch
+
+        model = self._forecastSnapshot(date).model
+        noiseVar = float(model.noiseVar[0, 0])
+        origins = np.full(S, date)
+        data = np.array(self.padded_data, dtype=float)
+        base = np.repeat(self.builder.model.evaluation, S, axis=0).astype(float)
+        predictedObs = np.full((S, N), np.nan)
+        predictedObsVar = np.full((S, N), np.nan)
+        for h in range(1, N + 1):
+            self.Filter.predict(model)
+            evaluation = base.copy()
+            for name in features:
+                indx = componentIndex[name]
+                evaluation[:, indx[0] : (indx[1] + 1)] = features[name][:, h - 1]
+            self._automaticEvaluation(
+                evaluation, origins, origins + h, predictedObs, data
+            )
+
+            predictedObs[:, h - 1] = np.dot(evaluation, model.prediction.state[:, 0])
+            predictedObsVar[:, h - 1] = (
+                np.einsum(
+                    "si,si->s", np.dot(evaluation, model.prediction.sysVar), evaluation
+                )
+                + noiseVar
+            )
+        return (predictedObs, predictedObsVar)
 
+    def _forecastSnapshot(self, date):
+        """Take the forecast state of a filtered date. Only the filtered
+        result of the date, the small matrices of the model and the last
+        observations needed by the automatic components are copied.
+
+        Args:
+            date: the date the forecast starts from.
+
+        Returns:
+            A @_forecastState.
+        """
+        if date > self.n - 1:
+            raise NameError("The date is beyond the data range.")
+        if date < self.result.filteredSteps[0] or date > self.result.filteredSteps[1]:
+            raise ValueError(
+                "The date has yet to be filtered yet. "
+                "Check the <filteredSteps> in <result> object."
+            )
+
+        model = self.builder.model
+        forecastModel = baseModel(
+            transition=model.transition.copy(),
+            evaluation=model.evaluation.copy(),
+            noiseVar=self.result.noiseVar[date].copy(),
+            sysVar=self._loadFilterCov("filteredCov", date, {}).copy(),
+            innovation=None if model.innovation is None else model.innovation.copy(),
+            state=self.result.filteredState[date].copy(),
+            df=int(self.result.df[date]),
+        )
+
+        features = {}
+        for name in self.builder.dynamicComponents:
+            comp = self.builder.dynamicComponents[name]
+            features[name] = {"features": comp.features, "n": comp.n, "overrides": {}}
+
+        automaticComponents = {}
+        window = 0
+        for name in self.builder.automaticComponents:
+            comp = self.builder.automaticComponents[name]
+            automaticComponents[name] = deepcopy(comp)
+            window = max(window, comp.d)
+
+        return self._forecastState(
+            model=forecastModel,
+            features=features,
+            automaticComponents=automaticComponents,
+            history=self._forecastHistory(self.padded_data, date, window),
+            date=date,
+        )
+
+    def _forecastNext(self, forecast, featureDict=None):
+        """Predict the day after the current date of a forecast state and move
+        the forecast state to that day.
+
+        Args:
+            forecast: the @_forecastState.
+            featureDict: the new feature value for some dynamic components.
+                         see @_oneDayAheadPredict
+
+        Returns:
+            A tuple of (predicted_mean, predicted_variance)
+        """
+        date = forecast.predictStatus[1] + 1
         self._constructEvaluationForPrediction(
-            date=currentDate + 1,
-            featureDict=featureDict,
-            padded_data=self.padded_data[: (startDate + 1)]
-            + self.result.predictStatus[2],
+            date=date, featureDict=featureDict, forecast=forecast
         )
-        self.Filter.predict(self.builder.model)
-        predictedObs = self.builder.model.prediction.obs
-        predictedObsVar = self.builder.model.prediction.obsVar
-        self.result.predictStatus[1] += 1
-        self.result.predictStatus[2].append(predictedObs[0, 0])
+
+        # the prediction of a new forecast state starts from the filtered state
+        self.Filter.predict(forecast.model)
+
+        predictedObs = forecast.model.prediction.obs
+        predictedObsVar = forecast.model.prediction.obsVar
+        forecast.predictStatus[1] = date
+        forecast.predictStatus[2].append(predictedObs[0, 0])
+        forecast.history.append(predictedObs[0, 0])
         return (predictedObs, predictedObsVar)
 
-    # This function will modify the status of the object, use with caution.
-    def _constructEvaluationForPrediction(
-        self, date, featureDict=None, padded_data=None
-    ):
-        """Construct the evaluation matrix based on date and featureDict.
+    def _constructEvaluationForPrediction(self, date, featureDict=None, forecast=None):
+        """Construct the evaluation matrix of a forecast state based on date and
+        featureDict.
 
         Used for prediction. Features provided in the featureDict will be used
         preferrably. If the feature is not found in featureDict, the algorithm
         will seek it based on the old data and the date.
 
         Args:
-            featureDict: a dictionary containing {dynamic_component_name: value}
-                         for update the feature for the corresponding component.
             date: if a dynamic component name is not found in featureDict, the
                   algorithm is using its old feature on the given date.
-            padded_data: is the mix of the raw data and the predicted data. It is
-                  used by auto regressor.
+            featureDict: a dictionary containing {dynamic_component_name: value}
+                         for update the feature for the corresponding component.
+            forecast: the @_forecastState whose evaluation is constructed. Its
+                      history is the mix of the raw data and the predicted
+                      data. It is used by auto regressor.
 
         """
-        # New features are provided. Update dynamic componnet.
-        # We distribute the featureDict back to dynamicComponents. If the date is
-        # out of bound, we append the feature to the feature set. If the date is
-        # within range, we replace the old feature with the new feature.
+        # New features are provided. We keep them in the forecast state instead
+        # of the dynamic components. If the date is out of bound, the feature
+        # extends the feature set. If the date is within range, the feature is
+        # used in place of the old feature.
         if featureDict is not None:
             for name in featureDict:
-                if name in self.builder.dynamicComponents:
-                    comp = self.builder.dynamicComponents[name]
-                    # the date is within range
-                    if date < comp.n:
-                        comp.features[date] = featureDict[name]
-                        comp.n += 1
-                    elif date < comp.n + 1:
-                        comp.features.append(featureDict[name])
-                        comp.n += 1
+                if name in forecast.features:
+                    source = forecast.features[name]
+                    if date < source["n"]:
+                        source["overrides"][date] = featureDict[name]
+                    elif date < source["n"] + 1:
+                        source["overrides"][date] = featureDict[name]
+                        source["n"] += 1
                     else:
                         raise NameError(
                             "Feature is missing between the last predicted "
                             + "day and the new day"
                         )
 
-        self.builder.updateEvaluation(date, padded_data)
+        evaluation = forecast.model.evaluation
+        componentIndex = self.builder.componentIndex
+        for name in forecast.features:
+            source = forecast.features[name]
+            if date in source["overrides"]:
+                feature = source["overrides"][date]
+            elif date < source["n"]:
+                feature = source["features"][date]
+            else:
+                raise ValueError("The step is out of range")
+            evaluation[0, componentIndex[name][0] : (componentIndex[name][1] + 1)] = (
+                np.array([feature])
+            )
+
+        for name in forecast.automaticComponents:
+            comp = forecast.automaticComponents[name]
+            comp.updateEvaluation(date, forecast.history)
+            evaluation[0, componentIndex[name][0] : (componentIndex[name][1] + 1)] = (
+                comp.evaluation
+            )
@@ -1,4 +1,3 @@
-from copy import deepcopy
 from numpy import matrix
 from pydlm.predict._dlmPredict import _dlmPredict
 
@@ -47,13 +46,9 @@ class dlmPredictModule(_dlmPredict):
                 "Prediction can only be made right" + " after the filtered date"
             )
 
-        # Clear the existing predictModel before the deepcopy to avoid recurrent
-        # recurrent copy which could explode the memory and complexity.
-        self._predictModel = None
-        self._predictModel = deepcopy(self)
-        return self._predictModel._oneDayAheadPredict(
-            date=date, featureDict=featureDict
-        )
+        # The prediction runs on a compact forecast state of the date, so
+        # neither the model nor its history is copied or changed.
+        return self._oneDayAheadPredict(date=date, featureDict=featureDict)
 
     def continuePredict(self, featureDict=None):
         """Continue prediction after the one-day ahead predict.
@@ -82,17 +77,19 @@ class dlmPredictModule(_dlmPredict):
         if self._predictModel is None:
             raise NameError("continuePredict has to come after predict.")
 
-        return self._predictModel._continuePredict(featureDict=featureDict)
+        return self._continuePredict(featureDict=featureDict)
 
     # N day ahead prediction
     def predictN(self, N=1, date=None, featureDict=None):
         """N day ahead prediction based on the current data.
 
         This function is a convenient wrapper of predict() and
-        continuePredict(). If the prediction is into the future, i.e, > n,
-        the featureDict has to contain all feature vectors for multiple days
-        for each dynamic component. For example, assume myDLM has a component
-        named 'spy' which posseses two dimensions,
+        continuePredict(). For models with only static components, all N days
+        are predicted at once from the powers of the transition matrix. If
+        the prediction is into the future, i.e, > n, the featureDict has to
+        contain all feature vectors for multiple days for each dynamic
+        component. For example, assume myDLM has a component named 'spy'
+        which posseses two dimensions,
 
         >>> featureDict_3day = {'spy': [[1, 2],[2, 3],[3, 4]]}
         >>> myDLM.predictN(N=3, featureDict=featureDict_3day)
@@ -115,6 +112,25 @@ class dlmPredictModule(_dlmPredict):
         """
         if N < 1:
             raise NameError("N has to be greater or equal to 1")
+
+        # The evaluation and the transition of models with only static
+        # components do not change, so all N days are predicted at once.
+        if (
+            len(self.builder.dynamicComponents) == 0
+            and len(self.builder.automaticComponents) == 0
+        ):
+            if date is None:
+                date = self.n - 1
+            if date > self.result.filteredSteps[1]:
+                raise NameError(
+                    "Prediction can only be made right" + " after the filtered date"
+                )
+            (predictedObs, predictedVar) = self._multiDayAheadPredict(date=date, N=N)
+            return (
+                self._1DmatrixToArray(predictedObs),
+                self._1DmatrixToArray(predictedVar),
+            )
+
         # Take care if features are numpy matrix
         if featureDict is not None:
             for name in featureDict:
@@ -143,3 +159,77 @@ class dlmPredictModule(_dlmPredict):
             self._1DmatrixToArray(predictedObs),
             self._1DmatrixToArray(predictedVar),
         )
+
+    # k-day ahead predictions from all historical dates
+    def backtest(self, horizon=1, start=None, end=None):
+        """Predict the next `horizon` days from every date between start and end
+        (the origins), as if predictN had been called on each of them. The
+        predictions use the stored filtered results and are computed for all
+        origins at once, so the model is neither copied nor changed. The
+        features of the dynamic components are those stored in the model.
+
+        >>> mean, var = myDLM.backtest(horizon=7)
+        >>> mean[i, h]  # prediction of date i + h + 1 from the date i
+
+        Args:
+            horizon: The number of days to predict from each origin.
+            start: The first origin. Default to the first day.
+            end: The last origin. Default to the day before the last day.
+
+        Returns:
+            A tuple of two (end - start + 1) x horizon arrays. (Predicted
+            observation, variance of the predicted observation). Entry [i, h]
+            is the prediction of the date start + i + h + 1 made on the date
+            start + i. Dates beyond the data are nan.
+        """
+        if horizon < 1:
+            raise NameError("horizon has to be greater or equal to 1")
+        if start is None:
+            start = 0
+        if end is None:
+            end = self.n - 2
+        if start > end:
+            raise NameError("start has to be earlier than end")
+
+        return self._backtest(horizon=horizon, start=start, end=end)
+
+    # N day ahead predictions for multiple feature scenarios
+    def predictScenarios(self, N=1, date=None, scenarios=None):
+        """N day ahead prediction for a batch of feature scenarios.
+
+        Each scenario is a featureDict as in predictN, e.g., the features of a
+        dynamic component with the promotion on or off. The predictions of all
+        scenarios are computed together from the same date, as if predictN
+        had been called with each of them. The latent states are propagated
+        once, so many scenarios cost about as much as one prediction.
+
+        >>> scenarios = [{'promo': [[0]] * 7}, {'promo': [[1]] * 7}]
+        >>> mean, var = myDLM.predictScenarios(N=7, scenarios=scenarios)
+        >>> mean[1, 6]  # the prediction of day 7 with the promotion on
+
+        Args:
+            N:    The length of days to predict.
+            date: The index when the prediction based on. Default to the
+                  last day.
+            scenarios: A list of featureDict, each in the form of
+                  {"component_name": feature}, where the feature must have N
+                  elements of feature vectors. A dynamic component missing in
+                  a scenario reuses the features stored in the component,
+                  which is only possible for dates within the data.
+
+        Returns:
+            A tuple of two len(scenarios) x N arrays. (Predicted observation,
+            variance of the predicted observation)
+        """
+        if N < 1:
+            raise NameError("N has to be greater or equal to 1")
+        if scenarios is None or len(scenarios) == 0:
+            raise NameError("scenarios has to contain at least one featureDict")
+        if date is None:
+            date = self.n - 1
+        if date > self.result.filteredSteps[1]:
+            raise NameError(
+                "Prediction can only be made right" + " after the filtered date"
+            )
+
+        return self._scenarioPredict(date=date, N=N, scenarios=scenarios)
@@ -7,7 +7,11 @@ The code for all tuning methods
 
 """
 
+from pydlm.base.batchKalmanFilter import batchKalmanFilter
 from pydlm.core._dlm import _dlm
+import pydlm.base.tools as tl
+
+import numpy as np
 
 
 class _dlmTune(_dlm):
@@ -15,25 +19,159 @@ class _dlmTune(_dlm):
 
     Methods:
         _getMSE: obtain the fitting model one-day ahead prediction MSE.
+        _getOneStepLoss: obtain the one-day ahead prediction losses that the
+                         forward filter has accumulated.
+        _getMSEGradient: obtain the MSE and its gradient with respect to the
+                         discounts in one forward filter pass.
+        _evaluateDiscounts: obtain the loss of many candidate discounts in
+                            one batched forward filter pass.
         _getDiscounts: obtain the discounts (for different components).
         _setDiscounts: set discounts for different components.
     """
 
     # get the mse from the model
     def _getMSE(self):
+        """The one-day ahead prediction MSE, same as the 'mse' of
+        _getOneStepLoss: the sum of the squared errors of the observed dates
+        divided by the number of all filtered dates (the missing dates
+        included).
+
+        """
+        return self._getOneStepLoss()["mse"]
+
+    # get the losses accumulated by the forward filter
+    def _getOneStepLoss(self):
+        """Get the one-day ahead prediction losses over the observed dates
+        that have been filtered. The forward filter keeps their running
+        totals (see @_result._saveLossTerms), so nothing is computed again.
+        The 'mse' and the 'mae' are divided by the number of all filtered
+        dates (the missing dates included) as _getMSE always has been.
+
+        Returns:
+            A dict of 'loglikelihood' (the sum of the log densities under
+            the Student t predictive distributions), 'mse', 'mae' and 'n'
+            (the number of the observed dates).
+        """
         if not self.initialized:
             raise NameError("need to fit the model first")
 
         if self.result.filteredSteps[1] == -1:
             raise NameError("need to run forward filter first")
 
-        mse = 0
-        for i in range(self.result.filteredSteps[0], self.result.filteredSteps[1] + 1):
-            if self.data[i] is not None:
-                mse += (self.data[i] - self.result.predictedObs[i]) ** 2
+        logLikelihood, sse, sae, n, invalid = self.result.lossTotals
+        days = self.result.filteredSteps[1] + 1 - self.result.filteredSteps[0]
+        return {
+            "loglikelihood": np.nan if invalid > 0 else float(logLikelihood),
+            "mse": float(sse) / days,
+            "mae": float(sae) / days,
+            "n": int(n),
+        }
+
+    # get the mse and its gradient with respect to the discounts
+    def _getMSEGradient(self):
+        """Run the forward filter over the whole data while carrying the
+        derivatives with respect to the discount of each component (see
+        @kalmanFilter.initSensitivity), so that one pass gives both the
+        one-day ahead prediction MSE and its gradient. The results of the
+        model are not saved.
+
+        Returns:
+            A tuple of (mse, gradient), the gradient is an array with one
+            entry per component, in the order of _getDiscounts.
+        """
+        if not self.initialized:
+            raise NameError("need to fit the model first")
 
-        mse = mse / (self.result.filteredSteps[1] + 1 - self.result.filteredSteps[0])
-        return mse[0, 0]
+        groups = [
+            self.builder.componentIndex[comp] for comp in self.builder.componentIndex
+        ]
+        self.Filter.resetSteadyState()
+        self._resetModelStatus()
+        sensitivity = self.Filter.initSensitivity(self.builder.model, groups)
+
+        mse = 0.0
+        gradient = np.zeros(len(groups))
+        for step in range(self.n):
+            if (
+                len(self.builder.dynamicComponents) > 0
+                or len(self.builder.automaticComponents) > 0
+            ):
+                self.builder.updateEvaluation(step, self.padded_data)
+            self.Filter.forwardFilter(
+                self.builder.model, self.data[step], sensitivity=sensitivity
+            )
+            if self.data[step] is not None:
+                err = self.data[step] - self.builder.model.prediction.obs[0, 0]
+                mse += err**2
+                gradient -= 2 * err * sensitivity["predObs"]
+            else:
+                # pad missing value with filtered result
+                self.padded_data[step] = self.builder.model.obs[0, 0]
+
+        # the model no longer matches the saved results
+        self.result.filteredSteps = [0, -1]
+        return (mse / self.n, gradient / self.n)
+
+    # get the loss of many candidate discounts at once
+    def _evaluateDiscounts(self, candidates, loss="mse"):
+        """Evaluate the one-day ahead prediction loss for a batch of candidate
+        discounts. The candidates are stacked on the batch axis of
+        @batchKalmanFilter, which filters the data once for all of them.
+        The model itself is not changed.
+
+        Args:
+            candidates: a M x K array (or list of lists) of discounts, one
+                        discount per component in the order of
+                        _getDiscounts.
+            loss: 'mse' for the one-day ahead prediction MSE (same as
+                  _getMSE) or 'loglikelihood' for the sum of the log
+                  densities of the observations under the Student t one-day
+                  ahead predictive distributions (same as _getOneStepLoss).
+
+        Returns:
+            An array of length M with the loss of each candidate.
+        """
+        if not self.initialized:
+            raise NameError("need to fit the model first")
+        if loss not in ("mse", "loglikelihood"):
+            raise NameError("loss can only be 'mse' or 'loglikelihood'")
+
+        candidates = np.array(candidates, dtype=float)
+        if candidates.ndim != 2 or candidates.shape[1] != len(
+            self.builder.componentIndex
+        ):
+            raise ValueError("candidates must be a M x K array.")
+        M = candidates.shape[0]
+
+        # expand the discount of each component to its latent states
+        discount = np.empty((M, len(self.builder.discount)))
+        for i, comp in enumerate(self.builder.componentIndex):
+            indx = self.builder.componentIndex[comp]
+            discount[:, indx[0] : (indx[1] + 1)] = candidates[:, i : (i + 1)]
+
+        data = np.array(self.data, dtype=float)
+        batchFilter = batchKalmanFilter(
+            self.builder,
+            updateInnovation=self.Filter.updateInnovation,
+            noise=self.builder.noiseVar[0, 0],
+        )
+        filtered = batchFilter.forwardFilter(
+            np.repeat(data[np.newaxis, :], M, axis=0), discount=discount, saveCov=False
+        )
+
+        observed = ~np.isnan(data)
+        err = data[observed] - filtered.predictedObs[:, observed]
+        if loss == "mse":
+            return np.sum(err**2, axis=1) / self.n
+        # the degree of freedom before the update of each date
+        return np.sum(
+            tl.studentLogDensity(
+                err,
+                filtered.predictedObsVar[:, observed],
+                filtered.df[:, observed] - 1,
+            ),
+            axis=1,
+        )
 
     # get the discount from the model
     def _getDiscounts(self):
@@ -9,7 +9,10 @@ class dlmTuneModule(_dlmTune):
 
     def getMSE(self):
         """Get the one-day ahead prediction mean square error. The mse is
-        estimated only for days that has been predicted.
+        estimated only for days that has been predicted: the sum of the
+        squared errors of the observed days divided by the number of all
+        filtered days, the missing days included. It is the same as the
+        'mse' of getOneStepLoss.
 
         Returns:
             An numerical value
@@ -17,7 +20,33 @@ class dlmTuneModule(_dlmTune):
 
         return self._getMSE()
 
-    def tune(self, maxit=100):
+    def getOneStepLoss(self):
+        """Get the one-day ahead prediction losses, which the forward filter
+        accumulates while filtering. The losses are over the observed days
+        that has been filtered. The 'mse' and the 'mae' are divided by the
+        number of all filtered days, the missing days included, same as
+        getMSE.
+
+        Returns:
+            A dict of 'loglikelihood' (the sum of the log predictive
+            densities), 'mse', 'mae' and 'n' (the number of the observed
+            days).
+        """
+
+        return self._getOneStepLoss()
+
+    def tune(
+        self,
+        maxit=100,
+        gradient="finite_difference",
+        executor=None,
+        method="gradient_descent",
+        maxtime=None,
+        maxfev=None,
+        loss="mse",
+        tol=1e-6,
+        gtol=1e-6,
+    ):
         """Automatic tuning of the discounting factors.
 
         The method will call the model tuner class to use the default parameters
@@ -26,14 +55,35 @@ class dlmTuneModule(_dlmTune):
 
         If user wants a more refined tuning and not change any property of the
         existing model, they should opt to use the @modelTuner class.
+
+        Args:
+            maxit: the maximum number of iterations.
+            gradient: 'finite_difference' or 'analytic', see @modelTuner.
+            executor: an optional concurrent.futures executor for the
+                      finite difference refits, see @modelTuner.
+            method: 'gradient_descent' or 'l-bfgs-b', see @modelTuner.
+            maxtime: the budget of the wall-clock time in seconds.
+            maxfev: the budget of the number of model fits.
+            loss: 'mse', 'mae' or 'loglikelihood', see @modelTuner.
+            tol: the tolerance of the relative change of the loss.
+            gtol: the tolerance of the norm of the projected gradient.
         """
-        simpleTuner = modelTuner()
+        simpleTuner = modelTuner(
+            method=method, loss=loss, gradient=gradient, executor=executor
+        )
 
         if self._logger.isEnabledFor(logging.INFO):
             self.fitForwardFilter()
             self._logger.info(f"The current mse is { str(self.getMSE()) }.")
 
-        simpleTuner.tune(untunedDLM=self, maxit=maxit)
+        simpleTuner.tune(
+            untunedDLM=self,
+            maxit=maxit,
+            tol=tol,
+            gtol=gtol,
+            maxtime=maxtime,
+            maxfev=maxfev,
+        )
         self._setDiscounts(simpleTuner.getDiscounts(), change_component=True)
 
         if self._logger.isEnabledFor(logging.INFO):
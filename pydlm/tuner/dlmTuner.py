@@ -25,86 +25,327 @@ original one, one should opt to use the modelTuner class.
 """
 
 from copy import deepcopy
-from numpy import array
+from functools import partial
+from numpy import argmax, argmin, array, array_split, concatenate
+from numpy.linalg import norm
 import logging
+import os
+import time
 
 
 class modelTuner:
     """The main class for modelTuner
 
     Attributes:
-        method: the optimization method. Currently only 'gradient_descent'
-                is supported.
-        loss:   the optimization loss function. Currently only 'mse' (one-day
-                ahead prediction) is supported.
+        method: the optimization method. 'gradient_descent' (projected, with
+                a backtracking line search) or 'l-bfgs-b' (requires scipy).
+        loss:   the optimization loss function of the one-day ahead
+                prediction. 'mse', 'mae' or 'loglikelihood' (the mean negative
+                log predictive density is minimized). 'mae' and
+                'loglikelihood' are read from the totals that the forward
+                filter accumulates, see @_dlmTune._getOneStepLoss.
+        gradient: how the gradient is computed. 'finite_difference' refits
+                  the model once for each component, 'analytic' carries the
+                  derivatives through the forward filter and gets the mse and
+                  the gradient in one pass (only for the 'mse' loss).
+        executor: an optional concurrent.futures executor, e.g., a
+                  ProcessPoolExecutor, to run the refits of find_gradient and
+                  the candidate chunks of search in parallel. The workers
+                  rebuild the model from a compact spec (the data, the
+                  components and the options) instead of receiving the fitted
+                  dlm with its results.
+        workers: the number of workers of the executor, the candidates of
+                 search are split into one chunk for each worker. Default to
+                 the number of cpus, the default size of the executors of
+                 concurrent.futures.
+        iterations: the number of iterations of the last tune.
+        evaluations: the number of model fits of the last tune.
+        converged: whether the last tune converged.
+        current_mse: the current value of the loss being minimized.
 
     """
 
-    def __init__(self, method="gradient_descent", loss="mse"):
+    def __init__(
+        self,
+        method="gradient_descent",
+        loss="mse",
+        gradient="finite_difference",
+        executor=None,
+        workers=None,
+    ):
         self.method = method
         self.loss = loss
+        self.gradient = gradient
+        self.executor = executor
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
         self.current_mse = None
         self.err = 1e-4
         self.discounts = None
-
-    def tune(self, untunedDLM, maxit=100, step=1.0):
+        self.losses = None
+        self.iterations = 0
+        self.evaluations = 0
+        self.converged = False
+        self._deadline = None
+        self._maxfev = None
+
+    def tune(
+        self,
+        untunedDLM,
+        maxit=100,
+        step=1.0,
+        tol=1e-6,
+        gtol=1e-6,
+        maxtime=None,
+        maxfev=None,
+    ):
         """Main function for tuning the DLM model.
 
+        The tuning stops when the norm of the projected gradient falls below
+        gtol, when the relative change of the mse falls below tol, or when
+        maxit, maxtime or maxfev runs out. Only the first two count as
+        converged.
+
         Args:
             untunedDLM: The DLM object that needs tuning
-            maxit: The maximum number of iteractions for gradient descent.
-            step: the moving length at each iteraction.
+            maxit: The maximum number of iteractions.
+            step: the initial moving length at each iteraction. The
+                  'gradient_descent' method backtracks from it until the loss
+                  decreases enough (the Armijo condition).
+            tol: the tolerance of the relative change of the loss.
+            gtol: the tolerance of the norm of the projected gradient.
+            maxtime: the budget of the wall-clock time in seconds.
+            maxfev: the budget of the number of model fits. A finite
+                    difference gradient costs one fit for each component.
 
         Returns:
             A tuned DLM object in unintialized status.
         """
+        if self.method not in ("gradient_descent", "l-bfgs-b"):
+            raise NameError("method can only be 'gradient_descent' or 'l-bfgs-b'")
+        if self.loss not in ("mse", "mae", "loglikelihood"):
+            raise NameError("loss can only be 'mse', 'mae' or 'loglikelihood'")
+        if self.gradient == "analytic" and self.loss != "mse":
+            raise NameError("the analytic gradient is only for the 'mse' loss")
+
         # make a deep copy of the original dlm
         tunedDLM = deepcopy(untunedDLM)
 
         if not tunedDLM.initialized:
             tunedDLM.fitForwardFilter()
-        discounts = array(tunedDLM._getDiscounts())
-        self.current_mse = tunedDLM._getMSE()
+        discounts = array(tunedDLM._getDiscounts(), dtype=float)
+        self.current_mse = _objective(tunedDLM, self.loss)
+        self.iterations = 0
+        self.evaluations = 0
+        self.converged = False
+        self._deadline = None if maxtime is None else time.monotonic() + maxtime
+        self._maxfev = maxfev
+
+        # Disable all info and warning for faster processing.
+        log_level = tunedDLM.getLoggingLevel()
+        tunedDLM.setLoggingLevel("CRITICAL")
 
-        # using gradient descent
         if self.method == "gradient_descent":
-            # Disable all info and warning for faster processing.
-            log_level = tunedDLM.getLoggingLevel()
-            tunedDLM.setLoggingLevel("CRITICAL")
-
-            for i in range(maxit):
-                gradient = self.find_gradient(discounts, tunedDLM)
-                discounts -= gradient * step
-                discounts = list(map(lambda x: self.cutoff(x), discounts))
-                tunedDLM._setDiscounts(discounts)
-                tunedDLM.fitForwardFilter()
-                self.current_mse = tunedDLM._getMSE()
-
-            # Recover logger level
-            tunedDLM.setLoggingLevel(log_level)
-
-            if i < maxit - 1:
-                tunedDLM._logger.info("Converge successfully!")
+            discounts = self._gradientDescent(
+                tunedDLM, discounts, maxit, step, tol, gtol
+            )
+        else:
+            discounts = self._lbfgsb(tunedDLM, discounts, maxit, tol, gtol)
+
+        # leave the model fitted at the tuned discounts
+        self.current_mse = self._loss(tunedDLM, discounts)
+
+        # Recover logger level
+        tunedDLM.setLoggingLevel(log_level)
+
+        if self.converged:
+            tunedDLM._logger.info(
+                f"Converge successfully after {self.iterations} iterations!"
+            )
+        else:
+            tunedDLM._logger.warning("The algorithm stops without converging.")
+            if min(discounts) <= 0.7 + self.err or max(discounts) >= 1 - 2 * self.err:
+                tunedDLM._logger.info(
+                    "Possible reason: some discount is too close to 1 or 0.7"
+                    " (0.7 is smallest discount that is permissible."
+                )
             else:
-                tunedDLM._logger.warning("The algorithm stops without converging.")
-                if (
-                    min(discounts) <= 0.7 + self.err
-                    or max(discounts) >= 1 - 2 * self.err
-                ):
-                    tunedDLM._logger.info(
-                        "Possible reason: some discount is too close to 1 or 0.7"
-                        " (0.7 is smallest discount that is permissible."
-                    )
-                else:
-                    tunedDLM._logger.info(
-                        "It might require more step to converge."
-                        " Use tune(..., maixt = <a larger number>) instead."
-                    )
+                tunedDLM._logger.info(
+                    "It might require more step to converge."
+                    " Use tune(..., maixt = <a larger number>) instead."
+                )
 
         self.discounts = discounts
         tunedDLM._setDiscounts(discounts, change_component=True)
         return tunedDLM
 
+    def _gradientDescent(self, DLM, discounts, maxit, step, tol, gtol):
+        """Projected gradient descent with a backtracking line search"""
+        mse, gradient = self._lossAndGradient(DLM, discounts)
+        for i in range(maxit):
+            self.iterations = i
+            if norm(discounts - self._project(discounts - gradient)) <= gtol:
+                self.converged = True
+                break
+            if self._outOfBudget():
+                break
+
+            # halve the step until the Armijo condition holds
+            length = step
+            while True:
+                newDiscounts = self._project(discounts - length * gradient)
+                decrease = gradient.dot(discounts - newDiscounts)
+                newMse, newGradient = self._trial(DLM, newDiscounts)
+                if newMse <= mse - 1e-4 * decrease:
+                    break
+                length /= 2
+                if length * norm(gradient) < self.err or self._outOfBudget():
+                    break
+
+            self.iterations = i + 1
+            # no step along the gradient decreases the mse
+            if newMse > mse:
+                self.converged = length * norm(gradient) < self.err
+                break
+
+            change = abs(mse - newMse) / max(abs(mse), 1e-300)
+            discounts, mse = newDiscounts, newMse
+            if change <= tol:
+                self.converged = True
+                break
+            if newGradient is None:
+                gradient = self._gradient(DLM, discounts, mse)
+            else:
+                gradient = newGradient
+
+        return discounts
+
+    def _lbfgsb(self, DLM, discounts, maxit, tol, gtol):
+        """L-BFGS-B over the box of the permissible discounts"""
+        try:
+            from scipy.optimize import minimize
+        except ImportError:
+            raise ImportError("the 'l-bfgs-b' method requires scipy.")
+
+        best = {"mse": self.current_mse, "discounts": discounts}
+
+        def objective(x):
+            if self._outOfBudget():
+                raise _budgetExhausted
+            mse, gradient = self._lossAndGradient(DLM, x)
+            if mse < best["mse"]:
+                best.update(mse=mse, discounts=array(x, dtype=float))
+            return mse, gradient
+
+        try:
+            result = minimize(
+                objective,
+                discounts,
+                jac=True,
+                method="L-BFGS-B",
+                bounds=[(0.7, 0.99999)] * len(discounts),
+                options={"maxiter": maxit, "ftol": tol, "gtol": gtol},
+            )
+            self.iterations = result.nit
+            self.converged = result.success
+        except _budgetExhausted:
+            pass
+
+        return best["discounts"]
+
+    def _trial(self, DLM, discounts):
+        """The loss at a trial point of the line search. The analytic
+        gradient comes with the loss in the same pass, so it is returned
+        too (None otherwise) and reused once the point is accepted.
+
+        """
+        if self.gradient == "analytic":
+            return self._lossAndGradient(DLM, discounts)
+        return self._loss(DLM, discounts), None
+
+    def _loss(self, DLM, discounts):
+        DLM._setDiscounts(discounts)
+        DLM.fitForwardFilter()
+        self.evaluations += 1
+        return _objective(DLM, self.loss)
+
+    def _gradient(self, DLM, discounts, mse):
+        """The gradient at the discounts, whose mse is known"""
+        if self.gradient == "analytic":
+            DLM._setDiscounts(discounts)
+            self.evaluations += 1
+            return DLM._getMSEGradient()[1]
+
+        self.current_mse = mse
+        self.evaluations += len(discounts)
+        return self.find_gradient(discounts, DLM)
+
+    def _lossAndGradient(self, DLM, discounts):
+        if self.gradient == "analytic":
+            DLM._setDiscounts(discounts)
+            self.evaluations += 1
+            return DLM._getMSEGradient()
+
+        mse = self._loss(DLM, discounts)
+        return mse, self._gradient(DLM, discounts, mse)
+
+    def _project(self, discounts):
+        return array(list(map(self.cutoff, discounts)))
+
+    def _outOfBudget(self):
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            return True
+        return self._maxfev is not None and self.evaluations >= self._maxfev
+
+    def search(self, untunedDLM, candidates, loss=None, chunks=None):
+        """Search the best discount factors among a batch of candidates.
+
+        All candidates are evaluated by one batched forward filter, see
+        @_dlmTune._evaluateDiscounts, so a grid or random search over the
+        discounts costs about one pass over the data. The losses of all
+        candidates are kept in `losses`.
+
+        Args:
+            untunedDLM: The DLM object that needs tuning
+            candidates: a M x K array of discounts, one discount for each of
+                        the K components.
+            loss: 'mse' (the smallest wins) or 'loglikelihood' (the largest
+                  wins). Default to the loss of the tuner.
+            chunks: the number of chunks of the candidates mapped over the
+                    executor, each chunk rebuilds the model once. Default to
+                    the workers of the tuner.
+
+        Returns:
+            A tuned DLM object in unintialized status.
+        """
+        tunedDLM = deepcopy(untunedDLM)
+        if not tunedDLM.initialized:
+            tunedDLM.fitForwardFilter()
+
+        if loss is None:
+            loss = self.loss
+        if self.executor is None:
+            self.losses = tunedDLM._evaluateDiscounts(candidates, loss=loss)
+        else:
+            if chunks is None:
+                chunks = self.workers
+            split = array_split(array(candidates, dtype=float), chunks)
+            split = [chunk for chunk in split if len(chunk) > 0]
+            self.losses = concatenate(
+                list(
+                    self.executor.map(
+                        partial(_evaluateDiscounts, _modelSpec(tunedDLM), loss),
+                        split,
+                    )
+                )
+            )
+        best = argmin(self.losses) if loss == "mse" else argmax(self.losses)
+        if loss == "mse":
+            self.current_mse = self.losses[best]
+
+        self.discounts = array(candidates, dtype=float)[best]
+        tunedDLM._setDiscounts(self.discounts, change_component=True)
+        return tunedDLM
+
     def getDiscounts(self):
         """Get the tuned discounting factors. One for each component (even the
         component being multi-dimensional, only one discounting factor will
@@ -115,17 +356,27 @@ class modelTuner:
 
     def find_gradient(self, discounts, DLM):
         if self.current_mse is None:
-            self.current_mse = DLM._getMSE()
+            self.current_mse = _objective(DLM, self.loss)
 
         gradient = array([0.0] * len(discounts))
 
+        # each refit perturbs one discount from the current ones
+        perturbed = []
         for i in range(len(discounts)):
-            discounts_err = discounts
+            discounts_err = array(discounts, dtype=float)
             discounts_err[i] = self.cutoff(discounts_err[i] + self.err)
-
-            DLM._setDiscounts(discounts_err)
-            DLM.fitForwardFilter()
-            gradient[i] = (DLM._getMSE() - self.current_mse) / self.err
+            perturbed.append(discounts_err)
+
+        if self.executor is None:
+            for i in range(len(discounts)):
+                DLM._setDiscounts(perturbed[i])
+                DLM.fitForwardFilter()
+                gradient[i] = (_objective(DLM, self.loss) - self.current_mse) / self.err
+        else:
+            values = self.executor.map(
+                partial(_fitLoss, _modelSpec(DLM), self.loss), perturbed
+            )
+            gradient = (array(list(values)) - self.current_mse) / self.err
 
         return gradient
 
@@ -137,3 +388,62 @@ class modelTuner:
             return 0.99999
 
         return a
+
+
+def _objective(DLM, loss):
+    """The value of the loss that the tuner minimizes for a fitted dlm"""
+    oneStepLoss = DLM._getOneStepLoss()
+    if loss in ("mse", "mae"):
+        return oneStepLoss[loss]
+    return -oneStepLoss["loglikelihood"] / max(oneStepLoss["n"], 1)
+
+
+class _budgetExhausted(Exception):
+    """Raised inside the objective of L-BFGS-B to stop at the budget"""
+
+
+# The functions below run in the workers of modelTuner.executor. They are module
+# level functions so that the process pools can pickle them.
+def _modelSpec(DLM):
+    """The compact spec to rebuild a dlm in the workers: the data, the
+    components and the fitting options. The results are left out.
+
+    """
+    options = dict(vars(DLM.options))
+    options.pop("logger")
+    # the workers only need the one-day ahead predictions
+    options.update(
+        covRetention="none",
+        resultDir=None,
+        workers=None,
+        innovationType=DLM.Filter.updateInnovation,
+    )
+    components = [DLM._fetchComponent(name) for name in DLM.builder.componentIndex]
+    return {"data": list(DLM.data), "components": components, "options": options}
+
+
+def _buildFromSpec(spec):
+    """Rebuild and initialize the dlm from the spec of _modelSpec"""
+    # pydlm.dlm depends on this module, so it is imported here
+    from pydlm.dlm import dlm
+
+    DLM = dlm(spec["data"])
+    vars(DLM.options).update(spec["options"])
+    for component in spec["components"]:
+        DLM.add(deepcopy(component))
+    DLM.setLoggingLevel("CRITICAL")
+    DLM._initialize()
+    return DLM
+
+
+def _fitLoss(spec, loss, discounts):
+    """The loss of the spec under the discounts, see @_objective"""
+    DLM = _buildFromSpec(spec)
+    DLM._setDiscounts(discounts)
+    DLM.fitForwardFilter()
+    return _objective(DLM, loss)
+
+
+def _evaluateDiscounts(spec, loss, candidates):
+    """The losses of the spec under a chunk of candidate discounts"""
+    return _buildFromSpec(spec)._evaluateDiscounts(candidates, loss=loss)
@@ -140,6 +140,7 @@ class testDlmAccessMod(unittest.TestCase):
         self.dlm5.result.filteredSteps = [0, 99]
 
         filteredTrend = self.dlm5.getLatentCov(filterType="forwardFilter")
+        self.assertIsInstance(filteredTrend, list)
         np.testing.assert_array_equal(filteredTrend, self.dlm5.result.filteredCov)
 
         # for predict filter
@@ -0,0 +1,110 @@
+import numpy as np
+import unittest
+
+from pydlm.modeler.trends import trend
+from pydlm.modeler.seasonality import seasonality
+from pydlm.modeler.dynamic import dynamic
+from pydlm.modeler.autoReg import autoReg
+from pydlm.modeler.builder import builder
+from pydlm.base.batchKalmanFilter import batchKalmanFilter
+from pydlm.dlm import dlm
+
+
+class testBatchKalmanFilter(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(1)
+        self.n = 30
+        self.data = np.random.random((3, self.n)).tolist()
+        self.data[1][5] = None
+        self.data[1][6] = None
+        self.data[2][20] = None
+        self.features = np.random.random((self.n, 2)).tolist()
+
+    def makeComponents(self, withAutoReg):
+        components = [
+            trend(degree=1, discount=0.95, w=1.0),
+            seasonality(period=3, discount=0.98, w=1.0),
+            dynamic(features=self.features, discount=0.99, w=1.0),
+        ]
+        if withAutoReg:
+            components.append(autoReg(degree=2, discount=0.97, w=1.0))
+        return components
+
+    def fitSingle(self, series, innovationType, withAutoReg):
+        mydlm = dlm(series)
+        for comp in self.makeComponents(withAutoReg):
+            mydlm + comp
+        mydlm.options.innovationType = innovationType
+        mydlm.setLoggingLevel("CRITICAL")
+        mydlm.fitForwardFilter()
+        return mydlm
+
+    def assertBatchMatches(self, data, innovationType, withAutoReg=False):
+        template = builder()
+        for comp in self.makeComponents(withAutoReg):
+            template + comp
+        result = batchKalmanFilter(
+            template, updateInnovation=innovationType
+        ).forwardFilter(data)
+
+        for s in range(len(data)):
+            single = self.fitSingle(list(data[s]), innovationType, withAutoReg)
+            np.testing.assert_allclose(
+                result.filteredObs[s], single.getMean(), rtol=1e-8, atol=1e-10
+            )
+            np.testing.assert_allclose(
+                result.predictedObsVar[s],
+                single.getVar(filterType="predict"),
+                rtol=1e-8,
+            )
+            np.testing.assert_allclose(
+                result.filteredState[s],
+                np.array(single.getLatentState()),
+                rtol=1e-6,
+                atol=1e-10,
+            )
+            np.testing.assert_allclose(
+                result.filteredCov[s, -1],
+                single.result.filteredCov[-1],
+                rtol=1e-6,
+                atol=1e-10,
+            )
+
+    def testForwardFilterWholeInnovation(self):
+        self.assertBatchMatches(self.data, "whole")
+
+    def testForwardFilterComponentInnovation(self):
+        self.assertBatchMatches(self.data, "component")
+
+    def testForwardFilterAutoReg(self):
+        self.assertBatchMatches(self.data, "component", withAutoReg=True)
+
+    def testPerSeriesDiscountAndFeatures(self):
+        template = builder() + trend(degree=0, discount=0.9, w=1.0)
+        template + dynamic(features=self.features, discount=1.0, w=1.0, name="x")
+        features = np.random.random((2, self.n, 2))
+        featureDict = {"x": features.tolist()}
+        result = batchKalmanFilter(template).forwardFilter(
+            [self.data[0], self.data[0]],
+            features=featureDict,
+            discount=[[0.9, 1.0, 1.0], [0.8, 1.0, 1.0]],
+            saveCov=False,
+        )
+        self.assertIsNone(result.filteredCov)
+        # the features of the caller are not converted in place
+        self.assertIsInstance(featureDict["x"], list)
+
+        single = dlm(self.data[0]) + trend(degree=0, discount=0.8, w=1.0)
+        single + dynamic(features=features[1].tolist(), discount=1.0, w=1.0)
+        single.setLoggingLevel("CRITICAL")
+        single.fitForwardFilter()
+        np.testing.assert_allclose(result.filteredObs[1], single.getMean())
+
+    def testFeatureSizeMismatch(self):
+        template = builder() + dynamic(features=self.features[:10], name="x")
+        with self.assertRaises(ValueError):
+            batchKalmanFilter(template).forwardFilter(self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
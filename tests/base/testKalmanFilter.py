@@ -1,5 +1,7 @@
 import numpy as np
 import unittest
+from copy import deepcopy
+from unittest import mock
 
 from pydlm.modeler.trends import trend
 from pydlm.modeler.seasonality import seasonality
@@ -63,6 +65,306 @@ class testKalmanFilter(unittest.TestCase):
         self.assertAlmostEqual(dlm.model.state[0][0], -0.5)
         self.assertAlmostEqual(dlm.model.state[1][0], 0.5)
 
+    def testForwardFilterScalarObservation(self):
+        dlm = builder()
+        dlm.add(self.trend1)
+        dlm.add(seasonality(period=3, discount=1, w=1.0))
+        dlm.initialize()
+        kf = kalmanFilter(discount=[0.9] * 5)
+
+        kf.predict(dlm.model)
+        state = dlm.model.prediction.state
+        sysVar = dlm.model.prediction.sysVar
+        obsVar = dlm.model.prediction.obsVar
+        noiseVar = dlm.model.noiseVar
+
+        # compare with the dense matrix version of the update
+        dlm.model.prediction.step = 0
+        kf.forwardFilter(dlm.model, 2.0)
+        err = 2.0 - np.dot(dlm.model.evaluation, state)
+        correction = np.dot(sysVar, dlm.model.evaluation.T) / obsVar
+        newNoiseVar = noiseVar * (1.0 - 1.0 / 2 + err * err / 2 / obsVar)
+        expectSysVar = (
+            newNoiseVar[0, 0]
+            / noiseVar[0, 0]
+            * (sysVar - np.dot(correction, correction.T) * obsVar[0, 0])
+        )
+        np.testing.assert_allclose(dlm.model.state, state + correction * err)
+        np.testing.assert_allclose(dlm.model.sysVar, expectSysVar)
+        np.testing.assert_allclose(dlm.model.noiseVar, newNoiseVar)
+        self.assertEqual(dlm.model.obs.shape, (1, 1))
+        self.assertEqual(dlm.model.obsVar.shape, (1, 1))
+
+    def testLongSeriesForwardFilter(self):
+        for fused in [False, True]:
+            with self.subTest(fused=fused):
+                self.assertLongSeriesMatchesDense(fused)
+
+    def assertLongSeriesMatchesDense(self, fused):
+        dlm = builder()
+        dlm.add(trend(degree=1, discount=0.98, w=1.0))
+        dlm.add(seasonality(period=7, discount=0.99, w=1.0))
+        dlm.initialize()
+        kf = kalmanFilter(
+            discount=dlm.discount,
+            updateInnovation="component",
+            index=dlm.componentIndex,
+            transitionType=dlm.transitionType,
+            fused=fused,
+        )
+
+        # the dense matrix version of the recursion as the reference
+        transition = dlm.model.transition
+        evaluation = dlm.model.evaluation
+        discount = np.diag(1 / np.sqrt(dlm.discount))
+        mask = np.zeros(transition.shape)
+        for start, end in dlm.componentIndex.values():
+            mask[start : end + 1, start : end + 1] = 1
+        state = dlm.model.state.copy()
+        sysVar = dlm.model.sysVar.copy()
+        noiseVar = dlm.model.noiseVar.copy()
+        df = dlm.model.df
+
+        np.random.seed(0)
+        t = np.arange(1500)
+        data = 0.01 * t + np.sin(2 * np.pi * t / 7) + np.random.normal(0, 0.3, 1500)
+        for y in data:
+            kf.forwardFilter(dlm.model, y)
+
+            state = np.dot(transition, state)
+            sysVar = np.dot(np.dot(transition, sysVar), transition.T)
+            sysVar += mask * (np.dot(np.dot(discount, sysVar), discount) - sysVar)
+            obsVar = np.dot(np.dot(evaluation, sysVar), evaluation.T) + noiseVar
+            err = y - np.dot(evaluation, state)
+            correction = np.dot(sysVar, evaluation.T) / obsVar
+            df += 1
+            lastNoiseVar = noiseVar
+            noiseVar = noiseVar * (1.0 - 1.0 / df + err * err / df / obsVar)
+            state = state + correction * err
+            sysVar = (
+                noiseVar[0, 0]
+                / lastNoiseVar[0, 0]
+                * (sysVar - np.dot(correction, correction.T) * obsVar[0, 0])
+            )
+
+            np.testing.assert_array_equal(dlm.model.sysVar, dlm.model.sysVar.T)
+        np.testing.assert_allclose(dlm.model.state, state)
+        np.testing.assert_allclose(dlm.model.sysVar, sysVar, atol=1e-9)
+        np.testing.assert_allclose(dlm.model.obs, np.dot(evaluation, state), rtol=1e-10)
+
+    def testStructuredPropagation(self):
+        dlm = builder()
+        dlm.add(trend(degree=2, discount=0.9, w=1.0))
+        dlm.add(seasonality(period=4, discount=0.95, w=1.0))
+        dlm.initialize()
+        kf = kalmanFilter(
+            discount=dlm.discount,
+            updateInnovation="component",
+            index=dlm.componentIndex,
+            transitionType=dlm.transitionType,
+        )
+        kf._minStructuredDim = 0
+        kf._setTransitionStructure()
+
+        np.random.seed(0)
+        state = np.random.random((dlm.model.transition.shape[0], 1))
+        sysVar = np.random.random(dlm.model.sysVar.shape)
+        sysVar = np.dot(sysVar, sysVar.T)
+        transition = dlm.model.transition
+        newState, newSysVar = kf._propagate(transition, state, sysVar)
+        np.testing.assert_allclose(newState, np.dot(transition, state))
+        np.testing.assert_allclose(
+            newSysVar, np.dot(np.dot(transition, sysVar), transition.T)
+        )
+        # the inputs are not modified
+        self.assertFalse(np.allclose(newState, state))
+
+    def testStructuredForwardFilter(self):
+        models = []
+        for i in range(2):
+            dlm = builder()
+            dlm.add(trend(degree=1, discount=0.95, w=1.0))
+            dlm.add(seasonality(period=52, discount=0.98, w=1.0))
+            dlm.initialize()
+            models.append(dlm)
+        structured = kalmanFilter(
+            discount=models[0].discount,
+            updateInnovation="component",
+            index=models[0].componentIndex,
+            transitionType=models[0].transitionType,
+        )
+        dense = kalmanFilter(
+            discount=models[1].discount,
+            updateInnovation="component",
+            index=models[1].componentIndex,
+        )
+        self.assertIsNotNone(structured._transitionBlocks)
+
+        np.random.seed(0)
+        for y in list(np.random.random(60)) + [None, 1.0]:
+            structured.forwardFilter(models[0].model, y)
+            dense.forwardFilter(models[1].model, y)
+        np.testing.assert_allclose(models[0].model.state, models[1].model.state)
+        np.testing.assert_allclose(
+            models[0].model.sysVar, models[1].model.sysVar, atol=1e-8
+        )
+
+    def testFusedForwardFilter(self):
+        models = []
+        for i in range(2):
+            dlm = builder()
+            dlm.add(trend(degree=1, discount=0.95, w=1.0))
+            dlm.add(seasonality(period=52, discount=0.98, w=1.0))
+            dlm.initialize()
+            models.append(dlm.model)
+        filters = [
+            kalmanFilter(
+                discount=dlm.discount,
+                updateInnovation="component",
+                index=dlm.componentIndex,
+                transitionType=dlm.transitionType,
+                fused=fused,
+            )
+            for fused in [True, False]
+        ]
+
+        np.random.seed(0)
+        for y in list(np.random.random(20)) + [None, None, 1.0, None, 2.0]:
+            for kf, model in zip(filters, models):
+                kf.forwardFilter(model, y)
+            for name in ["state", "sysVar", "obs", "obsVar", "noiseVar"]:
+                np.testing.assert_allclose(
+                    getattr(models[0], name), getattr(models[1], name)
+                )
+            np.testing.assert_allclose(
+                models[0].prediction.sysVar, models[1].prediction.sysVar
+            )
+        # the fused filter works on its own buffers
+        self.assertIs(models[0].sysVar, filters[0]._buffers["sysVar"])
+
+    def testSteadyStateForwardFilter(self):
+        models = []
+        for i in range(2):
+            dlm = builder()
+            dlm.add(trend(degree=1, discount=0.9, w=1.0))
+            dlm.add(seasonality(period=7, discount=0.95, w=1.0))
+            dlm.initialize()
+            models.append(dlm.model)
+        filters = [
+            kalmanFilter(
+                discount=dlm.discount,
+                updateInnovation="component",
+                index=dlm.componentIndex,
+                transitionType=dlm.transitionType,
+                steadyState=steadyState,
+            )
+            for steadyState in [True, False]
+        ]
+
+        # the full recursion itself still moves by about steadyStateTol per
+        # step after it has converged, so the drift between the two filters
+        # is allowed to build up to a small multiple of it
+        tol = 100 * filters[0].steadyStateTol
+        np.random.seed(0)
+        data = list(np.random.random(400))
+        data[350] = None
+        steady = []
+        for y in data:
+            for kf, model in zip(filters, models):
+                kf.forwardFilter(model, y)
+            steady.append(filters[0]._steady is not None)
+            for name in ["state", "obs", "obsVar", "noiseVar"]:
+                expected = getattr(models[1], name)
+                np.testing.assert_allclose(
+                    getattr(models[0], name),
+                    expected,
+                    rtol=tol,
+                    atol=tol * np.max(np.abs(expected)),
+                )
+        # the steady state is reached and dropped on the missing data
+        self.assertTrue(steady[349])
+        self.assertFalse(steady[350])
+
+        filters[0].resetSteadyState()
+        self.assertIsNone(filters[0]._steady)
+
+    def testPredictHorizon(self):
+        dlm = builder()
+        dlm.add(trend(degree=1, discount=0.9, w=1.0))
+        dlm.add(seasonality(period=7, discount=0.95, w=1.0))
+        dlm.initialize()
+        kf = kalmanFilter(
+            discount=dlm.discount,
+            updateInnovation="component",
+            index=dlm.componentIndex,
+        )
+        np.random.seed(0)
+        for y in np.random.random(30):
+            kf.forwardFilter(dlm.model, y)
+
+        sequential = deepcopy(dlm.model)
+        sequential.prediction.step = 0
+        obs, obsVar = [], []
+        for h in range(20):
+            kf.predict(sequential)
+            obs.append(sequential.prediction.obs[0, 0])
+            obsVar.append(sequential.prediction.obsVar[0, 0])
+
+        horizonObs, horizonObsVar = kf.predictHorizon(dlm.model, 20)
+        np.testing.assert_allclose(horizonObs, obs, rtol=1e-10)
+        np.testing.assert_allclose(horizonObsVar, obsVar, rtol=1e-10)
+        np.testing.assert_allclose(
+            dlm.model.prediction.sysVar, sequential.prediction.sysVar, rtol=1e-8
+        )
+        self.assertEqual(dlm.model.prediction.step, 20)
+
+        # a shorter horizon reuses the cached rows
+        self.assertEqual(len(kf._horizonCache), 1)
+        horizonObs, horizonObsVar = kf.predictHorizon(dlm.model, 5)
+        np.testing.assert_allclose(horizonObs, obs[:5], rtol=1e-10)
+        self.assertEqual(len(kf._horizonCache), 1)
+
+    def testSensitivity(self):
+        np.random.seed(0)
+        data = list(np.random.random(40) + np.arange(40) * 0.05)
+        data[10] = None
+        data[11] = None
+
+        def filterSSE(discounts, withSensitivity):
+            dlm = builder()
+            dlm.add(trend(degree=1, discount=discounts[0], w=1.0))
+            dlm.add(seasonality(period=4, discount=discounts[1], w=1.0))
+            dlm.initialize()
+            kf = kalmanFilter(
+                discount=dlm.discount,
+                updateInnovation="component",
+                index=dlm.componentIndex,
+            )
+            sensitivity = None
+            if withSensitivity:
+                groups = [dlm.componentIndex[name] for name in ["trend", "seasonality"]]
+                sensitivity = kf.initSensitivity(dlm.model, groups)
+            sse, gradient = 0.0, np.zeros(2)
+            for y in data:
+                kf.forwardFilter(dlm.model, y, sensitivity=sensitivity)
+                if y is not None:
+                    err = y - dlm.model.prediction.obs[0, 0]
+                    sse += err**2
+                    if withSensitivity:
+                        gradient -= 2 * err * sensitivity["predObs"]
+            return sse, gradient
+
+        sse, gradient = filterSSE([0.9, 0.95], True)
+        self.assertAlmostEqual(sse, filterSSE([0.9, 0.95], False)[0])
+        for i in range(2):
+            upper, lower = [0.9, 0.95], [0.9, 0.95]
+            upper[i] += 1e-6
+            lower[i] -= 1e-6
+            finiteDifference = (
+                filterSSE(upper, False)[0] - filterSSE(lower, False)[0]
+            ) / 2e-6
+            self.assertAlmostEqual(gradient[i], finiteDifference, places=5)
+
     def testBackwardSmoother(self):
         dlm = builder()
         dlm.add(self.trend0)
@@ -93,6 +395,51 @@ class testKalmanFilter(unittest.TestCase):
 
         self.assertAlmostEqual(dlm.model.obs[0, 0], 0.0)
 
+    def testFactorizedSmoother(self):
+        np.random.seed(0)
+        factorized = kalmanFilter(discount=[0.9, 0.9, 0.95], factorizedSmoother=True)
+        pinv = kalmanFilter(discount=[0.9, 0.9, 0.95])
+        dlm = builder()
+        dlm.add(trend(degree=1, discount=0.9, w=1.0))
+        dlm.add(trend(degree=0, discount=0.95, w=1.0, name="level"))
+        dlm.initialize()
+        factorized.forwardFilter(dlm.model, 1.0)
+        factorized.forwardFilter(dlm.model, 0.5)
+        rawState = np.random.random((3, 1))
+        rawSysVar = np.random.random((3, 3))
+        rawSysVar = np.dot(rawSysVar, rawSysVar.T)
+
+        # the predicted covariance is positive definite, the factorized gain
+        # equals the generalized inverse one
+        self.assertIsNotNone(factorized._choleskyFactor(dlm.model.prediction.sysVar))
+        models = [dlm.model, deepcopy(dlm.model)]
+        factorized.backwardSmoother(models[0], rawState, rawSysVar)
+        pinv.backwardSmoother(models[1], rawState, rawSysVar)
+        np.testing.assert_allclose(models[0].state, models[1].state)
+        np.testing.assert_allclose(models[0].sysVar, models[1].sysVar)
+
+        # the gain is the same without scipy to solve with the factor
+        gain = factorized._smoothingGain(
+            dlm.model.transition, rawSysVar, dlm.model.prediction.sysVar
+        )
+        with mock.patch("pydlm.base.kalmanFilter.cho_solve", None):
+            np.testing.assert_allclose(
+                factorized._smoothingGain(
+                    dlm.model.transition, rawSysVar, dlm.model.prediction.sysVar
+                ),
+                gain,
+            )
+
+        # a rank deficient predicted covariance falls back to the generalized
+        # inverse
+        vector = np.random.random((3, 1))
+        rankDeficient = np.dot(vector, vector.T)
+        self.assertIsNone(factorized._choleskyFactor(rankDeficient))
+        np.testing.assert_allclose(
+            factorized._smoothingGain(dlm.model.transition, rawSysVar, rankDeficient),
+            pinv._smoothingGain(dlm.model.transition, rawSysVar, rankDeficient),
+        )
+
     def testMissingData(self):
         dlm = builder()
         dlm.add(self.trend0)
@@ -136,6 +483,34 @@ class testKalmanFilter(unittest.TestCase):
         self.assertAlmostEqual(dlm.model.innovation[0, 1], 0.0)
         self.assertAlmostEqual(dlm.model.innovation[1, 0], 0.0)
 
+    def testInnovation(self):
+        dlm = builder()
+        dlm.add(self.trend1)
+        dlm.add(seasonality(period=3, discount=0.9, w=1.0))
+        dlm.initialize()
+        np.random.seed(0)
+        sysVar = np.random.random(dlm.model.sysVar.shape)
+        dlm.model.prediction.sysVar = np.dot(sysVar, sysVar.T)
+        D = np.diag(1 / np.sqrt([0.8, 0.8, 0.9, 0.9, 0.9]))
+        whole = np.dot(np.dot(D, dlm.model.prediction.sysVar), D)
+        whole -= dlm.model.prediction.sysVar
+
+        kf = kalmanFilter(discount=[0.7] * 5, updateInnovation="whole")
+        kf.updateDiscount([0.8, 0.8, 0.9, 0.9, 0.9])
+        kf.__updateInnovation__(dlm.model)
+        np.testing.assert_allclose(dlm.model.innovation, whole)
+
+        kf = kalmanFilter(
+            discount=[0.8, 0.8, 0.9, 0.9, 0.9],
+            updateInnovation="component",
+            index=dlm.componentIndex,
+        )
+        kf.__updateInnovation__(dlm.model)
+        np.testing.assert_allclose(dlm.model.innovation[:2, :2], whole[:2, :2])
+        np.testing.assert_allclose(dlm.model.innovation[2:, 2:], whole[2:, 2:])
+        np.testing.assert_allclose(dlm.model.innovation[:2, 2:], 0.0)
+        np.testing.assert_allclose(dlm.model.innovation[2:, :2], 0.0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,122 @@
+import numpy as np
+import unittest
+
+from pydlm.modeler.trends import trend
+from pydlm.modeler.seasonality import seasonality
+from pydlm.modeler.dynamic import dynamic
+from pydlm.modeler.builder import builder
+from pydlm.base.parallelKalmanFilter import parallelKalmanFilter
+from pydlm.dlm import dlm
+
+
+class testParallelKalmanFilter(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(1)
+        self.n = 60
+        self.data = (
+            np.sin(np.arange(self.n) / 3.0) + np.random.random(self.n)
+        ).tolist()
+        self.data[10] = None
+        self.data[11] = None
+        self.data[40] = None
+        self.features = np.random.random((self.n, 2)).tolist()
+
+    def makeComponents(self, withSeasonality):
+        components = [
+            trend(degree=1, discount=0.95, w=1.0),
+            dynamic(features=self.features, discount=0.99, w=1.0),
+        ]
+        if withSeasonality:
+            components.append(seasonality(period=3, discount=0.98, w=1.0))
+        return components
+
+    def fitSequential(self, withSeasonality):
+        mydlm = dlm(list(self.data)).evolveMode("dependent")
+        for comp in self.makeComponents(withSeasonality):
+            mydlm + comp
+        mydlm.setLoggingLevel("CRITICAL")
+        mydlm.fit()
+        return mydlm
+
+    def fitParallel(self, withSeasonality, chunks, updateInnovation="whole"):
+        template = builder()
+        for comp in self.makeComponents(withSeasonality):
+            template + comp
+        parallelFilter = parallelKalmanFilter(
+            template, updateInnovation=updateInnovation, workers=2, chunks=chunks
+        )
+        result = parallelFilter.forwardFilter(self.data)
+        parallelFilter.backwardSmoother(result)
+        return result
+
+    def testForwardFilter(self):
+        sequential = self.fitSequential(withSeasonality=True)
+        for chunks in [1, 4, 7]:
+            result = self.fitParallel(withSeasonality=True, chunks=chunks)
+            np.testing.assert_allclose(
+                result.filteredObs, sequential.getMean(), rtol=1e-8, atol=1e-10
+            )
+            np.testing.assert_allclose(
+                result.filteredObsVar, sequential.getVar(), rtol=1e-8
+            )
+            np.testing.assert_allclose(
+                result.predictedObsVar,
+                sequential.getVar(filterType="predict"),
+                rtol=1e-8,
+            )
+            np.testing.assert_allclose(
+                result.filteredState,
+                sequential.getLatentState(),
+                rtol=1e-8,
+                atol=1e-10,
+            )
+            np.testing.assert_allclose(
+                result.noiseVar, sequential.result.noiseVar[:, 0, 0], rtol=1e-8
+            )
+            np.testing.assert_array_equal(result.df, sequential.result.df)
+
+    # the smoothing gain of the freeForm seasonality is sensitive to rounding
+    # errors, so the smoother is compared without it
+    def testBackwardSmoother(self):
+        sequential = self.fitSequential(withSeasonality=False)
+        for chunks in [1, 4, 7]:
+            result = self.fitParallel(withSeasonality=False, chunks=chunks)
+            np.testing.assert_allclose(
+                result.smoothedObs,
+                sequential.getMean(filterType="backwardSmoother"),
+                rtol=1e-8,
+                atol=1e-10,
+            )
+            np.testing.assert_allclose(
+                result.smoothedObsVar,
+                sequential.getVar(filterType="backwardSmoother"),
+                rtol=1e-8,
+            )
+            np.testing.assert_allclose(
+                result.smoothedCov,
+                sequential.getLatentCov(filterType="backwardSmoother"),
+                rtol=1e-6,
+                atol=1e-10,
+            )
+
+    def testComponentInnovation(self):
+        with self.assertRaises(ValueError):
+            self.fitParallel(
+                withSeasonality=False, chunks=3, updateInnovation="component"
+            )
+
+        # the 'component' innovation is the same as 'whole' for one component
+        template = builder() + trend(degree=1, discount=0.95, w=1.0)
+        result = parallelKalmanFilter(
+            template, updateInnovation="component", chunks=3
+        ).forwardFilter(self.data)
+        sequential = dlm(list(self.data)) + trend(degree=1, discount=0.95, w=1.0)
+        sequential.setLoggingLevel("CRITICAL")
+        sequential.fitForwardFilter()
+        np.testing.assert_allclose(
+            result.filteredObs, sequential.getMean(), rtol=1e-8, atol=1e-10
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -79,6 +79,24 @@ class test_dlm(unittest.TestCase):
         self.assertAlmostEqual(self.dlm2.result.smoothedObs[19][0, 0], 0.0)
         self.assertAlmostEqual(self.dlm2.result.smoothedObs[9][0, 0], 1.0)
 
+    def testResultAppendAndPopout(self):
+        self.dlm1._forwardFilter(start=0, end=19, renew=False)
+        filtered = self.dlm1.result.filteredObs.copy()
+        self.assertEqual(self.dlm1.result.filteredState.shape, (20, 1, 1))
+
+        # appending keeps the computed results and pads with nan
+        self.dlm1.result._appendResult(5)
+        self.assertEqual(len(self.dlm1.result.filteredObs), 25)
+        np.testing.assert_array_equal(self.dlm1.result.filteredObs[:20], filtered)
+        self.assertTrue(np.all(np.isnan(self.dlm1.result.filteredObs[20:])))
+        self.dlm1.result._appendResult(1)
+        self.assertEqual(len(self.dlm1.result.filteredCov), 26)
+
+        self.dlm1.result._popout(9)
+        self.assertEqual(len(self.dlm1.result.filteredObs), 25)
+        np.testing.assert_array_equal(self.dlm1.result.filteredObs[:9], filtered[:9])
+        np.testing.assert_array_equal(self.dlm1.result.filteredObs[9:19], filtered[10:])
+
     def testLogger(self):
         assert self.dlm1._logger == logging.getLogger("pydlm")
         assert self.dlm2._logger == logging.getLogger("pydlm")
@@ -69,6 +69,19 @@ class testBuilder(unittest.TestCase):
             0.0,
         )
 
+    def testTransitionType(self):
+        self.builder1 = self.builder1 + self.trend + self.seasonality + self.dynamic
+        self.builder1.initialize()
+        self.assertEqual(self.builder1.transitionType[self.trend.name], "trend")
+        self.assertEqual(self.builder1.transitionType[self.seasonality.name], "shift")
+        self.assertEqual(self.builder1.transitionType[self.dynamic.name], "identity")
+
+        # deleted components should not leave any stale index
+        self.builder1.delete(self.dynamic.name)
+        self.builder1.initialize()
+        self.assertFalse(self.dynamic.name in self.builder1.transitionType)
+        self.assertFalse(self.dynamic.name in self.builder1.componentIndex)
+
     def testInitializeEvaluatoin(self):
         self.builder1 = self.builder1 + self.trend + self.dynamic
         self.builder1.dynamicComponents["dynamic"].updateEvaluation(8)
@@ -1,4 +1,6 @@
 import numpy as np
+from copy import deepcopy
+import tempfile
 import unittest
 from contextlib import redirect_stdout
 from io import StringIO
@@ -242,15 +244,13 @@ class testDlm(unittest.TestCase):
         (obs, var) = self.dlm3.predict(date=11)
         self.assertAlmostEqual(obs, -6.0 / 7)
         self.assertAlmostEqual(
-            self.dlm3._predictModel.result.predictStatus, [11, 12, [-6.0 / 7]]
+            self.dlm3._predictModel.predictStatus, [11, 12, [-6.0 / 7]]
         )
 
         (obs, var) = self.dlm3.predict(date=2)
         self.assertAlmostEqual(obs, 3.0 / 5)
         # notice that the two latent states always sum up to 0
-        self.assertAlmostEqual(
-            self.dlm3._predictModel.result.predictStatus, [2, 3, [3.0 / 5]]
-        )
+        self.assertAlmostEqual(self.dlm3._predictModel.predictStatus, [2, 3, [3.0 / 5]])
 
     def testOneDayAheadPredictWithDynamic(self):
         self.dlm4.fitForwardFilter()
@@ -262,11 +262,11 @@ class testDlm(unittest.TestCase):
         self.dlm3.fitForwardFilter()
         (obs, var) = self.dlm3.predict(date=11)
         self.assertAlmostEqual(
-            self.dlm3._predictModel.result.predictStatus, [11, 12, [-6.0 / 7]]
+            self.dlm3._predictModel.predictStatus, [11, 12, [-6.0 / 7]]
         )
         (obs, var) = self.dlm3.continuePredict()
         self.assertAlmostEqual(
-            self.dlm3._predictModel.result.predictStatus, [11, 13, [-6.0 / 7, 6.0 / 7]]
+            self.dlm3._predictModel.predictStatus, [11, 13, [-6.0 / 7, 6.0 / 7]]
         )
 
     def testContinuePredictWithDynamic(self):
@@ -274,13 +274,13 @@ class testDlm(unittest.TestCase):
         featureDict = {"dynamic": [2.0]}
         (obs, var) = self.dlm4.predict(date=9, featureDict=featureDict)
         self.assertAlmostEqual(
-            self.dlm4._predictModel.result.predictStatus, [9, 10, [5.0 / 6 * 2]]
+            self.dlm4._predictModel.predictStatus, [9, 10, [5.0 / 6 * 2]]
         )
 
         featureDict = {"dynamic": [3.0]}
         (obs, var) = self.dlm4.continuePredict(featureDict=featureDict)
         self.assertAlmostEqual(
-            self.dlm4._predictModel.result.predictStatus,
+            self.dlm4._predictModel.predictStatus,
             [9, 11, [5.0 / 6 * 2, 5.0 / 6 * 3]],
         )
 
@@ -304,7 +304,7 @@ class testDlm(unittest.TestCase):
         self.dlm3.fitForwardFilter()
         (obs, var) = self.dlm3.predictN(N=2, date=11)
         self.assertAlmostEqual(
-            self.dlm3._predictModel.result.predictStatus, [11, 13, [-6.0 / 7, 6.0 / 7]]
+            self.dlm3._predictModel.predictStatus, [11, 13, [-6.0 / 7, 6.0 / 7]]
         )
 
     def testPredictNWithDynamic(self):
@@ -312,7 +312,7 @@ class testDlm(unittest.TestCase):
         featureDict = {"dynamic": [[2.0], [3.0]]}
         (obs, var) = self.dlm4.predictN(N=2, date=9, featureDict=featureDict)
         self.assertAlmostEqual(
-            self.dlm4._predictModel.result.predictStatus,
+            self.dlm4._predictModel.predictStatus,
             [9, 11, [5.0 / 6 * 2, 5.0 / 6 * 3]],
         )
 
@@ -327,10 +327,82 @@ class testDlm(unittest.TestCase):
         featureDict = {"dynamic": np.array([[2.0], [3.0]])}
         (obs, var) = self.dlm4.predictN(N=2, date=9, featureDict=featureDict)
         self.assertAlmostEqual(
-            self.dlm4._predictModel.result.predictStatus,
+            self.dlm4._predictModel.predictStatus,
             [9, 11, [5.0 / 6 * 2, 5.0 / 6 * 3]],
         )
 
+    def testPredictNWithStaticComponents(self):
+        np.random.seed(0)
+        data = list(np.random.random(50))
+        mydlm = dlm(data) + trend(degree=1, discount=0.95) + seasonality(period=7)
+        mydlm.fitForwardFilter()
+
+        obs, var = mydlm.predictN(N=30, date=40)
+        self.assertEqual(mydlm._predictModel.predictStatus[:2], [40, 70])
+        continuedObs, continuedVar = mydlm.continuePredict()
+
+        mydlm.predict(date=40)
+        for i in range(29):
+            expectedObs, expectedVar = mydlm.continuePredict()
+        self.assertAlmostEqual(obs[29], expectedObs[0, 0])
+        self.assertAlmostEqual(var[29], expectedVar[0, 0])
+        expectedObs, expectedVar = mydlm.continuePredict()
+        self.assertAlmostEqual(continuedObs[0, 0], expectedObs[0, 0])
+        self.assertAlmostEqual(continuedVar[0, 0], expectedVar[0, 0])
+
+    def testBacktest(self):
+        np.random.seed(0)
+        data = list(np.random.random(40) + np.arange(40) * 0.1)
+        data[20] = None
+        features = np.random.random((40, 2)).tolist()
+        for covRetention in ["full", "checkpoint"]:
+            mydlm = (
+                dlm(data, covRetention=covRetention)
+                + trend(degree=1, discount=0.95)
+                + seasonality(period=4, discount=0.98)
+                + dynamic(features=features, discount=0.99)
+                + autoReg(degree=2, discount=0.99)
+            )
+            mydlm.fitForwardFilter()
+            mean, var = mydlm.backtest(horizon=5, start=3)
+            self.assertEqual(mean.shape, (36, 5))
+            self.assertTrue(mean.flags["C_CONTIGUOUS"])
+
+            for i, date in enumerate(range(3, 39)):
+                N = min(5, mydlm.n - 1 - date)
+                obs, obsVar = mydlm.predictN(N=N, date=date)
+                np.testing.assert_allclose(mean[i, :N], obs, rtol=1e-10)
+                np.testing.assert_allclose(var[i, :N], obsVar, rtol=1e-10)
+                self.assertTrue(np.all(np.isnan(mean[i, N:])))
+
+    def testPredictScenarios(self):
+        np.random.seed(0)
+        data = list(np.random.random(40) + np.arange(40) * 0.1)
+        features = np.random.random((40, 2)).tolist()
+        mydlm = (
+            dlm(data)
+            + trend(degree=1, discount=0.95)
+            + dynamic(features=features, discount=0.99)
+            + autoReg(degree=2, discount=0.99)
+        )
+        mydlm.fitForwardFilter()
+
+        scenarios = [{"dynamic": np.random.random((5, 2)).tolist()} for i in range(3)]
+        mean, var = mydlm.predictScenarios(N=5, scenarios=scenarios)
+        self.assertEqual(mean.shape, (3, 5))
+        for i, scenario in enumerate(scenarios):
+            obs, obsVar = mydlm.predictN(N=5, featureDict=scenario)
+            np.testing.assert_allclose(mean[i], obs, rtol=1e-10)
+            np.testing.assert_allclose(var[i], obsVar, rtol=1e-10)
+
+        # the stored features are used within the data
+        mean, var = mydlm.predictScenarios(N=3, date=30, scenarios=[{}])
+        obs, obsVar = mydlm.predictN(N=3, date=30)
+        np.testing.assert_allclose(mean[0], obs, rtol=1e-10)
+
+        with self.assertRaises(NameError):
+            mydlm.predictScenarios(N=5, scenarios=[{}])
+
     def testPredictionNotChangeModel(self):
         timeSeries = [1, 2, 1, 5, 3, 5, 4, 8, 1, 2]
 
@@ -347,6 +419,25 @@ class testDlm(unittest.TestCase):
         self.assertAlmostEqual(obs1, obs2)
         self.assertAlmostEqual(var1, var2)
 
+    def testPredictionKeepsFeatures(self):
+        self.dlm4.fitForwardFilter()
+        features = deepcopy(self.dlm4.builder.dynamicComponents["dynamic"].features)
+        state = self.dlm4.builder.model.state.copy()
+
+        obs, var = self.dlm4.predictN(
+            N=3, date=7, featureDict={"dynamic": [[2.0], [3.0], [4.0]]}
+        )
+        np.testing.assert_allclose(obs, [3.0 / 4 * 2, 3.0 / 4 * 3, 3.0 / 4 * 4])
+        self.assertEqual(
+            self.dlm4.builder.dynamicComponents["dynamic"].features, features
+        )
+        self.assertEqual(self.dlm4.builder.dynamicComponents["dynamic"].n, 10)
+        np.testing.assert_array_equal(self.dlm4.builder.model.state, state)
+
+        # the stored features are used when featureDict is not supplied
+        obs, var = self.dlm4.predict(date=7)
+        self.assertAlmostEqual(obs[0, 0], 3.0 / 4)
+
     def testGetLatentState(self):
         # for forward filter
         self.dlm5.fitForwardFilter()
@@ -387,6 +478,294 @@ class testDlm(unittest.TestCase):
             diff += abs(smoothedTrend[i][0, 0] - self.dlm5.result.smoothedCov[i][0, 0])
         self.assertAlmostEqual(diff, 0)
 
+    def testFactorizedSmoother(self):
+        features = np.random.random((100, 3)).tolist()
+        results = []
+        for factorized in [True, False]:
+            mydlm = (
+                dlm(self.data5, factorizedSmoother=factorized)
+                + trend(degree=1, discount=0.95, w=1.0)
+                + dynamic(features=features, discount=0.98, w=1.0)
+            )
+            mydlm.fit()
+            results.append(mydlm)
+        np.testing.assert_allclose(
+            results[0].getMean(filterType="backwardSmoother"),
+            results[1].getMean(filterType="backwardSmoother"),
+        )
+        np.testing.assert_allclose(
+            results[0].getVar(filterType="backwardSmoother"),
+            results[1].getVar(filterType="backwardSmoother"),
+        )
+
+    def testCacheSmootherGain(self):
+        def _build(data, **options):
+            return (
+                dlm(data, **options)
+                + trend(degree=1, discount=0.95, w=1.0)
+                + seasonality(period=4, discount=0.98, w=1.0)
+            )
+
+        mydlm = _build(list(self.data5), cacheSmootherGain=True)
+        mydlm.fit()
+        self.assertFalse(np.isnan(mydlm.result.smootherGain[:99]).any())
+
+        # the gains of the refiltered dates are computed again
+        mydlm.append([100, 101])
+        mydlm.fitForwardFilter()
+        self.assertTrue(np.isnan(mydlm.result.smootherGain[99:]).all())
+        mydlm.popout(50)
+        mydlm.fit()
+        self.assertFalse(np.isnan(mydlm.result.smootherGain[:100]).any())
+
+        expected = _build(list(range(50)) + list(range(51, 102)))
+        expected.fit()
+        self.assertIsNone(expected.result.smootherGain)
+        np.testing.assert_allclose(
+            mydlm.getMean(filterType="backwardSmoother"),
+            expected.getMean(filterType="backwardSmoother"),
+        )
+        np.testing.assert_allclose(
+            mydlm.getVar(filterType="backwardSmoother"),
+            expected.getVar(filterType="backwardSmoother"),
+        )
+
+    def testFixedLagSmoother(self):
+        mydlm = dlm(list(self.data5)).fixedLagMode(lag=5) + trend(
+            degree=1, discount=0.9, w=1.0
+        )
+        mydlm.fit()
+        frozen = mydlm.getMean(filterType="backwardSmoother")
+
+        mydlm.append([100, 102])
+        mydlm.fit()
+        self.assertEqual(mydlm.result.smoothedSteps, [0, 101])
+        smoothed = mydlm.getMean(filterType="backwardSmoother")
+        self.assertEqual(smoothed[:97], frozen[:97])
+
+        # the last lag dates are smoothed the same as the full smoother
+        full = dlm(list(self.data5) + [100, 102]) + trend(degree=1, discount=0.9, w=1.0)
+        full.fit()
+        np.testing.assert_allclose(
+            smoothed[97:], full.getMean(filterType="backwardSmoother")[97:]
+        )
+
+    def testSampleLatentState(self):
+        mydlm = (
+            dlm(self.data5)
+            + trend(degree=1, discount=0.9, w=1.0, name="trend")
+            + seasonality(period=4, discount=0.98, w=1.0)
+        )
+        mydlm.fit()
+        samples = mydlm.sampleLatentState(size=2000, seed=1)
+        self.assertEqual(samples.shape, (2000, 100, 6))
+        np.testing.assert_array_equal(
+            mydlm.sampleLatentState(size=3, name="trend", seed=2),
+            mydlm.sampleLatentState(
+                size=3, name="trend", seed=np.random.default_rng(2)
+            ),
+        )
+
+        # the paths are drawn from the smoothed distribution
+        mean = np.array(mydlm.getLatentState(filterType="backwardSmoother"))
+        var = np.diagonal(
+            mydlm.getLatentCov(filterType="backwardSmoother"), axis1=1, axis2=2
+        )
+        self.assertTrue(
+            (np.abs(samples.mean(axis=0) - mean) < 5 * np.sqrt(var / 2000)).all()
+        )
+        np.testing.assert_allclose(samples.var(axis=0), var, rtol=0.2, atol=1e-8)
+
+    def testParallelWorkers(self):
+        data = list(self.data5)
+        data[30] = None
+        features = np.random.random((100, 2)).tolist()
+        results = []
+        for workers in [None, 3]:
+            mydlm = (
+                dlm(list(data), workers=workers).evolveMode("dependent")
+                + trend(degree=1, discount=0.95, w=1.0)
+                + dynamic(features=features, discount=0.99, w=1.0)
+            )
+            mydlm.fit()
+            results.append(mydlm)
+        for filterType in ["forwardFilter", "backwardSmoother", "predict"]:
+            np.testing.assert_allclose(
+                results[1].getMean(filterType=filterType),
+                results[0].getMean(filterType=filterType),
+            )
+            np.testing.assert_allclose(
+                results[1].getVar(filterType=filterType),
+                results[0].getVar(filterType=filterType),
+            )
+        for name, value in results[0].getOneStepLoss().items():
+            self.assertAlmostEqual(results[1].getOneStepLoss()[name], value)
+
+        # the appended dates are filtered sequentially from the last date
+        for mydlm in results:
+            mydlm.append([100, 101])
+            mydlm.append([[0, 0], [1, 1]], component="dynamic")
+            mydlm.fitForwardFilter()
+        np.testing.assert_allclose(results[1].getMean(), results[0].getMean())
+
+    def testParallelWorkersFallBack(self):
+        # the default 'component' innovation of several discounted components
+        # and autoReg with missing data are filtered sequentially with a
+        # warning
+        data = list(self.data5)
+        data[30] = None
+        for components in [
+            [trend(degree=1, w=1.0), seasonality(period=4, w=1.0)],
+            [trend(degree=0, w=1.0), autoReg(degree=2, w=1.0)],
+        ]:
+            results = []
+            for workers in [None, 2]:
+                mydlm = dlm(list(data), workers=workers)
+                for comp in deepcopy(components):
+                    mydlm + comp
+                if workers is None:
+                    mydlm.fit()
+                else:
+                    with self.assertLogs("pydlm", level="WARNING"):
+                        mydlm.fit()
+                results.append(mydlm)
+            for filterType in ["forwardFilter", "backwardSmoother"]:
+                np.testing.assert_allclose(
+                    results[1].getMean(filterType=filterType),
+                    results[0].getMean(filterType=filterType),
+                )
+
+    def testCovRetention(self):
+        full = dlm(self.data5, covRetention="full") + trend(degree=1, w=1.0)
+        full.fit()
+        for level in ["smoother", "diagonal", "none"]:
+            mydlm = dlm(self.data5, covRetention=level) + trend(degree=1, w=1.0)
+            mydlm.fit()
+            self.assertEqual(mydlm.getMean(), full.getMean())
+            self.assertEqual(mydlm.getVar(), full.getVar())
+            if level == "smoother":
+                self.assertEqual(
+                    mydlm.getMean(filterType="backwardSmoother"),
+                    full.getMean(filterType="backwardSmoother"),
+                )
+                self.assertEqual(
+                    mydlm.getVar(name="trend"), full.getVar(name="trend")
+                )
+            else:
+                self.assertEqual(mydlm.result.smoothedSteps, [0, -1])
+                with self.assertRaises(ValueError):
+                    mydlm.fitBackwardSmoother()
+                with self.assertRaises(ValueError):
+                    mydlm.getVar(name="trend")
+            if level == "diagonal":
+                np.testing.assert_allclose(
+                    mydlm.getLatentCov(),
+                    np.diagonal(full.getLatentCov(), axis1=1, axis2=2),
+                )
+
+            # the filter continues from the last date after appending
+            mydlm.append([100, 101])
+            mydlm.fitForwardFilter()
+            self.assertEqual(len(mydlm.getMean()), 102)
+
+    def testCheckpointSmoother(self):
+        data = np.sin(np.arange(60) / 3.0).tolist()
+        # the segments from 35 start on a missing date
+        for date in [20, 35, 36]:
+            data[date] = None
+        features = np.random.random((60, 1)).tolist()
+
+        def _build(**options):
+            return (
+                dlm(list(data), **options)
+                + trend(degree=1, discount=0.95, w=1.0)
+                + seasonality(period=7, discount=0.98, w=1.0)
+                + dynamic(features=features, discount=0.99, w=1.0)
+            )
+
+        full = _build()
+        full.fit()
+        for interval in [None, 1, 5, 7, 100]:
+            mydlm = _build(covRetention="checkpoint", checkpointInterval=interval)
+            mydlm.fit()
+            self.assertEqual(mydlm.result.filteredCov.ndim, 2)
+            np.testing.assert_allclose(
+                mydlm.getMean(filterType="backwardSmoother"),
+                full.getMean(filterType="backwardSmoother"),
+            )
+            np.testing.assert_allclose(
+                mydlm.getVar(filterType="backwardSmoother"),
+                full.getVar(filterType="backwardSmoother"),
+            )
+            np.testing.assert_allclose(
+                mydlm.getLatentCov(filterType="backwardSmoother"),
+                np.diagonal(
+                    full.getLatentCov(filterType="backwardSmoother"),
+                    axis1=1,
+                    axis2=2,
+                ),
+            )
+
+    def testSteadyState(self):
+        np.random.seed(0)
+        t = np.arange(1500)
+        data = list(
+            0.01 * t + np.sin(2 * np.pi * t / 7) + np.random.normal(0, 0.3, 1500)
+        )
+        means = []
+        for steadyState in [False, True]:
+            mydlm = dlm(data, steadyState=steadyState, steadyStateTol=1e-7)
+            mydlm = mydlm + trend(degree=1, discount=0.98, w=1.0)
+            mydlm = mydlm + seasonality(period=7, discount=0.99, w=1.0)
+            mydlm.fitForwardFilter()
+            means.append(mydlm.getMean(filterType="forwardFilter"))
+        self.assertEqual(mydlm.Filter.steadyStateTol, 1e-7)
+        self.assertIsNotNone(mydlm.Filter._steady)
+        np.testing.assert_allclose(means[1], means[0], rtol=1e-8)
+
+    def testResultDir(self):
+        memory = dlm(self.data5) + trend(degree=1, w=1.0)
+        memory.fit()
+        with tempfile.TemporaryDirectory() as directory:
+            mydlm = dlm(self.data5, resultDir=directory) + trend(degree=1, w=1.0)
+            mydlm.fit()
+            self.assertIsInstance(mydlm.result.filteredCov, np.memmap)
+            self.assertEqual(mydlm.getMean(), memory.getMean())
+            self.assertEqual(
+                mydlm.getVar(filterType="backwardSmoother", name="trend"),
+                memory.getVar(filterType="backwardSmoother", name="trend"),
+            )
+
+            # reopen the result without refitting
+            reopened = dlm(self.data5, resultDir=directory) + trend(degree=1, w=1.0)
+            reopened.loadResult()
+            self.assertEqual(reopened.result.filteredSteps, [0, 99])
+            self.assertEqual(
+                reopened.getMean(filterType="backwardSmoother"),
+                memory.getMean(filterType="backwardSmoother"),
+            )
+            self.assertEqual(reopened.predictN(N=2), memory.predictN(N=2))
+
+            # the filter continues on the reopened result
+            reopened.append([100, 101])
+            reopened.fitForwardFilter()
+            memory.append([100, 101])
+            memory.fitForwardFilter()
+            self.assertEqual(reopened.getMean(), memory.getMean())
+
+            # a result that does not match leaves the dlm untouched
+            other = dlm(self.data5) + trend(degree=2, w=1.0)
+            with self.assertRaises(ValueError):
+                other.loadResult(directory)
+            self.assertFalse(other.initialized)
+
+            other.fit()
+            fitted = other.result
+            with self.assertRaises(ValueError):
+                other.loadResult(directory)
+            self.assertIs(other.result, fitted)
+            self.assertIsNone(other.options.resultDir)
+
     def testGetMean(self):
         # for forward filter
         self.dlm5.fitForwardFilter()
@@ -493,6 +872,39 @@ class testDlm(unittest.TestCase):
 
         self.assertAlmostEqual(mse2, mse_expect)
 
+    def testGetMSEWithMissingData(self):
+        data = np.sin(np.arange(30) / 3.0).tolist()
+        data[5] = None
+        data[17] = None
+        mydlm = dlm(data) + trend(degree=1, discount=0.95, w=1.0)
+        mydlm.fitForwardFilter()
+        predictedObs = mydlm.getMean(filterType="predict")
+        sse = sum(
+            (y - predictedObs[i]) ** 2 for i, y in enumerate(data) if y is not None
+        )
+        # the missing dates count in the number of dates but not in the errors
+        self.assertAlmostEqual(mydlm.getMSE(), sse / 30)
+        self.assertAlmostEqual(mydlm.getOneStepLoss()["mse"], sse / 30)
+        self.assertEqual(mydlm.getOneStepLoss()["n"], 28)
+
+    def testGetMSEAfterAlterAndPopout(self):
+        data = np.sin(np.arange(30) / 3.0).tolist()
+        data[5] = None
+        for date, change in [(20, "alter"), (15, "popout")]:
+            mydlm = dlm(data) + trend(degree=1, discount=0.95, w=1.0)
+            mydlm.fitForwardFilter()
+            if change == "alter":
+                mydlm.alter(date=date, data=3.0, component="main")
+            else:
+                mydlm.popout(date)
+            # only the dates still filtered count in the losses
+            head = dlm(data[:date]) + trend(degree=1, discount=0.95, w=1.0)
+            head.fitForwardFilter()
+            self.assertAlmostEqual(mydlm.getMSE(), head.getMSE())
+            loss = mydlm.getOneStepLoss()
+            for name, value in head.getOneStepLoss().items():
+                self.assertAlmostEqual(loss[name], value)
+
     def testGetResidual(self):
         # for forward filter
         filter_type = "forwardFilter"
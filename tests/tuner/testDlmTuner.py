@@ -1,11 +1,20 @@
 import unittest
 import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from copy import deepcopy
+from unittest import mock
 from pydlm.tuner.dlmTuner import modelTuner
+import pydlm.tuner.dlmTuner as dlmTuner
 from pydlm.modeler.trends import trend
+from pydlm.modeler.seasonality import seasonality
 from pydlm.dlm import dlm
 
+try:
+    import scipy
+except ImportError:
+    scipy = None
+
 
 class testModelTuner(unittest.TestCase):
     def setUp(self):
@@ -28,6 +37,127 @@ class testModelTuner(unittest.TestCase):
             self.mytuner.find_gradient(self.mydlm._getDiscounts(), self.mydlm),
         )
 
+    def testAnalyticTune(self):
+        data = list(np.sin(np.arange(100) / 3.0) + np.random.random(100))
+        mydlm = (
+            dlm(data)
+            + trend(1, discount=0.98, w=1.0)
+            + seasonality(6, discount=0.98, w=1.0)
+        )
+        mydlm.fitForwardFilter()
+        mse0 = mydlm._getMSE()
+        tuner = modelTuner(gradient="analytic")
+        tunedDLM = tuner.tune(mydlm, maxit=20)
+        tunedDLM.fitForwardFilter()
+        self.assertAlmostEqual(tuner.current_mse, tunedDLM._getMSE())
+        self.assertLess(tuner.current_mse, mse0)
+
+    def makeSeasonalDLM(self):
+        data = list(np.sin(np.arange(100) / 3.0) + np.random.random(100))
+        mydlm = (
+            dlm(data)
+            + trend(1, discount=0.98, w=1.0)
+            + seasonality(6, discount=0.98, w=1.0)
+        )
+        mydlm.setLoggingLevel("CRITICAL")
+        return mydlm
+
+    def testTuneStopsEarly(self):
+        mydlm = self.makeSeasonalDLM()
+        mydlm.fitForwardFilter()
+        tuner = modelTuner(gradient="analytic")
+        # the line search evaluates the trial points with the analytic
+        # gradient pass, only the tuned model is fitted at the end
+        with mock.patch.object(
+            dlm, "fitForwardFilter", autospec=True, side_effect=dlm.fitForwardFilter
+        ) as fit:
+            tuner.tune(mydlm, maxit=100)
+        self.assertEqual(fit.call_count, 1)
+        self.assertTrue(tuner.converged)
+        self.assertLess(tuner.iterations, 100)
+
+        # the first gradient already uses up the budget
+        tuner = modelTuner()
+        tuner.tune(mydlm, maxit=100, maxfev=1)
+        self.assertFalse(tuner.converged)
+        self.assertEqual(tuner.iterations, 0)
+
+    def testLogLikelihoodTune(self):
+        mydlm = self.makeSeasonalDLM()
+        mydlm.fitForwardFilter()
+        logLikelihood0 = mydlm.getOneStepLoss()["loglikelihood"]
+        tuner = modelTuner(loss="loglikelihood")
+        tunedDLM = tuner.tune(mydlm, maxit=20)
+        tunedDLM.fitForwardFilter()
+        loss = tunedDLM.getOneStepLoss()
+        self.assertAlmostEqual(tuner.current_mse, -loss["loglikelihood"] / loss["n"])
+        self.assertGreater(loss["loglikelihood"], logLikelihood0)
+
+        with self.assertRaises(NameError):
+            modelTuner(loss="loglikelihood", gradient="analytic").tune(mydlm)
+
+    @unittest.skipIf(scipy is None, "scipy is not installed")
+    def testLbfgsb(self):
+        mydlm = self.makeSeasonalDLM()
+        mydlm.fitForwardFilter()
+        mse0 = mydlm._getMSE()
+        tuner = modelTuner(method="l-bfgs-b", gradient="analytic")
+        tunedDLM = tuner.tune(mydlm, maxit=20)
+        tunedDLM.fitForwardFilter()
+        self.assertAlmostEqual(tuner.current_mse, tunedDLM._getMSE())
+        self.assertLess(tuner.current_mse, mse0)
+
+    def testSearch(self):
+        self.mydlm.fitForwardFilter()
+        candidates = [[0.9], [0.95], [0.99]]
+        tunedDLM = self.mytuner.search(self.mydlm, candidates)
+        self.assertEqual(len(self.mytuner.losses), 3)
+        best = int(np.argmin(self.mytuner.losses))
+        self.assertEqual(list(self.mytuner.getDiscounts()), candidates[best])
+        tunedDLM.fitForwardFilter()
+        self.assertAlmostEqual(tunedDLM._getMSE(), self.mytuner.losses[best])
+
+    def testExecutor(self):
+        data = list(np.sin(np.arange(60) / 3.0) + np.random.random(60))
+        data[10] = None
+        mydlm = (
+            dlm(data)
+            + trend(1, discount=0.98, w=1.0)
+            + seasonality(6, discount=0.95, w=1.0)
+        )
+        mydlm.fitForwardFilter()
+        discounts = mydlm._getDiscounts()
+        candidates = [[0.9, 0.95], [0.95, 0.99], [0.99, 0.9]]
+        serialTuner = modelTuner()
+        serialTuner.current_mse = mydlm._getMSE()
+        serialGradient = serialTuner.find_gradient(discounts, deepcopy(mydlm))
+        serialSearch = serialTuner.search(deepcopy(mydlm), candidates)
+        with ProcessPoolExecutor(2) as executor:
+            parallelTuner = modelTuner(executor=executor)
+            parallelTuner.current_mse = mydlm._getMSE()
+            np.testing.assert_allclose(
+                parallelTuner.find_gradient(discounts, mydlm), serialGradient
+            )
+            parallelSearch = parallelTuner.search(mydlm, candidates)
+        np.testing.assert_allclose(parallelTuner.losses, serialTuner.losses)
+        self.assertEqual(
+            list(parallelSearch._getDiscounts()), list(serialSearch._getDiscounts())
+        )
+
+    def testSearchChunks(self):
+        self.mydlm.fitForwardFilter()
+        candidates = [[0.8 + 0.01 * i] for i in range(10)]
+        with mock.patch.object(
+            dlmTuner, "_evaluateDiscounts", wraps=dlmTuner._evaluateDiscounts
+        ) as evaluate:
+            # one chunk for each worker
+            with ThreadPoolExecutor(2) as executor:
+                modelTuner(executor=executor, workers=2).search(self.mydlm, candidates)
+            self.assertEqual(evaluate.call_count, 2)
+            with ThreadPoolExecutor(2) as executor:
+                modelTuner(executor=executor).search(self.mydlm, candidates, chunks=5)
+            self.assertEqual(evaluate.call_count, 7)
+
 
 if __name__ == "__main__":
     unittest.main()
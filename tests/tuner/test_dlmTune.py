@@ -1,3 +1,5 @@
+import math
+import numpy as np
 import unittest
 
 from pydlm.modeler.trends import trend
@@ -61,6 +63,92 @@ class test_dlmTune(unittest.TestCase):
         mse_expect /= 7
         self.assertAlmostEqual(mse3, mse_expect)
 
+    def testGetMSEGradient(self):
+        data = [np.sin(i / 3.0) + 0.1 * i + np.cos(i) for i in range(40)]
+        mydlm = _dlmTune(data)
+        (
+            mydlm.builder
+            + trend(degree=1, discount=0.95, w=1.0)
+            + seasonality(period=4, discount=0.9, w=1.0)
+            + autoReg(degree=2, discount=0.98, w=1.0)
+        )
+        mydlm._initialize()
+        mydlm.options.innovationType = "component"
+
+        mydlm._forwardFilter(start=0, end=39, renew=False)
+        mydlm.result.filteredSteps = (0, 39)
+        expectedMSE = mydlm._getMSE()
+        mse, gradient = mydlm._getMSEGradient()
+        self.assertAlmostEqual(mse, expectedMSE)
+
+        discounts = mydlm._getDiscounts()
+        for i in range(len(discounts)):
+            mses = []
+            for delta in [1e-6, -1e-6]:
+                perturbed = list(discounts)
+                perturbed[i] += delta
+                mydlm._setDiscounts(perturbed)
+                mydlm._forwardFilter(start=0, end=39, renew=False)
+                mydlm.result.filteredSteps = (0, 39)
+                mses.append(mydlm._getMSE())
+            self.assertAlmostEqual(
+                gradient[i],
+                (mses[0] - mses[1]) / 2e-6,
+                delta=1e-5 * abs(gradient[i]) + 1e-7,
+            )
+        mydlm._setDiscounts(discounts)
+
+    def testEvaluateDiscounts(self):
+        self.dlm6._forwardFilter(start=0, end=99, renew=False)
+        self.dlm6.result.filteredSteps = (0, 99)
+        candidates = [[0.9, 0.8, 1.0], [0.95, 0.9, 0.99], [0.8, 0.99, 0.9]]
+        mses = self.dlm6._evaluateDiscounts(candidates)
+        logLikelihoods = self.dlm6._evaluateDiscounts(candidates, loss="loglikelihood")
+        self.assertEqual(mses.shape, (3,))
+        self.assertEqual(logLikelihoods.shape, (3,))
+
+        for i, discounts in enumerate(candidates):
+            self.dlm6._setDiscounts(discounts)
+            self.dlm6._forwardFilter(start=0, end=99, renew=False)
+            self.dlm6.result.filteredSteps = (0, 99)
+            self.assertAlmostEqual(mses[i], self.dlm6._getMSE())
+            self.assertAlmostEqual(
+                logLikelihoods[i], self.dlm6._getOneStepLoss()["loglikelihood"]
+            )
+
+    def testGetOneStepLoss(self):
+        self.dlm7._forwardFilter(start=0, end=6, renew=False)
+        self.dlm7.result.filteredSteps = (0, 6)
+        result = self.dlm7.result
+        logLikelihood, sse, sae = 0.0, 0.0, 0.0
+        for i, y in enumerate([0, 1, None, 1, 0, 1, -1]):
+            if y is None:
+                continue
+            err = y - result.predictedObs[i, 0, 0]
+            var = result.predictedObsVar[i, 0, 0]
+            df = result.df[i] - 1
+            logLikelihood += (
+                math.lgamma((df + 1) / 2)
+                - math.lgamma(df / 2)
+                - 0.5 * math.log(df * math.pi * var)
+                - (df + 1) / 2 * math.log(1 + err**2 / df / var)
+            )
+            sse += err**2
+            sae += abs(err)
+        loss = self.dlm7._getOneStepLoss()
+        # the mse and the mae count the missing date as _getMSE does
+        self.assertEqual(loss["n"], 6)
+        self.assertAlmostEqual(loss["loglikelihood"], logLikelihood)
+        self.assertAlmostEqual(loss["mse"], sse / 7)
+        self.assertAlmostEqual(loss["mae"], sae / 7)
+        self.assertAlmostEqual(loss["mse"], self.dlm7._getMSE())
+
+        # refiltering the dates does not count them twice
+        self.dlm7._forwardFilter(start=3, end=6, renew=False)
+        self.assertAlmostEqual(
+            self.dlm7._getOneStepLoss()["loglikelihood"], logLikelihood
+        )
+
     def testGetDiscount(self):
         discounts = self.dlm6._getDiscounts()
         self.assertTrue(0.9 in discounts)